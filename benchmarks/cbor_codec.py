@@ -0,0 +1,96 @@
+"""
+Decode/encode microbenchmark of the CBOR documents of the ingest store.
+
+Read all the ingested documents (of the given kinds) from the store, then
+measure the throughput of:
+
+- ``decode``: `take2.encoder.decode`, with the per-tag precomputed
+  constructors,
+- ``decode-generic``: decoding with a tag hook building each node through its
+  ``__init__``, as papyri used to,
+- ``encode``: `take2.encoder.encode` of the decoded documents.
+
+Usage::
+
+    $ papyri ingest ...  # or papyri relink
+    $ python benchmarks/cbor_codec.py [--kind module] [--repeat 5]
+
+"""
+import argparse
+import time
+
+import cbor2
+
+import papyri.crosslink  # noqa: F401, register the IngestedBlobs tag
+from papyri.common_ast import REV_TAG_MAP
+from papyri.config import ingest_dir
+from papyri.graphstore import GraphStore
+from papyri.miniserde import get_type_hints
+from papyri.take2 import encoder
+
+
+def generic_tag_hook(decoder, tag, shareable_index=None):
+    type_ = REV_TAG_MAP[tag.tag]
+    tt = get_type_hints(type_)
+    return type_(**dict(zip(tt, tag.value)))
+
+
+def count_nodes(data):
+    count = [0]
+
+    def hook(decoder, tag, shareable_index=None):
+        count[0] += 1
+        return encoder._tag_hook(decoder, tag)
+
+    cbor2.loads(data, tag_hook=hook)
+    return count[0]
+
+
+def bench(name, fn, items, repeat, nbytes, nnodes):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - t0)
+    print(
+        f"{name:15} {best * 1e3:8.1f} ms  {nbytes / best / 1e6:7.1f} MB/s"
+        f"  {nnodes / best / 1e3:8.1f} knodes/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--kind", action="append", help="kinds of documents (default: module, docs)"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    store = GraphStore(ingest_dir)
+    blobs = [
+        store.get(key)
+        for kind in args.kind or ["module", "docs"]
+        for key in store.glob((None, None, kind, None))
+    ]
+    if not blobs:
+        raise SystemExit(f"No document in {ingest_dir}, ingest something first.")
+    nbytes = sum(len(b) for b in blobs)
+    nnodes = sum(count_nodes(b) for b in blobs)
+    print(f"{len(blobs)} documents, {nbytes / 1e6:.1f} MB, {nnodes} nodes")
+
+    bench("decode", encoder.decode, blobs, args.repeat, nbytes, nnodes)
+    bench(
+        "decode-generic",
+        lambda b: cbor2.loads(b, tag_hook=generic_tag_hook),
+        blobs,
+        args.repeat,
+        nbytes,
+        nnodes,
+    )
+    docs = [encoder.decode(b) for b in blobs]
+    bench("encode", encoder.encode, docs, args.repeat, nbytes, nnodes)
+
+
+if __name__ == "__main__":
+    main()
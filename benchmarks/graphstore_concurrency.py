@@ -0,0 +1,86 @@
+"""
+Concurrency benchmark for the GraphStore.
+
+Populate a temporary store with synthetic documents and links, then measure
+read throughput (``get_all``: document bytes, backrefs and forward refs) for
+an increasing number of reader threads, while a writer thread keeps
+re-ingesting documents.
+
+Usage::
+
+    $ python benchmarks/graphstore_concurrency.py [--docs 5000] [--seconds 3]
+
+"""
+import argparse
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from papyri.graphstore import GraphStore, Key
+
+
+def populate(store, ndocs, nlinks):
+    keys = [
+        Key("bench", "1.0", "module", f"bench.mod{i // 100}.f{i}") for i in range(ndocs)
+    ]
+    rng = random.Random(0)
+    for k in keys:
+        store.put(k, k.path.encode() * 50, rng.sample(keys, nlinks))
+    return keys
+
+
+def run(store, keys, nreaders, seconds, nlinks):
+    stop = threading.Event()
+    counts = [0] * nreaders
+    writes = [0]
+
+    def reader(i):
+        rng = random.Random(i)
+        while not stop.is_set():
+            store.get_all(rng.choice(keys))
+            counts[i] += 1
+
+    def writer():
+        rng = random.Random(-1)
+        while not stop.is_set():
+            k = rng.choice(keys)
+            store.put(k, k.path.encode() * 50, rng.sample(keys, nlinks))
+            writes[0] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(nreaders)]
+    threads.append(threading.Thread(target=writer))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return sum(counts) / seconds, writes[0] / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--links", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--storage", choices=["files", "pack"], default="files")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        store = GraphStore(Path(d), storage=args.storage)
+        t0 = time.perf_counter()
+        keys = populate(store, args.docs, args.links)
+        print(f"populated {args.docs} documents in {time.perf_counter() - t0:.2f}s")
+        for nreaders in (1, 2, 4, 8, 16):
+            reads, writes = run(store, keys, nreaders, args.seconds, args.links)
+            print(
+                f"{nreaders:3d} readers: {reads:10.0f} reads/s, "
+                f"{writes:8.0f} writes/s during reads"
+            )
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
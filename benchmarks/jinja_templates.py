@@ -0,0 +1,121 @@
+"""
+Benchmark of the Jinja template loading strategies of the html renderer.
+
+Measure, each in a fresh process, the time to create the html environment and
+load all the page templates:
+
+- ``source``: templates compiled from source (``--dev``),
+- ``bytecode``: templates loaded from the on-disk bytecode cache,
+- ``precompiled``: templates precompiled to python modules.
+
+Then the time per page, with and without auto reload of the templates, of
+``get_template`` alone and, if some documentation has been ingested, of a full
+render of API pages.
+
+Usage::
+
+    $ python benchmarks/jinja_templates.py [--repeat 5] [--pages 50]
+
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PAGES = [
+    "html.tpl.j2",
+    "examples.tpl.j2",
+    "gallery.tpl.j2",
+    "index.tpl.j2",
+    "toctree.tpl.j2",
+    "404.tpl.j2",
+]
+
+
+def cold(mode, compiled):
+    from papyri.render import _html_env
+
+    t0 = time.perf_counter()
+    env = _html_env(
+        dev=mode == "source",
+        compiled=Path(compiled) if mode == "precompiled" else None,
+    )
+    for name in PAGES:
+        env.get_template(name)
+    print(time.perf_counter() - t0)
+
+
+def run_cold(mode, compiled, repeat):
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, __file__, "--cold", mode, "--compiled", compiled],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        times.append(float(out.split()[-1]))
+    return min(times)
+
+
+def per_page(npages):
+    import trio
+
+    from papyri.config import ingest_dir
+    from papyri.graphstore import GraphStore
+    from papyri.render import HtmlRenderer
+
+    store = GraphStore(ingest_dir)
+    keys = store.glob((None, None, "module", None))[:npages]
+    for dev in [True, False]:
+        renderer = HtmlRenderer(
+            store, sidebar=True, prefix="/p/", trailing_html=False, dev=dev
+        )
+        renderer.env.get_template("html.tpl.j2")
+        n = 2000
+        t0 = time.perf_counter()
+        for _ in range(n):
+            renderer.env.get_template("html.tpl.j2")
+        get = (time.perf_counter() - t0) / n
+        line = f"auto_reload={dev!s:5}  get_template {get * 1e6:6.1f} µs"
+
+        if keys:
+
+            async def render():
+                for key in keys:
+                    await renderer._route(key.path, key.version)
+
+            t0 = time.perf_counter()
+            trio.run(render)
+            page = (time.perf_counter() - t0) / len(keys)
+            line += f"  page {page * 1e3:6.2f} ms ({len(keys)} pages)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--cold", help=argparse.SUPPRESS)
+    parser.add_argument("--compiled", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.cold:
+        cold(args.cold, args.compiled)
+        return
+
+    from papyri.render import compile_templates
+
+    with tempfile.TemporaryDirectory() as compiled:
+        compile_templates(Path(compiled))
+        # make sure the bytecode cache is populated.
+        run_cold("bytecode", compiled, 1)
+        for mode in ["source", "bytecode", "precompiled"]:
+            t = run_cold(mode, compiled, args.repeat)
+            print(f"cold start {mode:12} {t * 1e3:7.1f} ms")
+    per_page(args.pages)
+
+
+if __name__ == "__main__":
+    main()
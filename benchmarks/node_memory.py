@@ -0,0 +1,88 @@
+"""
+Memory used by the decoded documents of the ingest store.
+
+Decode all the ingested documents (of the given kinds) and keep them alive,
+then report the memory allocated for them (measured with `tracemalloc`), per
+document and per node, as well as the number of nodes and the shallow size of
+an instance of the most common node types.
+
+Usage::
+
+    $ papyri ingest ...  # or papyri relink
+    $ python benchmarks/node_memory.py [--kind module] [--top 10]
+
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+from collections import Counter
+
+import cbor2
+
+import papyri.crosslink  # noqa: F401, register the IngestedBlobs tag
+from papyri.config import ingest_dir
+from papyri.graphstore import GraphStore
+from papyri.take2 import encoder
+
+
+def shallow_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--kind", action="append", help="kinds of documents (default: module, docs)"
+    )
+    parser.add_argument("--top", type=int, default=10, help="node types to list")
+    args = parser.parse_args()
+
+    store = GraphStore(ingest_dir)
+    blobs = [
+        store.get(key)
+        for kind in args.kind or ["module", "docs"]
+        for key in store.glob((None, None, kind, None))
+    ]
+    if not blobs:
+        raise SystemExit(f"No document in {ingest_dir}, ingest something first.")
+
+    counts: Counter = Counter()
+    sizes = {}
+
+    def hook(decoder, tag, shareable_index=None):
+        node = encoder._tag_hook(decoder, tag)
+        counts[type(node)] += 1
+        sizes.setdefault(type(node), shallow_size(node))
+        return node
+
+    for b in blobs:
+        cbor2.loads(b, tag_hook=hook)
+    nnodes = sum(counts.values())
+
+    gc.collect()
+    tracemalloc.start()
+    docs = [encoder.decode(b) for b in blobs]
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(docs) == len(blobs)
+
+    print(
+        f"{len(docs)} documents, {sum(len(b) for b in blobs) / 1e6:.1f} MB "
+        f"of CBOR, {nnodes} nodes"
+    )
+    print(f"decoded   {current / 1e6:8.2f} MB  (peak {peak / 1e6:.2f} MB)")
+    print(f"per doc   {current / len(docs) / 1e3:8.2f} kB")
+    print(f"per node  {current / nnodes:8.1f} B")
+    print()
+    print(f"{'type':24} {'count':>8} {'instance':>9}")
+    for type_, count in counts.most_common(args.top):
+        print(f"{type_.__name__:24} {count:8} {sizes[type_]:8} B")
+
+
+if __name__ == "__main__":
+    main()
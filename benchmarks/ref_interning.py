@@ -0,0 +1,56 @@
+"""
+Memory of a set of references read from the database, with and without
+interning.
+
+Build the frozenset of RefInfo of ``find_all_refs`` for ``--refs`` synthetic
+rows read from an in memory sqlite database, like the rows of
+``GraphStore.iglob``, once with ``RefInfo(...)`` and once with
+``RefInfo.interned(...)``, and report the memory held by each set, the
+interning pools included, as measured by tracemalloc.
+
+Usage::
+
+    $ python benchmarks/ref_interning.py [--refs 300000] [--modules 20]
+
+"""
+import argparse
+import sqlite3
+import tracemalloc
+
+from papyri.take2 import RefInfo
+
+
+def rows(conn):
+    return conn.execute("SELECT package, version, category, identifier FROM docs")
+
+
+def measure(name, make, conn, n):
+    tracemalloc.start()
+    refs = frozenset(make(*row) for row in rows(conn))
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(refs) == n
+    print(f"{name:10} {size / 1e6:8.1f} MB  {size / n:6.0f} B/ref")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--refs", type=int, default=300_000)
+    parser.add_argument("--modules", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE docs(package, version, category, identifier)")
+    conn.executemany(
+        "INSERT INTO docs VALUES (?, ?, ?, ?)",
+        (
+            (f"mod{i % args.modules}", "1.26.4", "module", f"mod.sub.obj_{i}")
+            for i in range(args.refs)
+        ),
+    )
+    measure("plain", RefInfo, conn, args.refs)
+    measure("interned", RefInfo.interned, conn, args.refs)
+
+
+if __name__ == "__main__":
+    main()
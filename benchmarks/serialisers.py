@@ -0,0 +1,65 @@
+"""
+Benchmark of the json (de)serialisation of the DocBlobs of a bundle.
+
+Load the largest DocBlobs of a bundle generated by ``papyri gen``, and measure
+the time per blob of:
+
+- ``from_dict``: `miniserde.deserialize`, as at ingest
+  (`crosslink.load_one_uningested`),
+- ``to_dict``: `myst_serialiser.serialize`, as when writing the bundle
+  (`Gen.write_api`), without the json encoding,
+- ``to_json``: the above plus the json encoding,
+- ``miniserde``: `miniserde.serialize`.
+
+Usage::
+
+    $ papyri gen examples/papyri.toml
+    $ python benchmarks/serialisers.py ~/.papyri/data/papyri_0.0.8 [--largest 50]
+
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from papyri.gen import DocBlob
+from papyri.miniserde import serialize
+
+
+def bench(name, fn, items, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - t0)
+    print(f"{name:10} {best * 1e3:8.1f} ms  {best / len(items) * 1e6:8.1f} µs/blob")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("bundle", type=Path, help="bundle directory")
+    parser.add_argument(
+        "--largest", type=int, default=50, help="number of blobs, largest first"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    files = sorted(
+        (args.bundle / "module").glob("*.json"), key=lambda f: -f.stat().st_size
+    )[: args.largest]
+    if not files:
+        raise SystemExit(f"No DocBlob in {args.bundle}, run papyri gen first.")
+    datas = [json.loads(f.read_bytes()) for f in files]
+    blobs = [DocBlob.from_dict(d) for d in datas]
+    nbytes = sum(f.stat().st_size for f in files)
+    print(f"{len(blobs)} blobs, {nbytes / 1e3:.0f} kB of json")
+
+    bench("from_dict", DocBlob.from_dict, datas, args.repeat)
+    bench("to_dict", DocBlob.to_dict, blobs, args.repeat)
+    bench("to_json", DocBlob.to_json, blobs, args.repeat)
+    bench("miniserde", lambda b: serialize(b, DocBlob), blobs, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Throughput of the tree-sitter based RST parser.
+
+Parse the samples of ``papyri/tests/corpus`` and the docstrings of numpy
+public objects, and report for each the time spent:
+
+- ``tree-sitter``: in the tree-sitter parser alone (`ts.parse_tree`),
+- ``parse``: in `ts.parse`, the above plus the conversion of the tree.
+
+Docstrings that `ts.parse` rejects are skipped.
+
+Usage::
+
+    $ python benchmarks/ts_parse.py [--repeat 5] [--modules numpy numpy.linalg]
+
+"""
+import argparse
+import importlib
+import time
+from pathlib import Path
+
+import papyri.take2  # noqa: F401, import order of ts.
+from papyri import ts
+from papyri.utils import dedent_but_first
+
+CORPUS = Path(__file__).parent.parent / "papyri" / "tests" / "corpus"
+
+
+def docstrings(modules):
+    for name in modules:
+        module = importlib.import_module(name)
+        for attr in sorted(dir(module)):
+            doc = getattr(getattr(module, attr), "__doc__", None)
+            if isinstance(doc, str):
+                yield dedent_but_first(doc).encode()
+
+
+def accepted(texts):
+    res = []
+    for text in texts:
+        try:
+            ts.parse(text)
+        except Exception:
+            continue
+        res.append(text)
+    return res
+
+
+def bench(name, fn, texts, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - t0)
+    size = sum(map(len, texts))
+    print(
+        f"{name:12} {best * 1e3:8.1f} ms  {len(texts) / best:8.0f} docs/s"
+        f"  {size / best / 1e6:6.2f} MB/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--modules",
+        nargs="*",
+        default=["numpy", "numpy.linalg", "numpy.fft", "numpy.random"],
+        help="modules whose docstrings are parsed",
+    )
+    args = parser.parse_args()
+
+    sets = {
+        "corpus": [p.read_bytes() for p in sorted(CORPUS.glob("*.sample.txt"))],
+        "docstrings": list(docstrings(args.modules)),
+    }
+    for label, texts in sets.items():
+        texts = accepted(texts)
+        print(f"{label}: {len(texts)} documents, {sum(map(len, texts)) / 1e3:.0f} kB")
+        bench("tree-sitter", ts.parse_tree, texts, args.repeat)
+        bench("parse", ts.parse, texts, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -219,6 +219,10 @@ View given function docs in text with ANSI coloring
 
     $ papyri ascii numpy.linspace
 
+Exporting all the ingested docs as newline delimited JSON, in the MyST layout
+
+    $ papyri export corpus.ndjson
+
 
 """,
     pretty_exceptions_enable=False,
@@ -241,6 +245,9 @@ def ingest(
     check: bool = False,
     relink: bool = False,
     dummy_progress: bool = typer.Option(False, help="Disable rich progress bar"),
+    validation: str = typer.Option(
+        "full", help="Validation of the documents: full, sampled or off."
+    ),
 ):
     """
     Given paths to a docbundle folder, ingest it into the known libraries.
@@ -256,10 +263,15 @@ def ingest(
         <Multiline Description Here>
     dummy_progress : bool
         <Multiline Description Here>
+    validation : {"full", "sampled", "off"}
+        type checking of the ingested documents, bundles produced by
+        ``papyri gen`` have already been validated and can skip it.
     """
     _intro()
     from . import crosslink as cr
+    from .common_ast import set_validation
 
+    set_validation(validation)
     for p in paths:
         cr.main(Path(p), check, dummy_progress=dummy_progress)
     if relink:
@@ -414,6 +426,55 @@ def relink(
     cr.relink(dummy_progress=dummy_progress)
 
 
+@app.command()
+def repack():
+    """
+    Store ingested documents in compressed pack files.
+
+    Convert a one-file-per-document ingest directory to pack files, or if
+    already using packs, rewrite them to drop overwritten records.
+    """
+    _intro()
+    from .config import ingest_dir
+    from .graphstore import GraphStore
+
+    gstore = GraphStore(ingest_dir)
+    gstore.repack()
+    gstore.close()
+
+
+@app.command()
+def export(
+    output: Optional[Path] = typer.Argument(
+        None, help="File to write, standard output if not given."
+    ),
+    kind: List[str] = typer.Option(
+        ["module", "docs", "examples", "meta"],
+        help="Kinds of documents to export, can be repeated.",
+    ),
+    jobs: int = typer.Option(
+        1, "--jobs", "-j", help="Number of processes encoding documents in parallel."
+    ),
+):
+    """
+    Export all the ingested documents as newline delimited JSON.
+
+    Each line holds the key of a document, and the document in the MyST
+    layout, see `papyri.export`.
+    """
+    from .config import ingest_dir
+    from .export import export as export_
+
+    if output is None:
+        # no logo, stdout is the output.
+        export_(sys.stdout.buffer, ingest_dir, kind, jobs)
+        return
+    _intro()
+    with output.open("wb") as f:
+        count = export_(f, ingest_dir, kind, jobs)
+    print(f"Exported {count} documents to {output}")
+
+
 @app.command()
 def gen(
     file: str,
@@ -435,6 +496,9 @@ def gen(
         False, help="Overwrite fail on unseen error option"
     ),
     only: List[str] = typer.Option(None, "--only"),
+    validation: str = typer.Option(
+        "full", help="Validation of the documents: full, sampled or off."
+    ),
 ):
     """
     Generate documentation for a given package.
@@ -448,6 +512,7 @@ def gen(
     """
     _intro()
     from papyri.gen import gen_main
+    from papyri.common_ast import set_validation
     from IPython.utils.tempdir import TemporaryWorkingDirectory
 
     from os.path import join
@@ -455,6 +520,7 @@ def gen(
 
     here = os.getcwd()
 
+    set_validation(validation)
     with TemporaryWorkingDirectory():
         gen_main(
             infer=infer,
@@ -499,13 +565,19 @@ def render(
     sidebar: bool = True,
     graph: bool = True,
     minify: bool = False,
+    jobs: int = typer.Option(
+        1, "--jobs", "-j", help="Number of processes rendering pages in parallel."
+    ),
+    compress: bool = typer.Option(
+        False, help="Also write brotli and gzip compressed copies of the output."
+    ),
 ):
     _intro()
     import trio
 
     from .render import main as m2
 
-    trio.run(m2, ascii, html, dry_run, sidebar, graph, minify)
+    trio.run(m2, ascii, html, dry_run, sidebar, graph, minify, jobs, compress)
 
 
 @app.command()
@@ -519,22 +591,41 @@ def ascii(name: str):
 
 
 @app.command()
-def serve(sidebar: bool = True, port: int = 1234):
+def serve(
+    sidebar: bool = True,
+    port: int = 1234,
+    dev: bool = typer.Option(
+        False, help="Reload the templates when they change, to work on them."
+    ),
+):
     _intro()
     from .render import serve as s2
 
-    s2(sidebar=sidebar, port=port)
+    s2(sidebar=sidebar, port=port, dev=dev)
+
+
+@app.command()
+def compile_templates():
+    """
+    Precompile the html templates, to speed up the start of render and serve.
+
+    The compiled templates are ignored once the templates change.
+    """
+    from .render import COMPILED_TEMPLATES_DIR, compile_templates
+
+    n = compile_templates()
+    print(f"Compiled {n} templates in {COMPILED_TEMPLATES_DIR}")
 
 
 @app.command()
 def serve_static():
-    import http.server
     import socketserver
 
     PORT = 8000
+    from papyri.compress import CompressedFileHandler
     from papyri.config import html_dir
 
-    class Handler(http.server.SimpleHTTPRequestHandler):
+    class Handler(CompressedFileHandler):
         def __init__(self, *args, **kwargs):
             super().__init__(*args, directory=str(html_dir), **kwargs)
 
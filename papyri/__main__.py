@@ -1,3 +1,5 @@
 from papyri import app
 
-app()
+# guarded, as worker processes (e.g. `papyri render --jobs`) import this module.
+if __name__ == "__main__":
+    app()
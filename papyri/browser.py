@@ -23,6 +23,8 @@
 Urwid tour.  Shows many of the standard widget types and features.
 """
 import sys
+from functools import lru_cache
+from pathlib import Path
 from typing import List
 
 import urwid
@@ -38,6 +40,7 @@ from urwid.widget import LEFT, SPACE
 
 from papyri.crosslink import RefInfo, encoder
 from papyri.config import ingest_dir
+from papyri.graphstore import GraphStore
 from papyri.myst_ast import MParagraph
 
 
@@ -230,8 +233,13 @@ def dedup(l):
     return acc
 
 
-def load(file_path, walk, qa, gen_content, frame):
-    blob = encoder.decode(file_path.read_bytes())
+@lru_cache
+def _store() -> GraphStore:
+    return GraphStore(ingest_dir)
+
+
+def load(key, walk, qa, gen_content, frame):
+    blob = encoder.decode(_store().get(key))
     assert hasattr(blob, "arbitrary")
     for i in gen_content(blob, frame):
         walk.append(i)
@@ -240,7 +248,7 @@ def load(file_path, walk, qa, gen_content, frame):
 def guess_load(rough, walk, gen_content, stack, frame):
     stack.append(rough)
 
-    candidates = list(ingest_dir.glob(f"*/*/module/{rough}"))
+    candidates = _store().glob((None, None, "module", rough))
     if candidates:
         for _q in range(len(walk)):
             walk.pop()
@@ -426,8 +434,12 @@ class Renderer:
 
     def render_Fig(self, fig):
         def show_fig(name):
-            cand = next(ingest_dir.glob(f"*/*/assets/{name}"))
             import subprocess
+            import tempfile
+
+            key = next(_store().iglob((None, None, "assets", name)))
+            cand = Path(tempfile.mkdtemp()) / name
+            cand.write_bytes(_store().get(key))
 
             subprocess.Popen(
                 ["qlmanage", "-p", cand],
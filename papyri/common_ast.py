@@ -2,7 +2,8 @@ from __future__ import annotations
 
 import json
 import typing
-from typing import Dict, Any
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import cbor2
 
@@ -11,6 +12,8 @@ from .myst_serialiser import serialize as myst_serialize
 
 
 class Base:
+    __slots__ = ()
+
     def validate(self):
         validate(self)
         return self
@@ -20,7 +23,39 @@ class Base:
         return cls()
 
 
-class Node(Base):
+class NodeMeta(type):
+    """
+    Metaclass of the nodes, storing their fields in ``__slots__``.
+
+    Each class gets a slot per annotated field not already in the slots of its
+    bases, plus the names it lists in ``__slots__`` if any, so nodes do not
+    have an instance ``__dict__``. As a slot cannot have a class level value,
+    the field defaults are moved to the ``_defaults`` mapping, merged with the
+    ones of the bases, and set by `Node.__init__`.
+
+    Field order is unchanged, it is still given by `get_type_hints`.
+    """
+
+    def __new__(mcls, name, bases, namespace, **kwargs):
+        inherited = set()
+        defaults: Dict[str, Any] = {}
+        for base in reversed(bases):
+            for klass in reversed(base.__mro__):
+                inherited.update(vars(klass).get("__slots__", ()))
+                defaults.update(vars(klass).get("_defaults", {}))
+        slots = list(namespace.get("__slots__", ()))
+        for field in namespace.get("__annotations__", {}):
+            if field in inherited or field in slots:
+                continue
+            if field in namespace:
+                defaults[field] = namespace.pop(field)
+            slots.append(field)
+        namespace["__slots__"] = tuple(slots)
+        namespace["_defaults"] = defaults
+        return super().__new__(mcls, name, bases, namespace, **kwargs)
+
+
+class Node(Base, metaclass=NodeMeta):
     def __init__(self, *args, **kwargs):
         tt = get_type_hints(type(self))
         if type(self).__name__ == "MMystDirective":
@@ -30,6 +65,9 @@ class Node(Base):
         for k, v in kwargs.items():
             assert k in tt
             setattr(self, k, v)
+        for k, v in self._defaults.items():
+            if not hasattr(self, k):
+                setattr(self, k, v)
         if hasattr(self, "_post_deserialise"):
             self._post_deserialise()
 
@@ -39,14 +77,13 @@ class Node(Base):
         encoder.encode(cbor2.CBORTag(tag, [getattr(self, k) for k in attrs]))
 
     def __eq__(self, other):
-        if not (type(self) == type(other)):
+        if self is other:
+            return True
+        if type(self) is not type(other):
             return False
-        tt = get_type_hints(type(self))
-        for attr in tt:
-            a, b = getattr(self, attr), getattr(other, attr)
-            if a != b:
+        for attr in _fields(type(self)):
+            if getattr(self, attr) != getattr(other, attr):
                 return False
-
         return True
 
     def __repr__(self):
@@ -73,13 +110,54 @@ class Node(Base):
 
     def __hash__(self):
         return hash(
-            tuple(
-                tuple(getattr(self, x))
-                for x in dir(self)
-                if not x.startswith("_") and not callable(getattr(self, x))
-            )
+            (type(self), *[_hashable(getattr(self, f)) for f in _fields(type(self))])
         )
 
+    def _cached_hash(self):
+        """
+        `__hash__` of the nodes that are not modified once built, computed
+        once and stored in their ``_hash`` slot.
+
+        Mutable nodes using it must drop the stored hash when modified, see
+        `_uncaching_setattr`.
+        """
+        try:
+            return self._hash
+        except AttributeError:
+            h = Node.__hash__(self)
+            object.__setattr__(self, "_hash", h)
+            return h
+
+    def _uncaching_setattr(self, name, value):
+        object.__setattr__(self, name, value)
+        try:
+            object.__delattr__(self, "_hash")
+        except AttributeError:
+            pass
+
+
+_field_names: Dict[type, Tuple[str, ...]] = {}
+
+
+def _fields(type_) -> Tuple[str, ...]:
+    """
+    Names of the fields of a node type, in `get_type_hints` order.
+    """
+    try:
+        return _field_names[type_]
+    except KeyError:
+        res = _field_names[type_] = tuple(get_type_hints(type_))
+        return res
+
+
+def _hashable(value):
+    # fields are often lists (of nodes), hash them as tuples.
+    if type(value) is list:
+        return tuple([_hashable(v) for v in value])
+    if type(value) is dict:
+        return tuple([(k, _hashable(v)) for k, v in value.items()])
+    return value
+
 
 TAG_MAP: Dict[Any, int] = {}
 REV_TAG_MAP: Dict[int, Any] = {}
@@ -93,83 +171,195 @@ def indent(text, marker="   |"):
     return "\n".join(marker + l for l in lines)
 
 
-def _invalidate(obj, depth=0):
+# validation mode of `validate`, one of:
+# - "full": every validated object is checked,
+# - "sampled": one validated object out of VALIDATION_SAMPLE is checked,
+# - "off": nothing is checked, for already validated data.
+VALIDATION_MODES = ("full", "sampled", "off")
+VALIDATION_SAMPLE = 10
+
+_validation = "full"
+_validated = 0
+
+# types that do not need to be recursed into.
+_LEAF_TYPES = frozenset([str, int, float, bool, bytes, type(None)])
+
+# A check returns None if the item is valid, otherwise the path to the faulty
+# item, from the innermost segment, and the error message.
+Failure = Tuple[List[str], str]
+Check = Callable[[Any], Optional[Failure]]
+
+_validators: Dict[type, Optional[Check]] = {}
+
+
+def set_validation(mode: str) -> str:
     """
-    Recursively validate type anotated classes.
+    Set the validation mode of `validate`, and return the previous one.
+
+    Parameters
+    ----------
+    mode : {"full", "sampled", "off"}
+        "sampled" only checks one object out of `VALIDATION_SAMPLE`, "off"
+        skips validation, which is useful when the data has already been
+        validated, like at ingest of bundles produced by ``papyri gen``.
     """
+    global _validation, _validated
+    assert mode in VALIDATION_MODES, f"{mode!r} not in {VALIDATION_MODES}"
+    previous, _validation = _validation, mode
+    _validated = 0
+    return previous
 
-    annotations = get_type_hints(type(obj))
-    for k, v in annotations.items():
-        # FIX: AttributeError: 'MText' object has no attribute 'position'
-        item = getattr(obj, k)
-        res = not_type_check(item, v)
-        if res:
-            return f"{k} field of  {type(obj)} : {res}"
-
-        if isinstance(item, (list, tuple)):
-            for ii, i in enumerate(item):
-                sub = _invalidate(i, depth + 1)
-                if sub is not None:
-                    return f"{k}.{ii}." + sub
-        if isinstance(item, dict):
-            for ii, i in item.items():
-                sub = _invalidate(i, depth + 1)
-                if sub is not None:
-                    return f"{k}.{ii}." + sub
-        else:
-            sub = _invalidate(item, depth + 1)
-            if sub is not None:
-                return f"{k}.{sub}." + sub
-
-    # return outcome,s
 
+def _validator(type_) -> Optional[Check]:
+    """
+    Check of the annotated fields of instances of ``type_``, None if it has
+    no annotations.
 
-def validate(obj):
-    res = _invalidate(obj)
-    if res:
-        raise ValueError(f"Wrong type at field :: {res}")
+    Checks are built once per type, they check the type of the fields
+    against their annotations and recurse into the fields values.
+    """
+    try:
+        return _validators[type_]
+    except KeyError:
+        pass
+    annotations = get_type_hints(type_) if type_ not in _LEAF_TYPES else {}
+    if not annotations:
+        _validators[type_] = None
+        return None
+    fields = [(name, _compile(annotation)) for name, annotation in annotations.items()]
+
+    def check(obj):
+        for name, check_field in fields:
+            try:
+                value = getattr(obj, name)
+            except AttributeError:
+                return [name], f"missing field of {type_}"
+            failure = check_field(value)
+            if failure is not None:
+                failure[0].append(name)
+                return failure
+        return None
+
+    _validators[type_] = check
+    return check
 
 
-def not_type_check(item, annotation):
-    if not hasattr(annotation, "__origin__"):
-        if isinstance(item, annotation):
+def _check_class(class_) -> Check:
+    if class_ in _LEAF_TYPES:
+
+        def check_leaf(item):
+            if isinstance(item, class_):
+                return None
+            return [], f"expecting {class_} got {type(item)}"
+
+        return check_leaf
+
+    def check_class(item):
+        if not isinstance(item, class_):
+            return [], f"expecting {class_} got {type(item)}"
+        check = _validator(type(item))
+        if check is None:
             return None
-        else:
-            return f"expecting {annotation} got {type(item)}"
-    elif annotation.__origin__ is dict:
-        if not isinstance(item, dict):
-            return f"got  {type(item)}, Yexpecting list"
-        inner_type = annotation.__args__[0]
-        a = [not_type_check(i, inner_type) for i in item.keys()]
-        ax = [x for x in a if x is not None]
-        inner_type = annotation.__args__[1]
-        b = [not_type_check(i, inner_type) for i in item.values()]
-        bx = [x for x in b if x is not None]
-        if ax:
-            return ":invalid key type {ax[0]}"
-        if bx:
-            return bx[0]
-        return None
-    elif annotation.__origin__ in (list, tuple):
-        # technically incorrect
-        if not isinstance(item, (list, tuple)):
-            return f"got  {type(item)}, Yexpecting list"
-        # todo, this does not support Tuple[x,x] < len of tuple, and treat is as a list.
-        assert len(annotation.__args__) == 1
-        inner_type = annotation.__args__[0]
+        return check(item)
+
+    return check_class
 
-        b = [not_type_check(i, inner_type) for i in item]
 
-        bp = [x for x in b if x is not None]
-        if bp:
-            return bp[0]
-        else:
+@lru_cache(None)
+def _compile(annotation) -> Check:
+    """
+    Check of a value against a type annotation.
+    """
+    origin = getattr(annotation, "__origin__", None)
+    if origin is None:
+        return _check_class(annotation)
+    elif origin in (list, tuple):
+        # technically incorrect for tuples, Tuple[x, x] is treated as a list.
+        assert len(annotation.__args__) == 1
+        check_item = _compile(annotation.__args__[0])
+
+        def check_list(item):
+            if not isinstance(item, (list, tuple)):
+                return [], f"got {type(item)}, expecting list"
+            for i, x in enumerate(item):
+                failure = check_item(x)
+                if failure is not None:
+                    failure[0].append(f"[{i}]")
+                    return failure
             return None
-    elif annotation.__origin__ is typing.Union:
-        if any([not_type_check(item, arg) is None for arg in annotation.__args__]):
+
+        return check_list
+    elif origin is dict:
+        check_key, check_value = map(_compile, annotation.__args__)
+
+        def check_dict(item):
+            if not isinstance(item, dict):
+                return [], f"got {type(item)}, expecting dict"
+            for k, v in item.items():
+                failure = check_key(k)
+                if failure is None:
+                    failure = check_value(v)
+                if failure is not None:
+                    failure[0].append(f"[{k!r}]")
+                    return failure
             return None
-        return f"expecting one of {annotation!r}, got {item!r}"
-    raise ValueError(item, annotation)
+
+        return check_dict
+    elif origin is typing.Union:
+        alternatives = []
+        for arg in annotation.__args__:
+            class_ = getattr(arg, "__origin__", arg)
+            if class_ in (list, tuple):
+                class_ = (list, tuple)
+            alternatives.append((class_, _compile(arg)))
+
+        def check_union(item):
+            # only fully check the alternatives of the right type, and report
+            # the failure of the first one.
+            first = None
+            for class_, check in alternatives:
+                if not isinstance(item, class_):
+                    continue
+                failure = check(item)
+                if failure is None:
+                    return None
+                if first is None:
+                    first = failure
+            if first is not None:
+                return first
+            return [], f"expecting one of {annotation!r}, got {type(item)}"
+
+        return check_union
+    raise ValueError(annotation)
+
+
+def _format_path(path: List[str]) -> str:
+    return "".join(p if p.startswith("[") else "." + p for p in reversed(path))
+
+
+def validate(obj):
+    """
+    Check that the fields of ``obj`` match their type annotations,
+    recursively, depending on the validation mode (see `set_validation`).
+
+    Raise a ValueError with the path to the first invalid field.
+    """
+    global _validated
+    if _validation == "off":
+        return
+    if _validation == "sampled":
+        _validated += 1
+        if (_validated - 1) % VALIDATION_SAMPLE:
+            return
+    check = _validator(type(obj))
+    if check is None:
+        return
+    failure = check(obj)
+    if failure is not None:
+        path, message = failure
+        raise ValueError(
+            f"Wrong type at field :: {type(obj).__name__}{_format_path(path)}: {message}"
+        )
 
 
 def register(value):
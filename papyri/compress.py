@@ -0,0 +1,177 @@
+"""
+Precompressed copies of the static site.
+
+``papyri render --compress`` writes, next to each text file of the output, a
+brotli (``.br``) and a gzip (``.gz``) compressed copy, so that a static file
+server (or CDN) can send them as is, instead of compressing each response or
+sending uncompressed pages.
+
+Brotli requires the ``brotli`` package, without it only gzip copies are
+written.
+"""
+
+from __future__ import annotations
+
+import gzip
+import http.server
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Set
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None  # type: ignore
+
+from .utils import progress
+
+# files worth compressing, images and fonts are already compressed.
+COMPRESSIBLE = frozenset([".html", ".json", ".js", ".css", ".svg", ".txt", ".xml"])
+
+# below this size compression is not worth it.
+MIN_SIZE = 256
+
+
+def _gzip(data: bytes) -> bytes:
+    # fixed mtime, so that unchanged files give identical archives.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=11)
+
+
+def encoders() -> Dict[str, Callable[[bytes], bytes]]:
+    """
+    Compression functions available, by file extension.
+    """
+    res: Dict[str, Callable[[bytes], bytes]] = {}
+    if brotli is not None:
+        res[".br"] = _brotli
+    res[".gz"] = _gzip
+    return res
+
+
+# Content-Encoding of each extension, in order of preference.
+ENCODINGS = {".br": "br", ".gz": "gzip"}
+
+
+def compress_file(path: Path) -> int:
+    """
+    Write the compressed copies of ``path`` that are missing or older than it.
+
+    Return the number of copies written.
+    """
+    data = None
+    mtime = path.stat().st_mtime
+    n = 0
+    for ext, encode in encoders().items():
+        target = path.with_name(path.name + ext)
+        if target.exists() and target.stat().st_mtime >= mtime:
+            continue
+        if data is None:
+            data = path.read_bytes()
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(encode(data))
+        os.replace(tmp, target)
+        n += 1
+    return n
+
+
+def compress_tree(root: Path, jobs: int = 0) -> int:
+    """
+    Write compressed copies of the text files under ``root``, and remove the
+    copies of the files that do not exist anymore.
+
+    Compression (zlib and brotli) releases the GIL, files are compressed in
+    ``jobs`` threads, by default one per CPU.
+
+    Return the number of copies written.
+    """
+    files: List[Path] = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.startswith("."):
+                # the build manifest, temporary files...
+                continue
+            path = Path(dirpath) / name
+            if path.suffix in ENCODINGS:
+                source = path.with_name(name[: -len(path.suffix)])
+                if source.suffix in COMPRESSIBLE and not source.exists():
+                    path.unlink()
+            elif path.suffix in COMPRESSIBLE and path.stat().st_size >= MIN_SIZE:
+                files.append(path)
+
+    written = 0
+    with ThreadPoolExecutor(jobs or os.cpu_count()) as pool:
+        futures = [pool.submit(compress_file, f) for f in files]
+        for _, f in progress(
+            as_completed(futures), description="Compressing...", total=len(futures)
+        ):
+            written += f.result()
+    return written
+
+
+def accepted_encodings(header: str) -> Set[str]:
+    """
+    Encodings accepted by a client, from its ``Accept-Encoding`` header.
+    """
+    res = set()
+    for item in header.split(","):
+        name, *params = [x.strip() for x in item.split(";")]
+        q = 1.0
+        for p in params:
+            k, _, v = p.partition("=")
+            if k.strip() == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0
+        if name and q > 0:
+            res.add(name.lower())
+    return res
+
+
+class CompressedFileHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Static file handler sending the precompressed copy of the requested
+    file, if any, accepted by the client and not older than the file.
+
+    A build without ``--compress`` rewrites the pages but not their copies,
+    those are then out of date and the file itself is sent.
+    """
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            if not self.path.split("?")[0].endswith("/"):
+                # let the base class redirect.
+                return super().send_head()
+            path = os.path.join(path, "index.html")
+        accepted = accepted_encodings(self.headers.get("Accept-Encoding", ""))
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return super().send_head()
+        for ext in ENCODINGS:
+            if ENCODINGS[ext] not in accepted or not os.path.isfile(path + ext):
+                continue
+            f = open(path + ext, "rb")
+            try:
+                fs = os.fstat(f.fileno())
+                if fs.st_mtime < mtime:
+                    f.close()
+                    continue
+                self.send_response(200)
+                self.send_header("Content-type", self.guess_type(path))
+                self.send_header("Content-Encoding", ENCODINGS[ext])
+                self.send_header("Content-Length", str(fs.st_size))
+                self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
+                self.send_header("Vary", "Accept-Encoding")
+                self.end_headers()
+                return f
+            except Exception:
+                f.close()
+                raise
+        return super().send_head()
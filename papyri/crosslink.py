@@ -6,7 +6,7 @@ import logging
 import warnings
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, FrozenSet, List, Optional, Tuple, Any
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple, Any
 
 from rich.logging import RichHandler
 import cbor2
@@ -14,8 +14,9 @@ from there import print
 
 from .config import ingest_dir
 from .gen import DocBlob, normalise_ref
-from .graphstore import GraphStore, Key
+from .graphstore import GraphStore, Key, pending_tail
 from .take2 import (
+    Link,
     Param,
     RefInfo,
     Fig,
@@ -25,7 +26,8 @@ from .take2 import (
     encoder,
     TocTree,
 )
-from .common_ast import Node, register
+from .common_ast import TAG_MAP, Node, register
+from .miniserde import get_type_hints
 from .tree import PostDVR, resolve_, TreeVisitor
 from .utils import progress, dummy_progress, FullQual, Cannonical
 
@@ -44,7 +46,7 @@ def find_all_refs(
     graph_store: GraphStore,
 ) -> Tuple[FrozenSet[RefInfo], Dict[str, RefInfo]]:
     assert isinstance(graph_store, GraphStore)
-    o_family = sorted(list(graph_store.glob((None, None, "module", None))))
+    o_family = sorted(graph_store.iglob((None, None, "module", None)))
 
     # TODO
     # here we can't compute just the dictionary and use frozenset(....values())
@@ -53,12 +55,35 @@ def find_all_refs(
     known_refs = []
     ref_map = {}
     for item in o_family:
-        r = RefInfo(item.module, item.version, "module", item.path)
+        r = RefInfo.interned(item.module, item.version, "module", item.path)
         known_refs.append(r)
         ref_map[r.path] = r
     return frozenset(known_refs), ref_map
 
 
+def build_navigation(graph_store: GraphStore) -> None:
+    """
+    Materialize the hierarchy of known objects used to render the navigation
+    of each page (the siblings at each level of a qualified name).
+
+    This only depends on the set of known objects, so we compute it once at
+    ingest/relink time, instead of walking all the known objects on each page
+    render.
+
+    Intermediate names that are not documented themselves (for example a
+    class only documented in ``__init__``) get a ``?`` placeholder key.
+    """
+    known_refs, ref_map = find_all_refs(graph_store)
+    rows = {}
+    for ref in known_refs:
+        parts = ref.path.split(".")
+        for i in range(len(parts)):
+            parent, child = ".".join(parts[:i]), ".".join(parts[: i + 1])
+            r = ref_map.get(child, RefInfo("?", "?", "?", child))
+            rows[(parent, child)] = Key(*r)
+    graph_store.put_navigation((p, c, k) for (p, c), k in rows.items())
+
+
 @register(4010)
 @dataclass
 class IngestedBlobs(Node):
@@ -76,6 +101,7 @@ class IngestedBlobs(Node):
         "logo",
         "qa",
         "arbitrary",
+        "__isfrozen",
     )
 
     content: Dict[str, Section]
@@ -91,20 +117,33 @@ class IngestedBlobs(Node):
     qa: str
     arbitrary: List[Section]
 
-    __isfrozen = False
-
     @classmethod
     def new(cls):
         return cls({}, None, None, None, None, [], None, None, None, None, None, None)
 
     def __setattr__(self, key, value):
-        if self.__isfrozen and not hasattr(self, key):
+        # the flag slot is unset until `_freeze`.
+        if getattr(self, "_IngestedBlobs__isfrozen", False) and not hasattr(self, key):
             raise TypeError("%r is a frozen class" % self)
         object.__setattr__(self, key, value)
 
     def _freeze(self):
         self.__isfrozen = True
 
+    def cbor(self, cbor_encoder):
+        # Each non scalar field, and each section of the content, is stored
+        # as an embedded item, so that a reader interested in a few of them
+        # can skip decoding the others (see `Encoder.decode_lazy`).
+        values = []
+        for k in get_type_hints(type(self)):
+            v = getattr(self, k)
+            if k == "content":
+                v = {name: encoder.embed(section) for name, section in v.items()}
+            elif not isinstance(v, (str, int, type(None))):
+                v = encoder.embed(v)
+            values.append(v)
+        cbor_encoder.encode(cbor2.CBORTag(TAG_MAP[type(self)], values))
+
     def all_forward_refs(self) -> List[Key]:
         visitor = TreeVisitor({RefInfo, Fig})
         res: Dict[Any, List[Any]] = {}
@@ -123,6 +162,22 @@ class IngestedBlobs(Node):
         )
         return list(sorted(ssr))
 
+    def unresolved_links(self) -> List[Link]:
+        """
+        All the links of this document whose target could not be resolved
+        yet, typically because they point to a package not yet ingested.
+        """
+        visitor = TreeVisitor({Link})
+        acc: List[Link] = []
+        for sec in (
+            list(self.content.values())
+            + [self.example_section_data]  # type: ignore
+            + self.arbitrary  # type: ignore
+            + self.see_also  # type: ignore
+        ):
+            acc.extend(visitor.generic_visit(sec).get(Link, []))
+        return [l for l in acc if _is_unresolved(l)]
+
     def process(
         self, known_refs, aliases: Optional[Dict[str, str]], verbose=True, *, version
     ) -> None:
@@ -192,6 +247,57 @@ class IngestedBlobs(Node):
             assert None not in r, r
 
 
+def _is_unresolved(link: Link) -> bool:
+    return (not link.exists) or link.reference.kind == "to-resolve"
+
+
+def resolve_links(
+    doc_blob: IngestedBlobs,
+    qa: str,
+    known_refs: FrozenSet[RefInfo],
+    rev_aliases: Dict[Cannonical, FullQual],
+    targets: Optional[Set[str]] = None,
+) -> Tuple[bool, Set[str]]:
+    """
+    Try to resolve the unresolved links of ``doc_blob`` in place.
+
+    Parameters
+    ----------
+    doc_blob : IngestedBlobs
+        document to update.
+    qa : str
+        fully qualified name of the document, used for relative references.
+    known_refs : frozenset of RefInfo
+        all the targets we can currently link to.
+    rev_aliases : dict
+        reverse alias map, see `resolve_`.
+    targets : set of str, optional
+        only consider links pointing to those targets.
+
+    Returns
+    -------
+    changed : bool
+        whether at least one link was updated.
+    remaining : set of str
+        targets that are still unresolved and should be queued.
+
+    """
+    changed = False
+    remaining = set()
+    for link in doc_blob.unresolved_links():
+        if targets is not None and link.value not in targets:
+            remaining.add(link.value)
+            continue
+        r = resolve_(qa, known_refs, frozenset(), link.value, rev_aliases=rev_aliases)
+        if r.kind == "module":
+            link.exists = True
+            link.reference = r
+            changed = True
+        else:
+            remaining.add(link.value)
+    return changed, remaining
+
+
 def load_one_uningested(
     bytes_: bytes,
     qa: str,
@@ -222,6 +328,13 @@ def load_one_uningested(
     return blob
 
 
+def _rev_aliases(aliases: Dict[str, str]) -> Dict[Cannonical, FullQual]:
+    """
+    Map of the canonical names of objects to their fully qualified names.
+    """
+    return {Cannonical(v): FullQual(k) for k, v in aliases.items()}
+
+
 class Ingester:
     def __init__(self, dp):
         self.ingest_dir = ingest_dir
@@ -395,6 +508,10 @@ class Ingester:
                 qa, _ = qa.split(":")
             mod_root = qa.split(".")[0]
             assert mod_root == root, f"{mod_root}, {root}"
+        known_refs_II = known_refs.union(
+            RefInfo(root, version, "module", qa) for qa in nvisited_items
+        )
+        rev_aliases = _rev_aliases({**self._load_aliases(gstore), **aliases})
         for _, (qa, doc_blob) in self.progress(
             nvisited_items.items(), description=f"{path.name} Writing..."
         ):
@@ -406,6 +523,7 @@ class Ingester:
             # when walking the tree of figure we can't properly crosslink
             # as we don't know the version number.
             # fix it at serialisation time.
+            _, pending = resolve_links(doc_blob, qa, known_refs_II, rev_aliases)
             forward_refs = doc_blob.all_forward_refs()
             # print(len(forward_refs))
 
@@ -419,18 +537,60 @@ class Ingester:
                     encoder.encode(doc_blob),
                     forward_refs,
                 )
+                gstore.put_pending(key, pending)
 
             except Exception as e:
                 raise RuntimeError(f"error writing to {path}") from e
 
-    def relink(self) -> None:
-        gstore = self.gstore
-        known_refs, _ = find_all_refs(gstore)
+        self.resolve_pending(
+            {pending_tail(qa) for qa in nvisited_items}, known_refs_II, rev_aliases
+        )
+        build_navigation(gstore)
+
+    def _load_aliases(self, gstore: GraphStore) -> Dict[str, str]:
         aliases: Dict[str, str] = {}
         for key in gstore.glob((None, None, "meta", "aliases.cbor")):
             aliases.update(cbor2.loads(gstore.get(key)))
+        return aliases
 
-        rev_aliases = {Cannonical(v): FullQual(k) for k, v in aliases.items()}
+    def resolve_pending(
+        self,
+        tails: Set[str],
+        known_refs: FrozenSet[RefInfo],
+        rev_aliases: Dict[Cannonical, FullQual],
+    ) -> None:
+        """
+        Resolve, in one batch, the queued references that may point to newly
+        ingested documents.
+
+        Only documents with a pending target whose last component is in
+        ``tails`` are loaded, the rest of the corpus is not touched.
+        """
+        gstore = self.gstore
+        pending = gstore.get_pending(tails)
+        resolved = 0
+        for _, (key, targets) in self.progress(
+            pending.items(), description="Resolving pending links..."
+        ):
+            doc_blob = encoder.decode(gstore.get(key))
+            assert isinstance(doc_blob, IngestedBlobs)
+            changed, remaining = resolve_links(
+                doc_blob, key.path, known_refs, rev_aliases, targets=targets
+            )
+            if changed:
+                resolved += len(targets - remaining)
+                gstore.put(key, encoder.encode(doc_blob), doc_blob.all_forward_refs())
+                gstore.put_pending(key, remaining)
+        if resolved:
+            log.info(
+                "Resolved %s pending links in %s documents", resolved, len(pending)
+            )
+
+    def relink(self) -> None:
+        gstore = self.gstore
+        known_refs, _ = find_all_refs(gstore)
+        aliases = self._load_aliases(gstore)
+        rev_aliases = _rev_aliases(aliases)
 
         builtins.print(
             "Relinking is safe to cancel, but some back references may be broken...."
@@ -451,30 +611,18 @@ class Ingester:
                 raise type(e)(key)
             assert doc_blob.content is not None, data
 
-            for sa in doc_blob.see_also:
-                if sa.name.exists:
-                    continue
-                r = resolve_(
-                    key.path,
-                    known_refs,
-                    frozenset(),
-                    sa.name.value,
-                    rev_aliases=rev_aliases,
-                )
-                if r.kind == "module":
-                    print("unresolved ok...", r, key)
-                    sa.name.exists = True
-                    sa.name.reference = r
-
-            # end todo
+            changed, pending = resolve_links(
+                doc_blob, key.path, known_refs, rev_aliases
+            )
+            gstore.put_pending(key, pending)
 
-            data = encoder.encode(doc_blob)
             for s in forward:
                 assert isinstance(s, Key)
             forward_refs = set(forward)
+            # links settled here get back references, like in `resolve_pending`.
             ss2 = doc_blob.all_forward_refs()
-            if ss2 != forward_refs:
-                gstore.put(key, data, forward_refs)
+            if changed or set(ss2) != forward_refs:
+                gstore.put(key, encoder.encode(doc_blob), ss2)
 
         for _, key in progress(
             gstore.glob((None, None, "examples", None)),
@@ -496,6 +644,7 @@ class Ingester:
                 encoder.encode(s_code),
                 refs,
             )
+        build_navigation(gstore)
 
 
 def main(path, check, *, dummy_progress):
@@ -0,0 +1,168 @@
+"""
+Export of the ingested documents as newline delimited JSON (NDJSON).
+
+Each line is a compact JSON object with the key of a document and the
+document in the MyST layout (see `papyri.myst_serialiser`)::
+
+    {"module":"numpy","version":"1.26.4","kind":"module","path":"numpy.linspace","data":{"type":"IngestedBlobs",...}}
+
+With the ``meta`` kind, the metadata of each bundle comes first, with null
+``kind`` and ``path``, as the ``Key(module, version, None, None)`` used to
+read it. Assets are binary files and are not exported.
+
+Documents are read, decoded and encoded one chunk at a time, optionally in
+worker processes, and written in order as they come, so the memory use does
+not depend on the size of the store.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+from .common_ast import Node
+from .crosslink import IngestedBlobs  # noqa: F401, registers its tag.
+from .graphstore import GraphStore, Key
+from .take2 import encoder
+
+log = logging.getLogger("papyri")
+
+EXPORT_KINDS = ("module", "docs", "examples", "meta")
+
+# number of documents encoded at once by a worker process.
+EXPORT_CHUNK = 64
+
+# store of the worker processes, see `_init_export_worker`.
+_worker_store: Optional[GraphStore] = None
+
+
+def _default(obj):
+    if isinstance(obj, Node):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_record(key: Key, data: bytes) -> bytes:
+    """
+    NDJSON line of the document ``key``, given its encoded ``data``.
+    """
+    record = {
+        "module": key.module,
+        "version": key.version,
+        "kind": key.kind,
+        "path": key.path,
+        "data": encoder.decode(data),
+    }
+    return (
+        json.dumps(record, default=_default, ensure_ascii=False, separators=(",", ":"))
+        + "\n"
+    ).encode()
+
+
+def _encode_chunk(store: GraphStore, keys: List[Key]) -> Tuple[int, bytes]:
+    lines = []
+    for key in keys:
+        try:
+            data = store.get_meta(key) if key.kind is None else store.get(key)
+        except FileNotFoundError:
+            # bundles without metadata, documents removed since listed...
+            log.warning("Skipping %r, not found", key)
+            continue
+        lines.append(encode_record(key, data))
+    return len(lines), b"".join(lines)
+
+
+def _init_export_worker(root: Path):
+    global _worker_store
+    _worker_store = GraphStore(root)
+
+
+def _encode_chunk_worker(keys: List[Key]) -> Tuple[int, bytes]:
+    assert _worker_store is not None
+    return _encode_chunk(_worker_store, keys)
+
+
+def _keys(store: GraphStore, kinds: List[str]) -> Iterator[Key]:
+    if "meta" in kinds:
+        for module, version in sorted(store.glob((None, None))):
+            yield Key(module, version, None, None)
+    for kind in kinds:
+        yield from store.iglob((None, None, kind, None))
+
+
+def _chunks(keys: Iterator[Key]) -> Iterator[List[Key]]:
+    while chunk := list(islice(keys, EXPORT_CHUNK)):
+        yield chunk
+
+
+def iter_export(
+    root: Path, kinds: Iterable[str] = EXPORT_KINDS, jobs: int = 1
+) -> Iterator[Tuple[int, bytes]]:
+    """
+    Encode the documents of the store in ``root``, chunk by chunk.
+
+    Parameters
+    ----------
+    root : Path
+        directory of the `GraphStore`.
+    kinds : iterable of str
+        kinds of documents to export, see `EXPORT_KINDS`.
+    jobs : int
+        number of worker processes encoding the documents, with 1 they are
+        encoded in the current process.
+
+    Yields
+    ------
+    count : int
+        number of documents in the chunk.
+    lines : bytes
+        NDJSON lines of the chunk, see `encode_record`.
+    """
+    kinds = list(kinds)
+    for kind in kinds:
+        assert kind in EXPORT_KINDS, f"{kind!r} not in {EXPORT_KINDS}"
+    store = GraphStore(root)
+    try:
+        chunks = _chunks(_keys(store, kinds))
+        if jobs == 1:
+            for chunk in chunks:
+                yield _encode_chunk(store, chunk)
+            return
+
+        # sqlite connections can't be shared with forked processes.
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            jobs, mp_context=ctx, initializer=_init_export_worker, initargs=(root,)
+        ) as pool:
+            # a few chunks per worker in flight, results are written in order.
+            pending: deque = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(_encode_chunk_worker, chunk))
+                if len(pending) >= 2 * jobs:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    finally:
+        store.close()
+
+
+def export(
+    out: BinaryIO, root: Path, kinds: Iterable[str] = EXPORT_KINDS, jobs: int = 1
+) -> int:
+    """
+    Write the documents of the store in ``root`` to ``out`` as NDJSON, and
+    return the number of documents written.
+
+    See `iter_export` for the parameters.
+    """
+    total = 0
+    for count, lines in iter_export(root, kinds, jobs):
+        out.write(lines)
+        total += count
+    return total
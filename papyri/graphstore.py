@@ -1,8 +1,52 @@
 # import json
 import cbor2
+import functools
+import os
+import shutil
 import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path as _Path
-from typing import List, Set
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import trio
+
+from .packstore import PackStore
+from .utils import intern_str
+
+# maximum number of bound parameters we send in a single `IN (...)` query,
+# old sqlite versions are limited to 999.
+_SQL_CHUNK = 500
+
+_KEY_COLUMNS = ("package", "version", "category", "identifier")
+
+# patterns with these characters are matched with sqlite GLOB.
+_GLOB_CHARS = frozenset("*?[")
+
+
+def pending_tail(target: str) -> str:
+    """
+    Last component of a reference target, used to index pending references.
+
+    ``~numpy.linalg.inv``, ``numpy.linalg:inv`` and ``inv()`` all have ``inv``
+    as tail.
+    """
+    target = target.strip().lstrip("~")
+    if target.endswith("()"):
+        target = target[:-2]
+    return target.replace(":", ".").split(".")[-1]
 
 
 class Path:
@@ -47,12 +91,42 @@ class Path:
 
 # a Key name tuple with a custom __init__
 class Key:
+    """
+    Immutable, keys read from the database are shared, see `Key.interned`.
+    """
+
+    __slots__ = ("module", "version", "kind", "path")
+
+    module: str
+    version: str
+    kind: str
+    path: str
+
     def __init__(self, module, version, kind, path):
         assert ":" not in module, breakpoint()
-        self.module = module
-        self.version = version
-        self.kind = kind
-        self.path = path
+        object.__setattr__(self, "module", module)
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "kind", kind)
+        object.__setattr__(self, "path", path)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return type(self), self._t()
+
+    @classmethod
+    def interned(cls, module, version, kind, path) -> "Key":
+        """
+        The shared instance equal to ``Key(module, version, kind, path)``.
+
+        Used for the keys read from the database, see `RefInfo.interned`.
+        """
+        key = cls(intern_str(module), intern_str(version), intern_str(kind), path)
+        return _interned_keys.setdefault(key, key)
 
     def __contains__(self, other):
         return other in self._t()
@@ -79,6 +153,237 @@ class Key:
         return f"<Key {self._t()}>"
 
 
+_interned_keys: Dict[Key, Key] = {}
+
+
+class ConnectionPool:
+    """
+    sqlite connections of a GraphStore.
+
+    sqlite connections can't be shared between threads, and a single
+    connection serialises all the queries. Here we keep a single writer
+    connection, protected by a lock, and open one read-only connection per
+    thread that needs to read. The database is in WAL mode, so readers do not
+    block the writer and vice versa.
+
+    Parameters
+    ----------
+    path : Path
+        path to the sqlite database.
+    mmap_size : int
+        maximum number of bytes of the database to access through mmap.
+    cache_size : int
+        page cache size per connection, in KiB.
+    busy_timeout : int
+        how long to wait (in ms) for a lock before raising.
+
+    """
+
+    def __init__(
+        self,
+        path: _Path,
+        *,
+        mmap_size: int = 256 * 1024 * 1024,
+        cache_size: int = 64 * 1024,
+        busy_timeout: int = 5000,
+    ):
+        self.path = path
+        self._pragmas = [
+            f"PRAGMA mmap_size = {int(mmap_size)}",
+            f"PRAGMA cache_size = -{int(cache_size)}",
+            f"PRAGMA busy_timeout = {int(busy_timeout)}",
+        ]
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        # reader connections, by thread id.
+        self._readers: Dict[int, sqlite3.Connection] = {}
+        # number of write transactions made through this pool.
+        self._writes = 0
+        # nesting level of `write`, only the outermost one commits.
+        self._depth = 0
+        self.writer = self._connect(str(path), uri=False)
+        self.writer.execute("PRAGMA journal_mode = WAL")
+        self.writer.execute("PRAGMA synchronous = NORMAL")
+        self.writer.execute("PRAGMA foreign_keys = 1")
+
+    def _connect(self, database: str, uri: bool) -> sqlite3.Connection:
+        # sqlite3 keeps a per-connection cache of prepared statements, our
+        # queries are few but repeated a lot.
+        conn = sqlite3.connect(
+            database, uri=uri, check_same_thread=False, cached_statements=256
+        )
+        for pragma in self._pragmas:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """
+        Context manager giving exclusive access to the writer connection,
+        and committing (or rolling back) on exit.
+
+        Nested calls are part of the outermost transaction, which alone
+        commits.
+        """
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield self.writer
+                finally:
+                    self._depth -= 1
+                return
+            self._depth = 1
+            try:
+                with self.writer:
+                    yield self.writer
+            finally:
+                self._depth = 0
+            self._writes += 1
+
+    def data_version(self) -> Tuple[int, int]:
+        """
+        Value that changes whenever the database is modified, be it through
+        this pool or by another process.
+        """
+        with self._lock:
+            # only reflects the commits of the other connections.
+            [(version,)] = self.writer.execute("PRAGMA data_version").fetchall()
+            return self._writes, version
+
+    def read(self) -> sqlite3.Connection:
+        """
+        Read-only connection for the current thread.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect(self.path.absolute().as_uri() + "?mode=ro", uri=True)
+            self._local.conn = conn
+            with self._lock:
+                self._prune()
+                self._readers[threading.get_ident()] = conn
+        return conn
+
+    def _prune(self) -> None:
+        """
+        Close the connections of threads that are gone, worker threads (e.g.
+        from `trio.to_thread`) come and go in long running servers.
+        """
+        ident = threading.get_ident()
+        alive = {t.ident for t in threading.enumerate()} - {ident}
+        for tid in list(self._readers):
+            if tid not in alive:
+                self._readers.pop(tid).close()
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._readers.values():
+                conn.close()
+            self._readers = {}
+            self.writer.close()
+
+
+class DecodedCache:
+    """
+    LRU cache of decoded documents, bounded by their approximate size.
+
+    Decoding a document is much more expensive than reading it, and popular
+    pages are decoded again on each view. The size of a decoded document is
+    approximated by the size of its encoded bytes.
+
+    Cached objects are shared by all the callers, and must not be modified.
+
+    Parameters
+    ----------
+    max_size : int
+        approximate maximum number of bytes to keep.
+
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # bumped on each invalidation, so that a document read before an
+        # invalidation is not cached after it.
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._data: OrderedDict[Hashable, Tuple[Any, int]] = OrderedDict()
+
+    def get(self, key: Hashable, load: Callable[[], bytes], decode: Callable) -> Any:
+        """
+        Return the decoded document for ``key``, calling ``load`` and
+        ``decode`` on a miss.
+
+        Documents decoded with different functions (e.g. lazily and fully)
+        are cached separately, and invalidated together.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and decode in item[0]:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0][decode]
+            self.misses += 1
+            generation = self._generation
+        data = load()
+        obj = decode(data)
+        self._add(key, decode, obj, len(data), generation)
+        return obj
+
+    def _add(
+        self, key: Hashable, decode: Callable, obj: Any, size: int, generation: int
+    ) -> None:
+        if size > self.max_size:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            item = self._data.get(key)
+            if item is None:
+                item = self._data[key] = ({}, 0)
+            else:
+                self._data.move_to_end(key)
+            objs, old_size = item
+            if decode not in objs:
+                self.size += size
+                self._data[key] = (objs, old_size + size)
+            objs[decode] = obj
+            while self.size > self.max_size:
+                _, (_, s) = self._data.popitem(last=False)
+                self.size -= s
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._generation += 1
+            item = self._data.pop(key, None)
+            if item is not None:
+                self.size -= item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Counters of the cache, for monitoring.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._data),
+                "size": self.size,
+                "max_size": self.max_size,
+            }
+
+
 class GraphStore:
     """
     Class abstraction over the filesystem to store documents in a graph-like
@@ -120,69 +425,188 @@ class GraphStore:
 
     """
 
-    def __init__(self, root: _Path, link_finder=None):
-        # for now we are going to try to do in-memory operation, just to
-        # see how we can handle that with SQL, and move to on-disk later.
-        p = _Path("~/.papyri/ingest/papyri.db")
-        p = p.expanduser()
-        if not p.exists():
-            self.conn = sqlite3.connect(str(p))
-            self.conn.execute("PRAGMA foreign_keys = 1")
-
-            print("Creating documents table")
-            self.conn.cursor().execute(
+    def __init__(
+        self,
+        root: _Path,
+        link_finder=None,
+        *,
+        storage=None,
+        db_path: Optional[_Path] = None,
+        db_options: Optional[Dict[str, int]] = None,
+        cache_size: int = 0,
+    ):
+        """
+        Parameters
+        ----------
+        root : Path
+            directory where documents are stored.
+        link_finder :
+            unused.
+        storage : {"files", "pack", None}
+            how to store documents, either one file per document, or appended
+            to compressed pack files (see `papyri.packstore`). By default use
+            pack files if ``root`` already contains some.
+        db_path : Path, optional
+            sqlite database storing the links, defaults to ``root/papyri.db``.
+        db_options : dict, optional
+            extra options passed to `ConnectionPool`.
+        cache_size : int
+            approximate size in bytes of the cache of decoded documents used
+            by `get_decoded` and `get_meta_decoded`, 0 disables it.
+        """
+        root.mkdir(parents=True, exist_ok=True)
+        if db_path is None:
+            db_path = root / "papyri.db"
+        exists = db_path.exists()
+        self._pool = ConnectionPool(db_path, **(db_options or {}))
+        with self._pool.write() as conn:
+            if not exists:
+                self._create_tables(conn)
+
+            # stores created before the deferred resolution queue existed do
+            # not have the pending table yet.
+            conn.execute(
                 """
-                CREATE TABLE documents(
+                CREATE TABLE IF NOT EXISTS pending(
                 id INTEGER PRIMARY KEY,
-                package TEXT NOT NULL,
-                version TEXT NOT NULL,
-                category TEXT NOT NULL,
-                identifier TEXT NOT NULL, unique(package, version, category, identifier))
+                source INTEGER NOT NULL,
+                target TEXT NOT NULL,
+                tail TEXT NOT NULL,
+                unique(source, target),
+                FOREIGN KEY (source) REFERENCES documents(id) ON DELETE CASCADE)
                 """
             )
-
-            self.conn.cursor().execute(
+            conn.execute("CREATE INDEX IF NOT EXISTS tx on pending(tail);")
+            # glob patterns mostly fix the kind of document, and sometimes
+            # the identifier.
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS kx on documents(category, identifier);"
+            )
+            self._maybe_add_degrees(conn)
+            # navigation of the hierarchy of objects, see `put_navigation`.
+            conn.execute(
                 """
-                CREATE TABLE destinations(
+                CREATE TABLE IF NOT EXISTS navigation(
                 id INTEGER PRIMARY KEY,
+                parent TEXT NOT NULL,
+                child TEXT NOT NULL,
                 package TEXT NOT NULL,
                 version TEXT NOT NULL,
                 category TEXT NOT NULL,
-                identifier TEXT NOT NULL, unique(package, version, category, identifier))
+                identifier TEXT NOT NULL,
+                unique(parent, child))
                 """
             )
-
-            print("Creating links table")
-            self.conn.cursor().execute(
+            # counter of the writes of documents, see `data_version`.
+            conn.execute(
                 """
-                CREATE TABLE links(
-                id INTEGER PRIMARY KEY,
-                source INTEGER NOT NULL,
-                dest INTEGER NOT NULL,
-                metadata TEXT,
-                FOREIGN KEY (source) REFERENCES documents(id) ON DELETE CASCADE
-                FOREIGN KEY (dest) REFERENCES destinations(id) ON DELETE CASCADE)
+                CREATE TABLE IF NOT EXISTS generation(
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                value INTEGER NOT NULL)
                 """
             )
-            for cid in [
-                "CREATE INDEX module on documents(package) ;",
-                "CREATE INDEX px on documents(identifier);",
-                "CREATE INDEX qa on destinations(identifier);",
-                "CREATE INDEX ax on destinations(package, version, category, identifier);",
-                "CREATE INDEX sx on links(source);",
-                "CREATE INDEX dx on links(dest);",
-            ]:
-                self.conn.cursor().execute(cid)
-
-            self.conn.commit()
-        else:
-            self.conn = sqlite3.connect(str(p))
+            conn.execute("insert or ignore into generation values (0, 0)")
 
         # assert isinstance(link_finder, dict)
         assert isinstance(root, _Path)
         self._root = Path(root)
         self._link_finder = link_finder
 
+        if storage is None:
+            storage = "pack" if (root / "packs").exists() else "files"
+        assert storage in ("files", "pack"), storage
+        self.cache: Optional[DecodedCache] = None
+        if cache_size:
+            self.cache = DecodedCache(cache_size)
+        # version of the writes of the other processes the cache is valid for,
+        # see `_check_cache`.
+        self._cache_version = self._pool.data_version()[1]
+
+        self._packs: Optional[PackStore] = None
+        if storage == "pack":
+            self._packs = PackStore(root / "packs", self._pool)
+
+    def _create_tables(self, conn):
+        print("Creating documents table")
+        conn.execute(
+            """
+            CREATE TABLE documents(
+            id INTEGER PRIMARY KEY,
+            package TEXT NOT NULL,
+            version TEXT NOT NULL,
+            category TEXT NOT NULL,
+            identifier TEXT NOT NULL,
+            out_degree INTEGER NOT NULL DEFAULT 0,
+            unique(package, version, category, identifier))
+            """
+        )
+
+        conn.execute(
+            """
+            CREATE TABLE destinations(
+            id INTEGER PRIMARY KEY,
+            package TEXT NOT NULL,
+            version TEXT NOT NULL,
+            category TEXT NOT NULL,
+            identifier TEXT NOT NULL,
+            in_degree INTEGER NOT NULL DEFAULT 0,
+            unique(package, version, category, identifier))
+            """
+        )
+
+        print("Creating links table")
+        conn.execute(
+            """
+            CREATE TABLE links(
+            id INTEGER PRIMARY KEY,
+            source INTEGER NOT NULL,
+            dest INTEGER NOT NULL,
+            metadata TEXT,
+            FOREIGN KEY (source) REFERENCES documents(id) ON DELETE CASCADE
+            FOREIGN KEY (dest) REFERENCES destinations(id) ON DELETE CASCADE)
+            """
+        )
+        for cid in [
+            "CREATE INDEX module on documents(package) ;",
+            "CREATE INDEX px on documents(identifier);",
+            "CREATE INDEX qa on destinations(identifier);",
+            "CREATE INDEX ax on destinations(package, version, category, identifier);",
+            "CREATE INDEX sx on links(source);",
+            "CREATE INDEX dx on links(dest);",
+        ]:
+            conn.execute(cid)
+
+    def _maybe_add_degrees(self, conn):
+        """
+        Add and fill the degree columns to stores created before they existed.
+        """
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(documents)")}
+        if "out_degree" in columns:
+            return
+        print("Adding degree columns")
+        conn.execute(
+            "ALTER TABLE documents ADD COLUMN out_degree INTEGER NOT NULL DEFAULT 0"
+        )
+        conn.execute(
+            "ALTER TABLE destinations ADD COLUMN in_degree INTEGER NOT NULL DEFAULT 0"
+        )
+        conn.execute(
+            """update documents set out_degree=(
+            select count(*) from links where links.source=documents.id)"""
+        )
+        conn.execute(
+            """update destinations set in_degree=(
+            select count(*) from links where links.dest=destinations.id)"""
+        )
+
+    def close(self) -> None:
+        """
+        Close all the database connections of this store.
+        """
+        if self._packs is not None:
+            self._packs.close()
+        self._pool.close()
+
     def _key_to_path(self, key: Key) -> Path:
         """
         Given A key, return path to the current file
@@ -222,22 +646,41 @@ class GraphStore:
         path = path.relative_to(self._root.path)
         if len(path.parts) == 4:
             a, b, c, d = path.parts
-            return Key(a, b, c, d)
+            return Key.interned(a, b, c, d)
         else:
             return path.parts
 
     def remove(self, key: Key) -> None:
-        path = self._key_to_path(key)
-        path.unlink()
+        if self._packs is not None:
+            self._packs.delete(key)
+        else:
+            path = self._key_to_path(key)
+            path.unlink()
+        if self.cache is not None:
+            self.cache.invalidate(key)
         #  this is likely incorrect if we want to deal with dangling links.
         print("Removing link from table")
-        self.conn.execute(
-            "delete from links where source=?",
-            (str(key),),
-        )
+        with self._pool.write() as conn:
+            self._bump_generation(conn)
+            rows = conn.execute(
+                f"select id from documents where {self._key_where('documents')}",
+                list(key),
+            ).fetchall()
+            for (source_id,) in rows:
+                dests = [
+                    d
+                    for (d,) in conn.execute(
+                        "select dest from links where source=?", (source_id,)
+                    )
+                ]
+                # links and pending references cascade.
+                conn.execute("delete from documents where id=?", (source_id,))
+                self._update_degrees(conn, source_id, dests)
 
     def _get(self, key: Key) -> bytes:
         assert isinstance(key, Key)
+        if self._packs is not None:
+            return self._packs.read(key)
         path = self._key_to_path(key)
 
         # TODO: this is partially incorrect.
@@ -245,107 +688,283 @@ class GraphStore:
         # we should match on more.
         return path.read_bytes()
 
-    def _get_backrefs(self, key: Key) -> Set[Key]:
-        cur = self.conn.cursor()
-        backrows = list(
-            cur.execute(
-                """
-        select documents.*
-        from links
-            inner join documents on links.source=documents.id
-            inner join destinations on links.dest=destinations.id
-        where destinations.identifier=?""",
-                (key.path,),
+    @staticmethod
+    def _key_where(table: str) -> str:
+        return " AND ".join(f"{table}.{c}=?" for c in _KEY_COLUMNS)
+
+    def _refs_many(
+        self, keys: Iterable[Key], match: str, other: str
+    ) -> Dict[Key, Set[Key]]:
+        """
+        Return the keys of the ``other`` side of all the links whose ``match``
+        side is one of ``keys``, in one query per chunk of keys.
+        """
+        keys = list(set(keys))
+        res: Dict[Key, Set[Key]] = {k: set() for k in keys}
+        cur = self._pool.read().cursor()
+        step = _SQL_CHUNK // 4
+        for i in range(0, len(keys), step):
+            chunk = keys[i : i + step]
+            rows = cur.execute(
+                f"""
+            select {", ".join(f"{match}.{c}" for c in _KEY_COLUMNS)},
+                   {", ".join(f"{other}.{c}" for c in _KEY_COLUMNS)}
+            from links
+                inner join documents on links.source=documents.id
+                inner join destinations on links.dest=destinations.id
+            where ({", ".join(f"{match}.{c}" for c in _KEY_COLUMNS)})
+                in (values {", ".join(["(?, ?, ?, ?)"] * len(chunk))})""",
+                [x for k in chunk for x in k],
             )
-        )
+            for row in rows:
+                res[Key.interned(*row[:4])].add(Key.interned(*row[4:]))
+        return res
 
-        sql_backrefs = {Key(*s[1:]) for s in backrows}
-        return sql_backrefs
+    def get_backrefs_many(self, keys: Iterable[Key]) -> Dict[Key, Set[Key]]:
+        """
+        Return, for each of ``keys``, the set of documents referring to it.
 
-    def get_forwardrefs(self, key: Key) -> Set[Key]:
-        cur = self.conn.cursor()
-        forward_rows = list(
-            cur.execute(
-                """
-        select destinations.*
-        from links
-            inner join documents on links.source=documents.id
-            inner join destinations on links.dest=destinations.id
-        where documents.identifier=?""",
-                (key.path,),
+        Keys are matched on all their components.
+        """
+        return self._refs_many(keys, "destinations", "documents")
+
+    def get_forwardrefs_many(self, keys: Iterable[Key]) -> Dict[Key, Set[Key]]:
+        """
+        Return, for each of ``keys``, the set of keys it refers to.
+
+        Keys are matched on all their components.
+        """
+        return self._refs_many(keys, "documents", "destinations")
+
+    def get_neighborhood(self, key: Key) -> Tuple[Dict[Key, int], Dict[Key, Set[Key]]]:
+        """
+        Return the neighbors of ``key`` (the keys it refers to and the
+        documents referring to it) with their in degree, and for each neighbor
+        the set of documents referring to it, in a single query.
+        """
+        cols = ", ".join(_KEY_COLUMNS)
+        where = " AND ".join(f"{c}=?" for c in _KEY_COLUMNS)
+        rows = self._pool.read().execute(
+            f"""
+            with nodes({cols}) as (
+                select {", ".join(f"d.{c}" for c in _KEY_COLUMNS)}
+                from links inner join destinations d on links.dest=d.id
+                where links.source in (select id from documents where {where})
+                union
+                select {", ".join(f"s.{c}" for c in _KEY_COLUMNS)}
+                from links inner join documents s on links.source=s.id
+                where links.dest in (select id from destinations where {where})
             )
+            select {", ".join(f"nodes.{c}" for c in _KEY_COLUMNS)},
+                   coalesce(d.in_degree, 0),
+                   {", ".join(f"s.{c}" for c in _KEY_COLUMNS)}
+            from nodes
+                left join destinations d using ({cols})
+                left join links on links.dest=d.id
+                left join documents s on links.source=s.id""",
+            [*key, *key],
         )
+        degrees: Dict[Key, int] = {}
+        backrefs: Dict[Key, Set[Key]] = {}
+        for row in rows:
+            node = Key.interned(*row[:4])
+            degrees[node] = row[4]
+            refs = backrefs.setdefault(node, set())
+            if row[5] is not None:
+                refs.add(Key.interned(*row[5:]))
+        return degrees, backrefs
+
+    def get_degrees(self, keys: Iterable[Key]) -> Dict[Key, Tuple[int, int]]:
+        """
+        Return the (in degree, out degree) of each of ``keys``, that is to say
+        the number of documents referring to it, and the number of keys it
+        refers to.
+
+        Those are maintained when documents are stored, and do not require
+        to look at the links.
+        """
+        keys = list(set(keys))
+        res: Dict[Key, Tuple[int, int]] = {}
+        cur = self._pool.read().cursor()
+        step = _SQL_CHUNK // 4
+        for i in range(0, len(keys), step):
+            chunk = keys[i : i + step]
+            values = ", ".join(["(?, ?, ?, ?)"] * len(chunk))
+            params = [x for k in chunk for x in k]
+            cols = ", ".join(_KEY_COLUMNS)
+            in_ = dict(
+                (Key.interned(*r[:4]), r[4])
+                for r in cur.execute(
+                    f"select {cols}, in_degree from destinations "
+                    f"where ({cols}) in (values {values})",
+                    params,
+                )
+            )
+            out = dict(
+                (Key.interned(*r[:4]), r[4])
+                for r in cur.execute(
+                    f"select {cols}, out_degree from documents "
+                    f"where ({cols}) in (values {values})",
+                    params,
+                )
+            )
+            for k in chunk:
+                res[k] = (in_.get(k, 0), out.get(k, 0))
+        return res
+
+    def get_forwardrefs(self, key: Key) -> Set[Key]:
+        return self.get_forwardrefs_many([key])[key]
+
+    def data_version(self) -> Tuple[int, int]:
+        """
+        Value that changes whenever documents, metadata or links are modified,
+        by this store or another process, to know when to refresh data derived
+        from the store.
+        """
+        return self._pool.data_version()
 
-        sql_forward_ref = {Key(*s[1:]) for s in forward_rows}
-        return sql_forward_ref
+    @staticmethod
+    def _bump_generation(conn: sqlite3.Connection) -> None:
+        # document files are written outside of the database, and a rewrite
+        # with the same links would leave it untouched, record each write so
+        # that `data_version` changes for the other processes.
+        conn.execute("update generation set value = value + 1")
+
+    def existing(self, keys: Iterable[Key]) -> Set[Key]:
+        """
+        Return the subset of ``keys`` that are stored documents.
+        """
+        keys = list(set(keys))
+        res: Set[Key] = set()
+        cur = self._pool.read().cursor()
+        step = _SQL_CHUNK // 4
+        cols = ", ".join(_KEY_COLUMNS)
+        for i in range(0, len(keys), step):
+            chunk = keys[i : i + step]
+            rows = cur.execute(
+                f"select {cols} from documents where ({cols}) "
+                f"in (values {', '.join(['(?, ?, ?, ?)'] * len(chunk))})",
+                [x for k in chunk for x in k],
+            )
+            res.update(Key.interned(*r) for r in rows)
+        return res
 
     def get_all(self, key):
         a = self._get(key)
-        b = self._get_backrefs(key)
+        b = self.get_backref(key)
         c = self.get_forwardrefs(key)
         return (a, b, c)
 
     def get_backref(self, key: Key) -> Set[Key]:
-        return self._get_backrefs(key)
+        return self.get_backrefs_many([key])[key]
 
     def get(self, key: Key) -> bytes:
         return self._get(key)
 
-    def _maybe_insert_source(self, key):
-        with self.conn:
-            c1 = self.conn.cursor()
-            rows = list(
-                c1.execute(
-                    """
-                select id from documents where (
-                    package=?
-                AND version=?
-                AND category=?
-                AND identifier=?)
+    def get_decoded(self, key: Key, decode: Callable[[bytes], Any]) -> Any:
+        """
+        Return ``decode(self.get(key))``, through the decoded documents cache
+        if enabled.
+
+        The returned object may be shared with other callers, and must not
+        be modified.
+        """
+        if self.cache is None:
+            return decode(self._get(key))
+        self._check_cache()
+        return self.cache.get(key, lambda: self._get(key), decode)
+
+    def get_meta_decoded(self, key: Key, decode: Callable[[bytes], Any]) -> Any:
+        """
+        Same as `get_decoded`, for the metadata of ``key``'s package version.
+        """
+        if self.cache is None:
+            return decode(self.get_meta(key))
+        self._check_cache()
+        return self.cache.get(
+            ("meta", key.module, key.version), lambda: self.get_meta(key), decode
+        )
+
+    def _check_cache(self) -> None:
+        """
+        Clear the decoded documents cache if the store has been modified by
+        another process (or another GraphStore) since it was filled.
+
+        The writes of this store invalidate their own documents.
+        """
+        assert self.cache is not None
+        version = self._pool.data_version()[1]
+        if version != self._cache_version:
+            self.cache.clear()
+            self._cache_version = version
+
+    @staticmethod
+    def _maybe_insert_source(conn: sqlite3.Connection, key) -> int:
+        """
+        Id of the document ``key``, inserted if needed, in the write
+        transaction of ``conn``.
+        """
+        c1 = conn.cursor()
+        rows = list(
+            c1.execute(
+                """
+            select id from documents where (
+                package=?
+            AND version=?
+            AND category=?
+            AND identifier=?)
+            """,
+                list(key),
+            )
+        )
+        if not rows:
+            c1.execute(
+                """
+                insert into documents
+                (package, version, category, identifier)
+                values (?, ?, ?, ?)
                 """,
-                    list(key),
-                )
+                list(key),
             )
-            if not rows:
-                c1.execute(
-                    """
-                    insert into documents values
-                    (Null, ?, ?, ?, ?)
-                    """,
-                    list(key),
-                )
-                source_id = c1.lastrowid
-            else:
-                [(source_id,)] = rows
+            source_id = c1.lastrowid
+            assert source_id is not None
+        else:
+            [(source_id,)] = rows
 
         return source_id
 
-    def _maybe_insert_dest(self, ref):
-        with self.conn:
-            c1 = self.conn.cursor()
-            rows = list(
-                c1.execute(
-                    """
-                select id from destinations where (
-                    package=?
-                AND version=?
-                AND category=?
-                AND identifier=?)
+    @staticmethod
+    def _maybe_insert_dest(conn: sqlite3.Connection, ref) -> int:
+        """
+        Id of the destination ``ref``, inserted if needed, in the write
+        transaction of ``conn``.
+        """
+        c1 = conn.cursor()
+        rows = list(
+            c1.execute(
+                """
+            select id from destinations where (
+                package=?
+            AND version=?
+            AND category=?
+            AND identifier=?)
+            """,
+                list(ref),
+            )
+        )
+        if not rows:
+            c1.execute(
+                """
+                insert into destinations
+                (package, version, category, identifier)
+                values (?, ?, ?, ?)
                 """,
-                    list(ref),
-                )
+                list(ref),
             )
-            if not rows:
-                c1.execute(
-                    """
-                    insert into destinations values
-                    (Null, ?, ?, ?, ?)
-                    """,
-                    list(ref),
-                )
-                dest_id = c1.lastrowid
-            else:
-                [(dest_id,)] = rows
+            dest_id = c1.lastrowid
+            assert dest_id is not None
+        else:
+            [(dest_id,)] = rows
 
         return dest_id
 
@@ -356,13 +975,20 @@ class GraphStore:
 
     def put_meta(self, module: str, version: str, data: bytes) -> None:
         assert isinstance(data, bytes)
-
-        mp = self._meta_path(module, version)
-        mp.path.parent.mkdir(parents=True, exist_ok=True)
-
-        mp.write_bytes(data)
+        if self._packs is not None:
+            self._packs.write_meta(module, version, data)
+        else:
+            mp = self._meta_path(module, version)
+            mp.path.parent.mkdir(parents=True, exist_ok=True)
+            mp.write_bytes(data)
+        with self._pool.write() as conn:
+            self._bump_generation(conn)
+        if self.cache is not None:
+            self.cache.invalidate(("meta", module, version))
 
     def get_meta(self, key: Key) -> bytes:
+        if self._packs is not None:
+            return self._packs.read_meta(key.module, key.version)
         mp = self._meta_path(key.module, key.version)
         return mp.read_bytes()
 
@@ -377,49 +1003,346 @@ class GraphStore:
         assert isinstance(key, Key)
         for r in refs:
             assert isinstance(r, Key), r
-        path = self._key_to_path(key)
-        path.path.parent.mkdir(parents=True, exist_ok=True)
-
-        if "assets" not in key and path.exists():
-            old_refs = self.get_forwardrefs(key)
-        else:
-            old_refs = set()
-
-        path.write_bytes(bytes_)
+        if self._packs is None:
+            path = self._key_to_path(key)
+            path.path.parent.mkdir(parents=True, exist_ok=True)
+            # write next to the destination and rename, so that concurrent
+            # readers never see a partially written document.
+            tmp = path.path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(bytes_)
+            os.replace(tmp, path.path)
 
         new_refs = set(refs)
         del refs
 
-        removed_refs = old_refs - new_refs
-        added_refs = new_refs - old_refs
-
-        with self.conn:
-            source_id = self._maybe_insert_source(key)
+        # the record of a pack and the links are updated in a single
+        # transaction, readers see all of the put or nothing, and concurrent
+        # writers of the same document do not diff stale links.
+        with self._pool.write() as conn:
+            if self._packs is not None:
+                self._packs.write(key, bytes_)
+            self._bump_generation(conn)
+            source_id = self._maybe_insert_source(conn, key)
+            old_refs = {
+                Key.interned(*row[1:]): row[0]
+                for row in conn.execute(
+                    f"""select dest, {", ".join(_KEY_COLUMNS)} from links
+                    inner join destinations on links.dest=destinations.id
+                    where links.source=?""",
+                    (source_id,),
+                )
+            }
             params = []
-            for ref in added_refs:
-                params.append((source_id, self._maybe_insert_dest(ref), "debug"))
-
-            to_del = []
-            for ref in removed_refs:
-                to_del.append((source_id, self._maybe_insert_dest(ref)))
-            c3 = self.conn.cursor()
+            for ref in new_refs - old_refs.keys():
+                params.append((source_id, self._maybe_insert_dest(conn, ref), "debug"))
+
+            to_del = [
+                (source_id, dest_id)
+                for ref, dest_id in old_refs.items()
+                if ref not in new_refs
+            ]
+            c3 = conn.cursor()
             c3.executemany("insert or ignore into links values (NULL, ?,?,?)", params)
             c3.executemany("delete from links where source=? and dest=? ", to_del)
+            if params or to_del:
+                self._update_degrees(
+                    conn, source_id, [p[1] for p in params] + [d[1] for d in to_del]
+                )
+        if self.cache is not None:
+            self.cache.invalidate(key)
 
-    def glob(self, pattern) -> List[Key]:
-        acc = ""
-        for p in pattern:
-            if p is None:
-                acc += "/*"
-            else:
-                acc += "/" + p
-        acc = acc[1:]
-        try:
-            res = [
-                self._path_to_key(p)
-                for p in self._root.glob(acc)
-                if not p.name.endswith(".br")
-            ]  # !!
-        except Exception as e:
-            raise type(e)("Acc:" + acc, pattern)
+    def _update_degrees(self, conn, source_id: int, dest_ids: List[int]) -> None:
+        """
+        Recount the degrees of a document and of the destinations whose links
+        changed.
+        """
+        conn.execute(
+            """update documents set out_degree=(
+            select count(*) from links where source=?) where id=?""",
+            (source_id, source_id),
+        )
+        conn.executemany(
+            """update destinations set in_degree=(
+            select count(*) from links where dest=?) where id=?""",
+            [(d, d) for d in set(dest_ids)],
+        )
+
+    def put_pending(self, key: Key, targets: Iterable[str]) -> None:
+        """
+        Record the set of targets ``key`` refers to, but that could not be
+        resolved yet.
+
+        This replaces any previously recorded pending targets for ``key``; an
+        empty ``targets`` clears the queue for this document.
+
+        """
+        assert isinstance(key, Key)
+        with self._pool.write() as conn:
+            source_id = self._maybe_insert_source(conn, key)
+            c1 = conn.cursor()
+            c1.execute("delete from pending where source=?", (source_id,))
+            c1.executemany(
+                "insert or ignore into pending values (NULL, ?, ?, ?)",
+                [(source_id, t, pending_tail(t)) for t in set(targets)],
+            )
+
+    def put_navigation(self, rows: Iterable[Tuple[str, str, Key]]) -> None:
+        """
+        Replace the navigation table.
+
+        Parameters
+        ----------
+        rows : iterable of (parent, child, key)
+            ``child`` is the qualified name of a direct child of ``parent`` in
+            the hierarchy of known objects (``""`` for top level names), and
+            ``key`` the document describing it.
+
+        """
+        with self._pool.write() as conn:
+            conn.execute("delete from navigation")
+            conn.executemany(
+                "insert or replace into navigation values (NULL, ?, ?, ?, ?, ?, ?)",
+                [(parent, child, *key) for parent, child, key in rows],
+            )
+
+    def get_navigation(self, parents: List[str]) -> Dict[str, List[Tuple[str, Key]]]:
+        """
+        Return the sorted (child, key) of each of ``parents``, see
+        `put_navigation`.
+        """
+        res: Dict[str, List[Tuple[str, Key]]] = {p: [] for p in parents}
+        cur = self._pool.read().cursor()
+        for i in range(0, len(parents), _SQL_CHUNK):
+            chunk = parents[i : i + _SQL_CHUNK]
+            rows = cur.execute(
+                f"""
+            select parent, child, package, version, category, identifier
+            from navigation
+            where parent in ({",".join("?" * len(chunk))})
+            order by parent, child""",
+                chunk,
+            )
+            for parent, child, *k in rows:
+                res[parent].append((child, Key.interned(*k)))
+        return res
+
+    def get_pending(self, tails: Iterable[str]) -> Dict[Key, Set[str]]:
+        """
+        Return the pending targets whose last component is in ``tails``,
+        grouped by the document that refers to them.
+
+        This is meant as a cheap pre-filter: when new documents appear, only
+        the references that may point to them are reconsidered, instead of
+        rescanning the whole corpus.
+        """
+        tails = list(set(tails))
+        res: Dict[Key, Set[str]] = {}
+        cur = self._pool.read().cursor()
+        for i in range(0, len(tails), _SQL_CHUNK):
+            chunk = tails[i : i + _SQL_CHUNK]
+            rows = cur.execute(
+                f"""
+            select documents.package, documents.version, documents.category,
+                   documents.identifier, pending.target
+            from pending
+                inner join documents on pending.source=documents.id
+            where pending.tail in ({",".join("?" * len(chunk))})""",
+                chunk,
+            )
+            for *k, target in rows:
+                res.setdefault(Key.interned(*k), set()).add(target)
         return res
+
+    def iglob(self, pattern) -> Iterator[Key]:
+        """
+        Yield the keys of the stored documents matching ``pattern``.
+
+        Parameters
+        ----------
+        pattern : sequence
+            (package, version, kind, identifier), where ``None`` matches
+            anything, and other values can use glob syntax (``*``, ``?``,
+            ``[...]``). A pattern of length 2 yields the distinct
+            (package, version) tuples instead.
+
+        Notes
+        -----
+        This is answered from the documents table, and does not touch the
+        filesystem. The current thread reads from a consistent snapshot of the
+        database until the iterator is exhausted, so consume it (or use
+        `glob`) before relying on concurrent writes.
+        """
+        pattern = list(pattern)
+        assert len(pattern) in (2, 4), pattern
+        columns = _KEY_COLUMNS[: len(pattern)]
+        conds = []
+        params = []
+        for c, p in zip(columns, pattern):
+            if p is None:
+                continue
+            # plain equality lets sqlite use the composite indexes.
+            op = "GLOB" if _GLOB_CHARS.intersection(p) else "="
+            conds.append(f"{c} {op} ?")
+            params.append(p)
+        where = (" where " + " AND ".join(conds)) if conds else ""
+        distinct = "distinct " if len(pattern) == 2 else ""
+        rows = self._pool.read().execute(
+            f"select {distinct}{', '.join(columns)} from documents{where}", params
+        )
+        if len(pattern) == 2:
+            yield from rows
+        else:
+            for r in rows:
+                yield Key.interned(*r)
+
+    def glob(self, pattern) -> List[Key]:
+        """
+        List the keys of the stored documents matching ``pattern``, see `iglob`.
+        """
+        return list(self.iglob(pattern))
+
+    def to_packs(self) -> None:
+        """
+        Move all the documents of a one-file-per-document store into pack
+        files, and remove the original files.
+
+        The packs are written in a temporary directory, renamed to ``packs``
+        once complete, as the presence of ``packs`` switches a store to pack
+        storage; an interrupted migration leaves the store as it was.
+        """
+        assert self._packs is None, "Already using pack storage"
+        root = self._root.path
+        tmp = root / "packs.tmp"
+        if tmp.exists():
+            # left by an interrupted migration.
+            shutil.rmtree(tmp)
+        packs = PackStore(tmp, self._pool)
+        packs.clear()
+        migrated = []
+        for key in self.glob((None, None, None, None)):
+            packs.write(key, self._get(key))
+            migrated.append(self._key_to_path(key).path)
+        for module, version in self.glob((None, None)):
+            mp = self._meta_path(module, version)
+            if mp.exists():
+                packs.write_meta(module, version, mp.path.read_bytes())
+                migrated.append(mp.path)
+        packs.close()
+        os.replace(tmp, root / "packs")
+        self._packs = PackStore(root / "packs", self._pool)
+
+        dirs: Set[_Path] = set()
+        for path in migrated:
+            path.unlink()
+            dirs.update(p for p in path.parents if root in p.parents)
+        # deepest first, so that parents are empty when we get to them.
+        for d in sorted(dirs, key=lambda d: len(d.parts), reverse=True):
+            if not any(d.iterdir()):
+                d.rmdir()
+
+    def repack(self) -> None:
+        """
+        Store the documents in pack files.
+
+        Convert a one-file-per-document store with `to_packs`, or if already
+        using packs, rewrite them to drop overwritten records.
+        """
+        if self._packs is None:
+            self.to_packs()
+        else:
+            self._packs.compact()
+
+
+class AsyncGraphStore:
+    """
+    Async facade of a `GraphStore`, for trio applications.
+
+    GraphStore methods read files and query sqlite, which blocks the event
+    loop and stalls all the concurrent requests. Here each call runs in a
+    worker thread (see `trio.to_thread.run_sync`), and a limiter bounds the
+    number of threads doing so at the same time.
+
+    Parameters
+    ----------
+    store : GraphStore
+        the store to wrap.
+    max_threads : int
+        maximum number of concurrent worker threads.
+
+    """
+
+    def __init__(self, store: GraphStore, max_threads: int = 8):
+        self.store = store
+        self.limiter = trio.CapacityLimiter(max_threads)
+
+    async def run_sync(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run ``fn(*args, **kwargs)`` in a worker thread, for functions that do
+        several store accesses.
+        """
+        return await trio.to_thread.run_sync(
+            functools.partial(fn, *args, **kwargs), limiter=self.limiter
+        )
+
+    async def gather(self, fn: Callable, items: List[Any], *args) -> List[Any]:
+        """
+        Run ``fn(item, *args)`` for each of ``items`` concurrently in worker
+        threads, and return the results in the order of ``items``.
+        """
+        results: List[Any] = [None] * len(items)
+
+        async def one(i, item):
+            results[i] = await self.run_sync(fn, item, *args)
+
+        async with trio.open_nursery() as nursery:
+            for i, item in enumerate(items):
+                nursery.start_soon(one, i, item)
+        return results
+
+    async def get(self, key: Key) -> bytes:
+        return await self.run_sync(self.store.get, key)
+
+    async def get_many(self, keys: Iterable[Key]) -> List[bytes]:
+        """
+        Read several documents concurrently, in the order of ``keys``.
+        """
+        return await self.gather(self.store.get, list(keys))
+
+    async def get_meta(self, key: Key) -> bytes:
+        return await self.run_sync(self.store.get_meta, key)
+
+    async def get_decoded(self, key: Key, decode: Callable[[bytes], Any]) -> Any:
+        return await self.run_sync(self.store.get_decoded, key, decode)
+
+    async def get_decoded_many(
+        self, keys: Iterable[Key], decode: Callable[[bytes], Any]
+    ) -> List[Any]:
+        """
+        Read and decode several documents concurrently, in the order of
+        ``keys``.
+        """
+        return await self.gather(self.store.get_decoded, list(keys), decode)
+
+    async def get_meta_decoded(self, key: Key, decode: Callable[[bytes], Any]) -> Any:
+        return await self.run_sync(self.store.get_meta_decoded, key, decode)
+
+    async def get_all(self, key: Key):
+        return await self.run_sync(self.store.get_all, key)
+
+    async def get_backref(self, key: Key) -> Set[Key]:
+        return await self.run_sync(self.store.get_backref, key)
+
+    async def get_forwardrefs(self, key: Key) -> Set[Key]:
+        return await self.run_sync(self.store.get_forwardrefs, key)
+
+    async def get_backrefs_many(self, keys: Iterable[Key]) -> Dict[Key, Set[Key]]:
+        return await self.run_sync(self.store.get_backrefs_many, list(keys))
+
+    async def get_forwardrefs_many(self, keys: Iterable[Key]) -> Dict[Key, Set[Key]]:
+        return await self.run_sync(self.store.get_forwardrefs_many, list(keys))
+
+    async def get_degrees(self, keys: Iterable[Key]) -> Dict[Key, Tuple[int, int]]:
+        return await self.run_sync(self.store.get_degrees, list(keys))
+
+    async def glob(self, pattern) -> List[Key]:
+        return await self.run_sync(self.store.glob, pattern)
@@ -78,162 +78,257 @@ def get_type_hints(type_):
 
 
 def serialize(instance, annotation):
-    exception_already_desribed = False
+    """
+    Serialize ``instance`` according to ``annotation``.
+
+    The serializer of each annotation is built once, see `_serializer`.
+    """
     try:
-        if (annotation in base_types) and (isinstance(instance, annotation)):
-            return instance
-        elif getattr(annotation, "__origin__", None) is tuple and isinstance(
-            instance, tuple
-        ):
-            # this may be slightly incorrect as usually tuple as positionally type dependant.
-            inner_annotation = annotation.__args__
-            # assert len(inner_annotation) == 1, inner_annotation
-            return tuple(serialize(x, inner_annotation[0]) for x in instance)
-        elif getattr(annotation, "__origin__", None) is list and isinstance(
-            instance, list
-        ):
-            inner_annotation = annotation.__args__
-            # assert len(inner_annotation) == 1, inner_annotation
-            return [serialize(x, inner_annotation[0]) for x in instance]
-        elif getattr(annotation, "__origin__", None) is dict:
-            # assert type(instance) == dict
-            key_annotation, value_annotation = annotation.__args__
-            # assert key_annotation == str, key_annotation
-            return {k: serialize(v, value_annotation) for k, v in instance.items()}
-
-        elif getattr(annotation, "__origin__", None) is Union:
-            inner_annotation = annotation.__args__
-            if len(inner_annotation) == 2 and inner_annotation[1] == type(None):
-                # assert inner_annotation[0] is not None
-                # here we are optional; we _likely_ can avoid doing the union trick and store just the type, or null
-                if instance is None:
-                    return None
-                else:
-                    return serialize(instance, inner_annotation[0])
-            assert (
-                type(instance) in inner_annotation
-            ), f"{type(instance)} not in {inner_annotation}, {instance} or type {type(instance)}"
-            ma = [x for x in inner_annotation if type(instance) is x]
-            # assert len(ma) == 1
-            ann_ = ma[0]
-            return {"type": ann_.__name__, "data": serialize(instance, ann_)}
-        elif (
-            (type(annotation) is type)
-            and type.__module__ not in ("builtins", "typing")
-            and (instance.__class__.__name__ == getattr(annotation, "_name", None))
-            or type(instance) == annotation
-        ):
-            if hasattr(instance, "_validate"):
-                instance._validate()
-            data = {}
-            for k, v in get_type_hints(type(instance)).items():
-                try:
-                    data[k] = serialize(getattr(instance, k), v)
-                except Exception as e:
-                    exception_already_desribed = True
-                    raise type(e)(f"Error serializing field {k!r} of {instance!r}")
-            return data
-
-        else:
-            assert False, (
-                f"Error serializing {instance!r}\n, of type {type(instance)!r} "
-                f"expected  {annotation}, got {type(instance)}"
-            )
+        return _serializer(annotation)(instance)
     except Exception as e:
-        if exception_already_desribed:
-            raise
         raise type(e)(
             f"Error serialising {instance!r}, of type {type(instance)} "
             f"expecting {annotation}, got {type(instance)}"
         ) from e
 
 
+@lru_cache(None)
+def _serializer(annotation):
+    """
+    Function serializing instances of ``annotation``.
+
+    Annotations are inspected only once, when building the function, class
+    serializers look up the serializers of their fields on first use, so
+    recursive types are supported.
+    """
+    origin = getattr(annotation, "__origin__", None)
+    if annotation in base_types:
+
+        def serialize_base(instance):
+            if isinstance(instance, annotation):
+                return instance
+            return _serialize_unexpected(instance, annotation)
+
+        return serialize_base
+    elif origin is tuple:
+        # this may be slightly incorrect as usually tuple as positionally type dependant.
+        serialize_item = _serializer(annotation.__args__[0])
+
+        def serialize_tuple(instance):
+            if not isinstance(instance, tuple):
+                return _serialize_unexpected(instance, annotation)
+            return tuple(serialize_item(x) for x in instance)
+
+        return serialize_tuple
+    elif origin is list:
+        serialize_item = _serializer(annotation.__args__[0])
+
+        def serialize_list(instance):
+            if not isinstance(instance, list):
+                return _serialize_unexpected(instance, annotation)
+            return [serialize_item(x) for x in instance]
+
+        return serialize_list
+    elif origin is dict:
+        serialize_value = _serializer(annotation.__args__[1])
+
+        def serialize_dict(instance):
+            return {k: serialize_value(v) for k, v in instance.items()}
+
+        return serialize_dict
+    elif origin is Union:
+        inner_annotation = annotation.__args__
+        if len(inner_annotation) == 2 and inner_annotation[1] == type(None):
+            # here we are optional; we _likely_ can avoid doing the union trick and store just the type, or null
+            serialize_inner = _serializer(inner_annotation[0])
+
+            def serialize_optional(instance):
+                if instance is None:
+                    return None
+                return serialize_inner(instance)
+
+            return serialize_optional
+
+        # first matching alternative for each type.
+        alternatives = {}
+        for ann_ in reversed(inner_annotation):
+            alternatives[ann_] = (ann_.__name__, _serializer(ann_))
+
+        def serialize_union(instance):
+            try:
+                name, serialize_ann = alternatives[type(instance)]
+            except (KeyError, TypeError):
+                raise AssertionError(
+                    f"{type(instance)} not in {inner_annotation}, {instance} or type {type(instance)}"
+                ) from None
+            return {"type": name, "data": serialize_ann(instance)}
+
+        return serialize_union
+    elif isinstance(annotation, type):
+        return _class_serializer(annotation)
+
+    def serialize_other(instance):
+        return _serialize_unexpected(instance, annotation)
+
+    return serialize_other
+
+
+def _class_serializer(class_):
+    fields = None
+    validate = hasattr(class_, "_validate")
+
+    def serialize_class(instance):
+        nonlocal fields
+        if type(instance) != class_:
+            return _serialize_unexpected(instance, class_)
+        if validate:
+            instance._validate()
+        if fields is None:
+            fields = [(k, _serializer(v)) for k, v in get_type_hints(class_).items()]
+        data = {}
+        for k, serialize_field in fields:
+            try:
+                data[k] = serialize_field(getattr(instance, k))
+            except Exception as e:
+                raise type(e)(f"Error serializing field {k!r} of {instance!r}") from e
+        return data
+
+    return serialize_class
+
+
+def _serialize_unexpected(instance, annotation):
+    assert False, (
+        f"Error serializing {instance!r}\n, of type {type(instance)!r} "
+        f"expected  {annotation}, got {type(instance)}"
+    )
+
+
 # type_ and annotation are _likely_ duplicate here as an annotation is likely a type, or  a List, Union, ....)
 def deserialize(type_, annotation, data):
-    # assert type_ is annotation
-    # assert annotation != {}
-    # assert annotation is not dict
-    # assert annotation is not None, "None is handled by nullable types"
-    if annotation is str:
-        # assert isinstance(data, str)
-        return data
-    if annotation is int:
-        # assert isinstance(data, int)
-        return data
-    if annotation is bool:
-        # assert isinstance(data, bool)
-        return data
+    """
+    Deserialize ``data`` according to ``annotation``.
+
+    The deserializer of each annotation is built once, see `_deserializer`.
+    """
+    return _deserializer(annotation)(data)
+
+
+def _identity(data):
+    return data
+
+
+@lru_cache(None)
+def _deserializer(annotation):
+    """
+    Function deserializing data of ``annotation``, inverse of `_serializer`
+    for most types.
+
+    Unions also accept the internally tagged layout of `myst_serialiser`.
+    """
+    if annotation is str or annotation is int or annotation is bool:
+        return _identity
     orig = getattr(annotation, "__origin__", None)
-    if data is None:
-        return None
-    if orig:
-        if orig is tuple:
-            # assert isinstance(data, list)
-            inner_annotation = annotation.__args__
-            # assert len(inner_annotation) == 1, inner_annotation
-            return tuple(
-                deserialize(inner_annotation[0], inner_annotation[0], x) for x in data
-            )
-        elif orig is list:
-            # assert isinstance(data, list)
-            inner_annotation = annotation.__args__
-            # assert len(inner_annotation) == 1, inner_annotation
-            return [
-                deserialize(inner_annotation[0], inner_annotation[0], x) for x in data
-            ]
-        elif orig is dict:
-            # assert isinstance(data, dict)
-            _, value_annotation = annotation.__args__
-            return {
-                k: deserialize(value_annotation, value_annotation, x)
-                for k, x in data.items()
-            }
-        elif orig is Union:
-            inner_annotation = annotation.__args__
-            if len(inner_annotation) == 2 and inner_annotation[1] == type(None):
-                # assert inner_annotation[0] is not None
+    if orig is tuple:
+        deserialize_item = _deserializer(annotation.__args__[0])
+
+        def deserialize_tuple(data):
+            if data is None:
+                return None
+            return tuple(deserialize_item(x) for x in data)
+
+        return deserialize_tuple
+    elif orig is list:
+        deserialize_item = _deserializer(annotation.__args__[0])
+
+        def deserialize_list(data):
+            if data is None:
+                return None
+            return [deserialize_item(x) for x in data]
+
+        return deserialize_list
+    elif orig is dict:
+        deserialize_value = _deserializer(annotation.__args__[1])
+
+        def deserialize_dict(data):
+            if data is None:
+                return None
+            return {k: deserialize_value(x) for k, x in data.items()}
+
+        return deserialize_dict
+    elif orig is Union:
+        inner_annotation = annotation.__args__
+        if len(inner_annotation) == 2 and inner_annotation[1] == type(None):
+            deserialize_inner = _deserializer(inner_annotation[0])
+
+            def deserialize_optional(data):
                 if data is None:
                     return None
-                else:
-                    return deserialize(inner_annotation[0], inner_annotation[0], data)
-            real_type = [t for t in inner_annotation if t.__name__ == data["type"]]
-            if len(real_type) == 0:
-                myst_type = f"M{data['type'][0].upper()}{data['type'][1:]}"
-                if data["type"] == "mystComment":
-                    myst_type = "MComment"
-                elif data["type"] == "mystTarget":
-                    myst_type = "MTarget"
-                real_type = [t for t in inner_annotation if t.__name__ == myst_type]
-            # assert len(real_type) == 1, real_type
+                return deserialize_inner(data)
+
+            return deserialize_optional
+
+        # alternative by type name, the first one wins.
+        by_name = {}
+        for t in reversed(inner_annotation):
+            by_name[t.__name__] = t
+
+        def real_type(name):
+            if name in by_name:
+                return by_name[name]
+            myst_type = f"M{name[0].upper()}{name[1:]}"
+            if name == "mystComment":
+                myst_type = "MComment"
+            elif name == "mystTarget":
+                myst_type = "MTarget"
+            if myst_type in by_name:
+                return by_name[myst_type]
+            raise ValueError(f"No type matching {name!r} in {annotation}")
+
+        deserializers = {}
+
+        def deserialize_union(data):
+            if data is None:
+                return None
+            name = data["type"]
             try:
-                real_type = real_type[0]
-            except IndexError:
-                breakpoint()
+                deserialize_ = deserializers[name]
+            except KeyError:
+                deserialize_ = deserializers[name] = _deserializer(real_type(name))
             if data.get("data"):
                 data_ = data["data"]
             else:
                 data_ = {k: v for k, v in data.items() if k != "type"}
-            return deserialize(real_type, real_type, data_)
-        else:
-            assert False
-    elif (type(annotation) is type) and annotation.__module__ not in (
-        "builtins",
-        "typing",
+            return deserialize_(data_)
+
+        return deserialize_union
+    elif orig is None and (
+        isinstance(annotation, type)
+        and annotation.__module__ not in ("builtins", "typing")
     ):
-        loc = {}
-        new_ann = get_type_hints(annotation).items()
-        # assert new_ann
-        for k, v in new_ann:
-            # assert k in data.keys(), f"{k} not int {data.keys()}"
-            # if data[k] != 0:
-            #     assert data[k] != {}, f"{data}, {k}"
-            intermediate = deserialize(v, v, data[k])
-            # assert intermediate != {}, f"{v}, {data}, {k}"
-            loc[k] = intermediate
-        if hasattr(annotation, "_deserialise"):
-            return annotation._deserialise(**loc)
-        else:
-            return annotation(**loc)
+        return _class_deserializer(annotation)
+
+    def deserialize_other(data):
+        assert data is None, f"{annotation!r}, {data}"
+        return None
+
+    return deserialize_other
 
+
+def _class_deserializer(class_):
+    fields = None
+    if hasattr(class_, "_deserialise"):
+        construct = class_._deserialise
     else:
-        assert False, f"{annotation!r}, {data}"
+        construct = class_
+
+    def deserialize_class(data):
+        nonlocal fields
+        if data is None:
+            return None
+        if fields is None:
+            fields = [(k, _deserializer(v)) for k, v in get_type_hints(class_).items()]
+        return construct(
+            **{k: deserialize_field(data[k]) for k, deserialize_field in fields}
+        )
+
+    return deserialize_class
@@ -11,6 +11,7 @@ This is a prototype of serializer that respect this layout.
 """
 
 
+from functools import lru_cache
 from typing import Union
 from typing import get_type_hints as gth
 
@@ -18,55 +19,109 @@ base_types = {int, str, bool, type(None)}
 
 
 def serialize(instance, annotation):
+    """
+    Serialize ``instance`` according to ``annotation``, in the MyST layout.
+
+    The serializer of each annotation is built once, see `_serializer`.
+    """
+    return _serializer(annotation)(instance)
+
+
+def _type_tag(class_):
+    # the MyST type of the nodes, or the class name.
+    type_ = getattr(class_, "type", None)
+    if isinstance(type_, str):
+        return type_
+    return class_.__name__
+
+
+@lru_cache(None)
+def _serializer(annotation):
+    """
+    Function serializing instances of ``annotation``.
+
+    Annotations are inspected only once, when building the function, class
+    serializers look up the serializers of their fields on first use, so
+    recursive types are supported.
+    """
     if annotation in base_types:
-        # print("BASE", instance)
-        assert isinstance(instance, annotation), f"{instance} {annotation}"
-        return instance
+
+        def serialize_base(instance):
+            assert isinstance(instance, annotation), f"{instance} {annotation}"
+            return instance
+
+        return serialize_base
 
     origin = getattr(annotation, "__origin__", None)
     if origin is list:
-        assert isinstance(instance, origin)
-        inner_annotation = annotation.__args__
-        # assert len(inner_annotation) == 1, inner_annotation
-        return [serialize(x, inner_annotation[0]) for x in instance]
+        serialize_item = _serializer(annotation.__args__[0])
+
+        def serialize_list(instance):
+            assert isinstance(instance, list)
+            return [serialize_item(x) for x in instance]
+
+        return serialize_list
     if origin is dict:
-        assert isinstance(instance, origin)
-        key_annotation, value_annotation = annotation.__args__
-        # assert key_annotation == str, key_annotation
-        return {k: serialize(v, value_annotation) for k, v in instance.items()}
-    if getattr(annotation, "__origin__", None) is Union:
+        serialize_value = _serializer(annotation.__args__[1])
+
+        def serialize_dict(instance):
+            assert isinstance(instance, dict)
+            return {k: serialize_value(v) for k, v in instance.items()}
+
+        return serialize_dict
+    if origin is Union:
         inner_annotation = annotation.__args__
         if len(inner_annotation) == 2 and inner_annotation[1] == type(None):
-            # assert inner_annotation[0] is not None
             # here we are optional; we _likely_ can avoid doing the union trick and store just the type, or null
-            if instance is None:
-                return None
-            else:
-                return serialize(instance, inner_annotation[0])
-        assert (
-            type(instance) in inner_annotation
-        ), f"{type(instance)} not in {inner_annotation}, {instance} or type {type(instance)}"
-        ma = [x for x in inner_annotation if type(instance) is x]
-        # assert len(ma) == 1
-        ann_ = ma[0]
-        serialized_data = serialize(instance, ann_)
-        type_ = ann_.__name__
-        if hasattr(ann_, "type"):
-            type_ = ann_.type
-        if isinstance(serialized_data, dict):
-            return {**serialized_data, "type": type_}
-        return {"data": serialized_data, "type": type_}
-    if (
-        (type(annotation) is type)
-        and type.__module__ not in ("builtins", "typing")
-        and (instance.__class__.__name__ == getattr(annotation, "__name__", None))
-        or type(instance) == annotation
-    ):
-        data = {}
-        type_ = type(instance).__name__
-        if hasattr(instance, "type"):
-            type_ = instance.type
-        data["type"] = type_
-        for k, ann in gth(type(instance)).items():
-            data[k] = serialize(getattr(instance, k), ann)
+            serialize_inner = _serializer(inner_annotation[0])
+
+            def serialize_optional(instance):
+                if instance is None:
+                    return None
+                return serialize_inner(instance)
+
+            return serialize_optional
+
+        # first matching alternative for each type.
+        alternatives = {}
+        for ann_ in reversed(inner_annotation):
+            alternatives[ann_] = (_type_tag(ann_), _serializer(ann_))
+
+        def serialize_union(instance):
+            try:
+                type_, serialize_ann = alternatives[type(instance)]
+            except (KeyError, TypeError):
+                raise AssertionError(
+                    f"{type(instance)} not in {inner_annotation}, {instance} or type {type(instance)}"
+                ) from None
+            serialized_data = serialize_ann(instance)
+            if isinstance(serialized_data, dict):
+                return {**serialized_data, "type": type_}
+            return {"data": serialized_data, "type": type_}
+
+        return serialize_union
+    if isinstance(annotation, type):
+        return _class_serializer(annotation)
+
+    def serialize_other(instance):
+        return None
+
+    return serialize_other
+
+
+def _class_serializer(class_):
+    fields = None
+    type_ = _type_tag(class_)
+
+    def serialize_class(instance):
+        nonlocal fields
+        if type(instance) != class_:
+            return None
+        if fields is None:
+            fields = [(k, _serializer(ann)) for k, ann in gth(class_).items()]
+        data = {"type": type_}
+        for k, serialize_field in fields:
+            data[k] = serialize_field(getattr(instance, k))
         return data
+
+    return serialize_class
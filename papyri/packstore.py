@@ -0,0 +1,278 @@
+"""
+Packed storage backend for the GraphStore.
+
+Storing each document in its own file means a full scientific stack ends up
+as several hundred thousands of small files, which is slow to copy, backup,
+scan or glob.
+
+Here documents are appended to a few large *pack* files, and the location of
+each record (pack, offset, length) is kept in the sqlite database next to the
+links table. Records are compressed one by one, so that reading a document
+only requires decompressing this document, and packs are read via ``mmap``.
+
+Packs are append-only: overwriting a document appends a new record and
+updates the index, the old record becomes garbage until `PackStore.compact`
+is called.
+
+Compression uses ``zstandard`` when installed, and falls back to ``zlib``.
+The codec is recorded for each record so that stores stay readable whether or
+not ``zstandard`` is installed (except for records written with it).
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+
+RAW = 0
+ZLIB = 1
+ZSTD = 2
+
+# start a new pack once the current one is larger than this.
+PACK_SIZE = 256 * 1024 * 1024
+
+# below this size compression is not worth it.
+MIN_COMPRESS = 64
+
+
+class _Codecs(threading.local):
+    """
+    zstandard (de)compressors are not thread safe, keep one per thread.
+    """
+
+    def __init__(self):
+        if zstandard is not None:
+            self.cctx = zstandard.ZstdCompressor(level=3)
+            self.dctx = zstandard.ZstdDecompressor()
+
+
+_codecs = _Codecs()
+
+
+def compress(data: bytes) -> Tuple[int, bytes]:
+    """
+    Compress ``data`` with the best available codec.
+
+    Return the codec used and the compressed bytes; data that does not shrink
+    (typically images) is stored as is.
+    """
+    if len(data) < MIN_COMPRESS:
+        return RAW, data
+    if zstandard is not None:
+        codec, comp = ZSTD, _codecs.cctx.compress(data)
+    else:
+        codec, comp = ZLIB, zlib.compress(data, 6)
+    if len(comp) >= len(data):
+        return RAW, data
+    return codec, comp
+
+
+def decompress(codec: int, data: bytes) -> bytes:
+    if codec == RAW:
+        return data
+    if codec == ZLIB:
+        return zlib.decompress(data)
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError(
+                "This record is zstd compressed, please install zstandard"
+            )
+        return _codecs.dctx.decompress(data)
+    raise ValueError(f"Unknown codec {codec}")
+
+
+class PackStore:
+    """
+    Append-only packs of compressed records, indexed in sqlite.
+
+    Parameters
+    ----------
+    root : Path
+        directory in which the pack files are stored.
+    pool : ConnectionPool
+        connections to the database holding the index.
+
+    """
+
+    def __init__(self, root: Path, pool):
+        self._root = root
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._pool = pool
+        self._lock = threading.Lock()
+        self._maps: Dict[int, mmap.mmap] = {}
+        with self._pool.write() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS blobs(
+                id INTEGER PRIMARY KEY,
+                package TEXT NOT NULL,
+                version TEXT NOT NULL,
+                category TEXT NOT NULL,
+                identifier TEXT NOT NULL,
+                pack INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                codec INTEGER NOT NULL,
+                unique(package, version, category, identifier))
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS metas(
+                id INTEGER PRIMARY KEY,
+                package TEXT NOT NULL,
+                version TEXT NOT NULL,
+                pack INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                codec INTEGER NOT NULL,
+                unique(package, version))
+                """
+            )
+
+        packs = self._packs()
+        self._current = packs[-1] if packs else 0
+
+    def _packs(self) -> List[int]:
+        return sorted(
+            int(p.name[5:-5]) for p in self._root.glob("pack-*.pack") if p.is_file()
+        )
+
+    def _pack_path(self, n: int) -> Path:
+        return self._root / f"pack-{n:05d}.pack"
+
+    def _append(self, data: bytes) -> Tuple[int, int, int, int]:
+        codec, comp = compress(data)
+        with self._lock:
+            path = self._pack_path(self._current)
+            if path.exists() and path.stat().st_size > PACK_SIZE:
+                self._current += 1
+                path = self._pack_path(self._current)
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(comp)
+            pack = self._current
+        return pack, offset, len(comp), codec
+
+    def _read(self, pack: int, offset: int, length: int, codec: int) -> bytes:
+        m = self._maps.get(pack)
+        if m is None or offset + length > len(m):
+            # pack is new, or has grown since we mapped it.
+            with self._lock:
+                # the previous map may still be in use by another thread,
+                # let it be garbage collected instead of closing it.
+                with open(self._pack_path(pack), "rb") as f:
+                    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[pack] = m
+        return decompress(codec, m[offset : offset + length])
+
+    def _location(self, table: str, where: str, params: Sequence[str]):
+        rows = (
+            self._pool.read()
+            .execute(
+                f"select pack, offset, length, codec from {table} where {where}",
+                params,
+            )
+            .fetchall()
+        )
+        if not rows:
+            raise FileNotFoundError(params)
+        [row] = rows
+        return row
+
+    def read(self, key) -> bytes:
+        return self._read(
+            *self._location(
+                "blobs",
+                "package=? AND version=? AND category=? AND identifier=?",
+                list(key),
+            )
+        )
+
+    def exists(self, key) -> bool:
+        return bool(
+            self._pool.read()
+            .execute(
+                """select 1 from blobs where
+                package=? AND version=? AND category=? AND identifier=?""",
+                list(key),
+            )
+            .fetchall()
+        )
+
+    def write(self, key, data: bytes) -> None:
+        loc = self._append(data)
+        with self._pool.write() as conn:
+            conn.execute(
+                "insert or replace into blobs values (NULL, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [*key, *loc],
+            )
+
+    def delete(self, key) -> None:
+        with self._pool.write() as conn:
+            conn.execute(
+                """delete from blobs where
+                package=? AND version=? AND category=? AND identifier=?""",
+                list(key),
+            )
+
+    def read_meta(self, module: str, version: str) -> bytes:
+        return self._read(
+            *self._location("metas", "package=? AND version=?", [module, version])
+        )
+
+    def write_meta(self, module: str, version: str, data: bytes) -> None:
+        loc = self._append(data)
+        with self._pool.write() as conn:
+            conn.execute(
+                "insert or replace into metas values (NULL, ?, ?, ?, ?, ?, ?)",
+                [module, version, *loc],
+            )
+
+    def clear(self) -> None:
+        """
+        Remove all the records from the index.
+        """
+        with self._pool.write() as conn:
+            conn.execute("delete from blobs")
+            conn.execute("delete from metas")
+
+    def compact(self) -> None:
+        """
+        Rewrite all live records into new packs, and remove the old ones.
+        """
+        old = self._packs()
+        self._current = (old[-1] + 1) if old else 0
+        with self._pool.write() as conn:
+            blobs = conn.execute(
+                "select id, pack, offset, length, codec from blobs"
+            ).fetchall()
+            metas = conn.execute(
+                "select id, pack, offset, length, codec from metas"
+            ).fetchall()
+            for table, rows in [("blobs", blobs), ("metas", metas)]:
+                for id_, *loc in rows:
+                    pack, offset, length, codec = self._append(self._read(*loc))
+                    conn.execute(
+                        f"update {table} set pack=?, offset=?, length=?, codec=? where id=?",
+                        (pack, offset, length, codec, id_),
+                    )
+        self.close()
+        for n in old:
+            os.unlink(self._pack_path(n))
+
+    def close(self) -> None:
+        with self._lock:
+            for m in self._maps.values():
+                m.close()
+            self._maps = {}
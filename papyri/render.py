@@ -1,33 +1,51 @@
 import builtins
+import compileall
+import copy
+import hashlib
+import heapq
 import math
+import mimetypes
+import multiprocessing
 import json
 import logging
 import operator
 import os
-import random
 import shutil
+import threading
 import uuid
 from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
-from functools import lru_cache
+from functools import lru_cache, wraps
 from pathlib import Path
-from typing import Optional, Set, Any, Dict, List, Callable, Tuple
+from typing import Optional, Set, Any, Dict, List, Callable, NamedTuple, Tuple
 
 from flatlatex import converter
-from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+import jinja2
+from jinja2 import (
+    ChoiceLoader,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    ModuleLoader,
+    StrictUndefined,
+    select_autoescape,
+)
 from pygments.formatters import HtmlFormatter
-from quart import send_from_directory, Response, redirect
+from quart import send_from_directory, request, Response, redirect
 from quart_trio import QuartTrio
 from rich.logging import RichHandler
 import minify_html
+import trio
 
 from . import config as default_config
 from . import take2
-from .config import ingest_dir
+from .config import cache_dir, ingest_dir
+from .compress import compress_tree
 from .crosslink import IngestedBlobs, find_all_refs
-from .graphstore import GraphStore, Key
+from .graphstore import AsyncGraphStore, GraphStore, Key
 from .myst_ast import MLink, MText
-from .take2 import RefInfo, encoder, Section
+from .take2 import LazyNode, RefInfo, encoder, Section
 from .tree import TreeReplacer, TreeVisitor
 from .utils import progress, dummy_progress
 
@@ -41,6 +59,16 @@ log = logging.getLogger("papyri")
 
 CSS_DATA = HtmlFormatter(style="pastie").get_style_defs(".highlight")
 
+# approximate size (as encoded bytes) of the decoded documents kept in memory
+# when rendering, see `GraphStore.get_decoded`.
+DECODED_CACHE_SIZE = 64 * 1024 * 1024
+
+# number of local graphs (as json) kept in memory by `HtmlRenderer.graph_json`.
+GRAPH_CACHE_SIZE = 1024
+
+# maximum size of the rendered pages kept in memory by `serve`.
+RESPONSE_CACHE_SIZE = 64 * 1024 * 1024
+
 
 def minify(s):
     return minify_html.minify(
@@ -63,6 +91,127 @@ class CleanLoader(FileSystemLoader):
         return until_ruler(source), filename, uptodate
 
 
+class _BytecodeCache(FileSystemBytecodeCache):
+    """
+    Bytecode cache writing atomically, render workers share the same cache
+    directory.
+    """
+
+    def dump_bytecode(self, bucket) -> None:
+        name = self._get_cache_filename(bucket)
+        tmp = f"{name}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            bucket.write_bytecode(f)
+        os.replace(tmp, name)
+
+
+TEMPLATES_DIR = os.path.dirname(__file__)
+
+# where `compile_templates` writes the precompiled html templates.
+COMPILED_TEMPLATES_DIR = cache_dir / "templates"
+
+
+# options of the html environment, that change the compiled templates.
+HTML_ENV_OPTIONS: Dict[str, Any] = {
+    "trim_blocks": True,
+    "lstrip_blocks": True,
+    "extensions": [],
+}
+# extensions of the templates with autoescaping, see `select_autoescape`.
+HTML_AUTOESCAPE = ("html", "tpl.j2")
+
+
+def _templates_digest() -> str:
+    h = hashlib.sha256(jinja2.__version__.encode())
+    h.update(repr((sorted(HTML_ENV_OPTIONS.items()), HTML_AUTOESCAPE)).encode())
+    for t in sorted(Path(TEMPLATES_DIR).glob("*.j2")):
+        h.update(t.name.encode())
+        h.update(t.read_bytes())
+    return h.hexdigest()
+
+
+def template_env(loader, name: str, *, dev: bool = False, **options) -> Environment:
+    """
+    Jinja environment for the templates of papyri.
+
+    Parameters
+    ----------
+    loader : BaseLoader
+        loader of the templates.
+    name : str
+        name of the bytecode cache of this environment, environments with
+        different options or loaders must use different names.
+    dev : bool
+        when developing the templates; reload the templates when they change,
+        and do not cache the compiled templates. Otherwise templates are
+        compiled once, and their bytecode is cached on disk for the next
+        processes.
+    **options
+        passed to `jinja2.Environment`.
+
+    """
+    if dev:
+        return Environment(loader=loader, auto_reload=True, **options)
+    directory = cache_dir / f"jinja-{jinja2.__version__}" / name
+    directory.mkdir(parents=True, exist_ok=True)
+    return Environment(
+        loader=loader,
+        auto_reload=False,
+        bytecode_cache=_BytecodeCache(str(directory)),
+        **options,
+    )
+
+
+def _html_env(
+    dev: bool = False, compiled: Optional[Path] = COMPILED_TEMPLATES_DIR
+) -> Environment:
+    """
+    Environment of the html templates, using the templates precompiled in
+    ``compiled`` if they are up to date.
+    """
+    loader: jinja2.BaseLoader = FileSystemLoader(TEMPLATES_DIR)
+    if not dev and compiled is not None:
+        stamp = compiled / "digest"
+        if stamp.exists() and stamp.read_text() == _templates_digest():
+            loader = ChoiceLoader([ModuleLoader(str(compiled)), loader])
+    return template_env(
+        loader,
+        "html",
+        dev=dev,
+        autoescape=select_autoescape(HTML_AUTOESCAPE),
+        undefined=StrictUndefined,
+        **HTML_ENV_OPTIONS,
+    )
+
+
+def compile_templates(target: Path = COMPILED_TEMPLATES_DIR) -> int:
+    """
+    Compile the html templates to python modules in ``target``, that are used
+    instead of the templates until they change.
+
+    Return the number of compiled templates.
+    """
+    target.mkdir(parents=True, exist_ok=True)
+    for old in target.glob("tmpl_*.py"):
+        old.unlink()
+    env = _html_env(dev=True)
+    names = env.list_templates(extensions=["j2"])
+    env.compile_templates(str(target), zip=None, filter_func=names.__contains__)
+    # and to python bytecode, in case bytecode is not written on import.
+    compileall.compile_dir(str(target), quiet=1)
+    (target / "digest").write_text(_templates_digest())
+    return len(names)
+
+
+def _is_blob(obj) -> bool:
+    """
+    Whether ``obj`` is an `IngestedBlobs`, possibly lazily decoded.
+    """
+    if isinstance(obj, LazyNode):
+        return obj._type is IngestedBlobs
+    return isinstance(obj, IngestedBlobs)
+
+
 def until_ruler(doc):
     """
     Utilities to clean jinja template;
@@ -195,20 +344,145 @@ def cs2(ref, tree, ref_map):
     return siblings
 
 
+def navigation(ref: str, store: GraphStore) -> Optional[OrderedDict]:
+    """
+    Siblings of ``ref`` at each level of its qualified name, for the
+    navigation menu, read from the navigation table materialized at ingest
+    time (see `crosslink.build_navigation`).
+
+    This gives the same result as `cs2`, but does not depend on the size of
+    the corpus.
+
+    Return None if the navigation has not been materialized (stores ingested
+    before it existed), `papyri relink` fixes that.
+    """
+    parts = ref.split(".") + ["+"]
+    parents = [".".join(parts[:i]) for i in range(len(parts))]
+    nav = store.get_navigation(parents)
+    if not nav[""]:
+        return None
+    siblings = OrderedDict()
+    for p, parent in zip(parts, parents):
+        children = nav[parent]
+        if not children:
+            break
+        siblings[p] = [(RefInfo(*k), c.split(".")[-1]) for c, k in children]
+    return siblings
+
+
+def compute_parts_links(siblings) -> Dict[str, str]:
+    """
+    Links of the breadcrumbs, the qualified name up to each part.
+    """
+    parts_links = {}
+    acc = ""
+    for k in siblings.keys():
+        acc += k
+        parts_links[k] = acc
+        acc += "."
+    return parts_links
+
+
+class BuildManifest:
+    """
+    Record of the files written by a static build, with a digest of the
+    inputs of each page, to only rewrite the pages whose inputs changed on
+    the next build.
+
+    Parameters
+    ----------
+    root : Path
+        root directory of the build, where the manifest is stored.
+    salt : str
+        digest of the inputs common to all the pages (templates, rendering
+        options...), changing it invalidates all the pages.
+
+    """
+
+    FILENAME = ".papyri-manifest.json"
+
+    def __init__(self, root: Path, salt: str):
+        self.root = root
+        self.path = root / self.FILENAME
+        self.salt = salt
+        self.old: Dict[str, str] = {}
+        try:
+            data = json.loads(self.path.read_text())
+            self.old = data["files"]
+            old_salt = data["salt"]
+        except (FileNotFoundError, ValueError, KeyError):
+            old_salt = None
+        # files of the previous build, for `remove_stale`, even when a change
+        # of salt invalidates their digests.
+        self.old_files = set(self.old)
+        if old_salt != salt:
+            self.old = {}
+        self.new: Dict[str, str] = {}
+
+    def digest(self, *inputs) -> str:
+        h = hashlib.sha256(self.salt.encode())
+        for i in inputs:
+            h.update(i if isinstance(i, bytes) else repr(i).encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def up_to_date(self, path: Path, digest: str) -> bool:
+        """
+        Record that ``path`` is produced from inputs with the given digest,
+        and return whether it is already up to date.
+        """
+        rel = path.relative_to(self.root).as_posix()
+        self.new[rel] = digest
+        return self.old.get(rel) == digest and path.exists()
+
+    def record(self, path: Path) -> None:
+        """
+        Record a file that is written on every build.
+        """
+        self.new[path.relative_to(self.root).as_posix()] = ""
+
+    def remove_stale(self) -> List[str]:
+        """
+        Delete the files of the previous build that were not produced by this
+        one, typically pages of documents that have been removed.
+        """
+        stale = sorted(self.old_files - set(self.new))
+        for rel in stale:
+            (self.root / rel).unlink(missing_ok=True)
+        return stale
+
+    def save(self) -> None:
+        self.path.write_text(json.dumps({"salt": self.salt, "files": self.new}))
+
+
+def _build_salt(config, graph: bool, prefix: str) -> str:
+    """
+    Digest of the inputs shared by all the pages of a static build.
+    """
+    from . import __version__
+
+    h = hashlib.sha256(f"{__version__}{config!r}{graph}{prefix}".encode())
+    for t in sorted(Path(os.path.dirname(__file__)).glob("*.j2")):
+        h.update(t.read_bytes())
+    return h.hexdigest()
+
+
 class HtmlRenderer:
-    def __init__(self, store: GraphStore, *, sidebar, prefix, trailing_html):
+    def __init__(self, store: GraphStore, *, sidebar, prefix, trailing_html, dev=False):
         assert prefix.startswith("/")
         assert prefix.endswith("/")
         self.progress = progress
         self.store = store
-        self.env = Environment(
-            loader=FileSystemLoader(os.path.dirname(__file__)),
-            autoescape=select_autoescape(["html", "tpl.j2"]),
-            undefined=StrictUndefined,
-        )
-
-        self.env.trim_blocks = True
-        self.env.lstrip_blocks = True
+        # handlers go through the async facade, to not block the event loop
+        # on file reads and database queries when serving.
+        self.astore = AsyncGraphStore(store)
+        # set for incremental static builds.
+        self.manifest: Optional[BuildManifest] = None
+        # local graphs by key, valid for the store data version.
+        self._graphs: OrderedDict[Key, str] = OrderedDict()
+        self._graphs_version: Optional[Tuple[int, int]] = None
+        self._graphs_lock = threading.Lock()
+        self.env = _html_env(dev)
         self.prefix = prefix
         extension = ".html" if trailing_html else ""
         self.resolver = Resolver(store, prefix, extension)
@@ -220,88 +494,60 @@ class HtmlRenderer:
         self.env.globals["dothtml"] = extension
         self.env.globals["uuid"] = lambda: uuid.uuid4().hex
 
-    def compute_graph(
-        self, backrefs: Set[Key], refs: Set[Key], key: Key
-    ) -> Dict[Any, Any]:
+    def compute_graph(self, key: Key) -> Dict[str, List[Any]]:
         """
-
         Compute local reference graph for a given item, and return a usefull
         representation to show a d3 graph in javascript
 
-        backrefs:
-            list of backreferences
-        refs:
-            list of forward references
-        keys:
-            current iten
+        The graph is made of the neighbors of ``key`` and the links pointing
+        to them, capped to the 50 neighbors with the highest in degree.
 
-        """
-        weights = {}
-        assert isinstance(backrefs, set)
-        for b in backrefs:
-            assert isinstance(b, Key)
-        assert isinstance(refs, set)
-        for f in refs:
-            assert isinstance(f, Key)
-
-        all_nodes = set(backrefs).union(set(refs))
-
-        raw_edges = []
-        for k in set(all_nodes):
-            name = k.path
-            neighbors_refs = self.store.get_backref(k)
-            weights[name] = len(neighbors_refs)
-            orig = [x.path for x in neighbors_refs]
-            all_nodes = all_nodes.union(neighbors_refs)
-            for o in orig:
-                raw_edges.append((k.path, o))
+        key:
+            current item
 
-        data: Dict[str, List[Any]] = {"nodes": [], "links": []}
+        """
+        degrees, neighbors = self.store.get_neighborhood(key)
+
+        weights: Dict[str, int] = {}
+        by_path: Dict[str, List[Key]] = defaultdict(list)
+        raw_edges = set()
+        for k in sorted(neighbors):
+            weights[k.path] = degrees[k]
+            for o in neighbors[k]:
+                raw_edges.add((k.path, o.path))
+            for n in [k, *neighbors[k]]:
+                if "??" not in n:
+                    by_path[n.path].append(n)
 
         if len(weights) > 50:
-            for thresh in sorted(set(weights.values())):
-                log.debug("%s items ; remove items %s or lower", len(weights), thresh)
-                weights = {k: v for k, v in weights.items() if v > thresh}
-                log.debug("down to %s items", len(weights))
-                if len(weights) < 50:
-                    break
-
-        all_nodes = set(all_nodes)
-        nums_ = set()
-        edges = list(raw_edges)
-        nodes = list(set(weights.keys()))
-        for a, b in edges:
-            if (a not in nodes) or (b not in nodes):
-                continue
-            nums_.add(a)
-            nums_.add(b)
+            # keep the nodes with a weight strictly above the 50th highest.
+            cut = heapq.nlargest(50, weights.values())[-1]
+            weights = {k: v for k, v in weights.items() if v > cut}
+
+        data: Dict[str, List[Any]] = {"nodes": [], "links": []}
+        nodes = sorted(weights)
         nums = {x: i for i, x in enumerate(nodes, start=1)}
 
-        for i, (from_, to) in enumerate(edges):
+        for i, (from_, to) in enumerate(sorted(raw_edges)):
             if from_ == to:
                 continue
-            if from_ not in nodes:
-                continue
-            if to not in nodes:
+            if from_ not in nums or to not in nums:
                 continue
-            if key[3] in (to, from_):
+            if key.path in (to, from_):
                 continue
             data["links"].append({"source": nums[from_], "target": nums[to], "id": i})
 
         for node in nodes:
-            diam = 8.0
-            if node == key[3]:
+            if node == key.path:
                 continue
-                diam = 18.0
-            elif node in weights:
-                diam = 8.0 + math.sqrt(weights[node])
+            diam = 8.0 + math.sqrt(weights[node])
 
-            candidates = [n for n in all_nodes if n[3] == node and "??" not in n]
+            candidates = by_path.get(node)
             if not candidates:
                 uu = None
             else:
                 # TODO : be smarter when we have multiple versions. Here we try to pick the latest one.
-                latest_version: Key = list(sorted(candidates))[-1]
+                latest_version: Key = max(candidates)
                 uu = self.resolver.resolve(RefInfo.from_untrusted(*latest_version))
 
             data["nodes"].append(
@@ -315,13 +561,45 @@ class HtmlRenderer:
             )
         return data
 
+    def graph_json(self, key: Key) -> str:
+        """
+        `compute_graph` of ``key`` as json, cached until the links in the
+        store change.
+        """
+        version = self.store.data_version()
+        with self._graphs_lock:
+            if version != self._graphs_version:
+                self._graphs.clear()
+                self._graphs_version = version
+            if key in self._graphs:
+                self._graphs.move_to_end(key)
+                return self._graphs[key]
+        data = json.dumps(self.compute_graph(key))
+        with self._graphs_lock:
+            if version == self._graphs_version:
+                self._graphs[key] = data
+                if len(self._graphs) > GRAPH_CACHE_SIZE:
+                    self._graphs.popitem(last=False)
+        return data
+
+    def graph_url(self, key: Key) -> str:
+        return f"{self.prefix}{key.module}/{key.version}/graph/{key.path}.json"
+
+    async def graph(self, package, version, ref) -> Response:
+        data = await self.astore.run_sync(
+            self.graph_json, Key(package, version, "module", ref)
+        )
+        return Response(data, mimetype="application/json")
+
     async def index(self):
-        keys = self.store.glob((None, None, "meta", "aliases.cbor"))
+        keys = await self.astore.glob((None, None, "meta", "aliases.cbor"))
         libraries = {}
         from packaging.version import parse
 
-        for k in keys:
-            meta = encoder.decode(self.store.get_meta(k))
+        metas = await self.astore.gather(
+            self.store.get_meta_decoded, keys, encoder.decode
+        )
+        for k, meta in zip(keys, metas):
             if k.module in libraries:
                 libraries[k.module][1].append(k.version)
             else:
@@ -334,27 +612,42 @@ class HtmlRenderer:
 
         return self.env.get_template("index.tpl.j2").render(data=data)
 
+    async def img(self, package, version, subpath=None) -> Response:
+        data = await self.astore.get(Key(package, version, "assets", subpath))
+        mimetype, _ = mimetypes.guess_type(subpath)
+        return Response(data, mimetype=mimetype or "application/octet-stream")
+
     async def _write_index(self, html_dir):
         if html_dir:
             (html_dir / "index.html").write_text(await self.index())
+            if self.manifest is not None:
+                self.manifest.record(html_dir / "index.html")
 
     async def virtual(self, module, node):
         if module == "*":
             module = None
-        items = list(self.store.glob((module, None, None, None)))
+        items = [
+            it
+            for it in await self.astore.glob((module, None, None, None))
+            if it.kind not in ("assets", "examples", "meta")
+        ]
 
-        visitor = TreeVisitor([getattr(take2, node)])
-        acc = []
-        for it in items:
-            if it.kind in ("assets", "examples", "meta"):
-                continue
-            data = self.store.get(it)
+        def decode(it):
             try:
-                obj = encoder.decode(data)
+                # only the content and arbitrary sections are needed.
+                return self.store.get_decoded(it, encoder.decode_lazy)
             except Exception:
                 print("Decode exception", it)
+                return None
+
+        objs = await self.astore.gather(decode, items)
+
+        visitor = TreeVisitor([getattr(take2, node)])
+        acc = []
+        for it, obj in zip(items, objs):
+            if obj is None:
                 continue
-            if not isinstance(obj, IngestedBlobs):
+            if not _is_blob(obj):
                 print("SKIP", it)
                 continue
             lacc = []
@@ -404,9 +697,10 @@ class HtmlRenderer:
                 (config.output_dir / module / version / "gallery").mkdir(
                     parents=True, exist_ok=True
                 )
-                (
-                    config.output_dir / module / version / "gallery" / "index.html"
-                ).write_text(data)
+                tfile = config.output_dir / module / version / "gallery" / "index.html"
+                tfile.write_text(data)
+                if self.manifest is not None:
+                    self.manifest.record(tfile)
 
     async def gallery(self, package, version, ext=""):
         if package == version == "*":
@@ -415,24 +709,23 @@ class HtmlRenderer:
         figmap = defaultdict(lambda: [])
         assert isinstance(self.store, GraphStore)
         if package is not None:
-            meta = encoder.decode(
-                self.store.get_meta(Key(package, version, None, None))
+            meta = await self.astore.get_meta_decoded(
+                Key(package, version, None, None), encoder.decode
             )
         else:
             meta = {"logo": None}
         logo = meta["logo"]
-        res = self.store.glob((package, version, "assets", None))
+        res = await self.astore.glob((package, version, "assets", None))
         backrefs = set()
-        for key in res:
-            brs = {tuple(x) for x in self.store.get_backref(key)}
-            backrefs = backrefs.union(brs)
+        for brs in (await self.astore.get_backrefs_many(res)).values():
+            backrefs.update(tuple(x) for x in brs)
 
-        for key in backrefs:
-            data = encoder.decode(self.store.get(Key(*key)))
-            if "examples" in key:
-                continue
+        backrefs_list = [Key(*key) for key in backrefs if "examples" not in key]
+        # only the example sections are needed.
+        blobs = await self.astore.get_decoded_many(backrefs_list, encoder.decode_lazy)
+        for key, data in zip(backrefs_list, blobs):
             # TODO: examples can actuallly be just Sections.
-            assert isinstance(data, IngestedBlobs)
+            assert _is_blob(data), key
             i = data
 
             for k in [
@@ -445,10 +738,9 @@ class HtmlRenderer:
                 # figmap.append((impath, link, name)
                 figmap[package].append((impath, link, _path))
 
-        glist = self.store.glob((package, version, "examples", None))
-        for target_key in glist:
-            section = encoder.decode(self.store.get(target_key))
-
+        glist = await self.astore.glob((package, version, "examples", None))
+        sections = await self.astore.get_decoded_many(glist, encoder.decode)
+        for target_key, section in zip(glist, sections):
             for k in [
                 u.value for u in section.children if u.__class__.__name__ == "Fig"
             ]:
@@ -464,7 +756,7 @@ class HtmlRenderer:
             pass
 
         doc = D()
-        pap_keys = self.store.glob((None, None, "meta", "papyri.cbor"))
+        pap_keys = await self.astore.glob((None, None, "meta", "papyri.cbor"))
         parts = {package: []}
         for pk in pap_keys:
             mod, ver, kind, identifier = pk
@@ -482,15 +774,17 @@ class HtmlRenderer:
         )
 
     async def _get_toc_for(self, package, version):
-        keys = self.store.glob((package, version, "meta", "toc.cbor"))
+        keys = await self.astore.glob((package, version, "meta", "toc.cbor"))
         assert len(keys) == 1
-        data = self.store.get(keys[0])
+        data = await self.astore.get(keys[0])
         return encoder.decode(data)
 
     async def _list_narative(self, package: str, version: str, ext=""):
         toctrees = await self._get_toc_for(package, version)
 
-        meta = encoder.decode(self.store.get_meta(Key(package, version, None, None)))
+        meta = await self.astore.get_meta_decoded(
+            Key(package, version, None, None), encoder.decode
+        )
         logo = meta["logo"]
 
         class D:
@@ -518,7 +812,7 @@ class HtmlRenderer:
         backrefs,
         parts=(),
         parts_links=(),
-        graph="{}",
+        graph=None,
         meta,
         toctrees,
     ):
@@ -540,8 +834,8 @@ class HtmlRenderer:
             This is not directly related to current object.
         parts_links : <Insert Type here>
             <Multiline Description Here>
-        graph : <Insert Type here>
-            <Multiline Description Here>
+        graph : str, optional
+            url of the json of the local reference graph, see `graph_json`.
         logo : <Insert Type here>
             <Multiline Description Here>
 
@@ -565,9 +859,10 @@ class HtmlRenderer:
             backrefs = (backrefs, None)
 
         try:
-            for k, v in doc.content.items():
-                doc.content[k] = self.LR.visit(v)
-
+            # doc may be shared by the store cache, do not modify it in place.
+            doc = copy.copy(doc)
+            self.resolver.refresh()
+            doc.content = {k: self.LR.visit(v) for k, v in doc.content.items()}
             doc.arbitrary = [self.LR.visit(x) for x in doc.arbitrary]
             return template.render(
                 current_type=current_type,
@@ -592,9 +887,8 @@ class HtmlRenderer:
         """
         # return "Not Implemented"
         key = Key(package, version, "docs", ref)
-        bytes = self.store.get(key)
-        doc_blob = encoder.decode(bytes)
-        meta = encoder.decode(self.store.get_meta(key))
+        doc_blob = await self.astore.get_decoded(key, encoder.decode)
+        meta = await self.astore.get_meta_decoded(key, encoder.decode)
         # return "OK"
 
         template = self.env.get_template("html.tpl.j2")
@@ -623,7 +917,10 @@ class HtmlRenderer:
         for t in toctrees:
             open_toctree(t, ref)
 
-        return self.render_one(
+        # link resolution queries the store, and rendering is the slowest part
+        # of a request, do both in a worker thread.
+        return await self.astore.run_sync(
+            self.render_one,
             current_type="docs",
             meta=meta,
             template=template,
@@ -632,11 +929,11 @@ class HtmlRenderer:
             parts={package: [], ref: []},
             parts_links={},
             backrefs=[],
-            graph="{}",
+            graph=None,
             toctrees=toctrees,
         )
 
-    async def _route_data(self, ref, version, known_refs):
+    async def _route_data(self, ref, version):
         ref = ref.split("/")[0]
         if ":" in ref:
             modroot, _ = ref.split(":")
@@ -645,10 +942,10 @@ class HtmlRenderer:
 
         root = modroot.split(".")[0]
         key = Key(root, version, "module", ref)
-        gbytes, backward, forward = self.store.get_all(key)
-        x_, y_ = find_all_refs(self.store)
-        doc_blob = encoder.decode(gbytes)
-        return x_, y_, doc_blob, backward, forward
+        doc_blob = await self.astore.get_decoded(key, encoder.decode)
+        backward = await self.astore.get_backref(key)
+        forward = await self.astore.get_forwardrefs(key)
+        return doc_blob, backward, forward
 
     async def _route(
         self,
@@ -665,19 +962,18 @@ class HtmlRenderer:
         else:
             modroot = ref
         root = modroot.split(".")[0]
-        meta = encoder.decode(self.store.get_meta(Key(root, version, None, None)))
-
-        known_refs, ref_map = find_all_refs(self.store)
+        meta = await self.astore.get_meta_decoded(
+            Key(root, version, None, None), encoder.decode
+        )
 
         # technically incorrect we don't load backrefs
-        x_, y_, doc_blob, backward, forward = await self._route_data(
-            ref, version, known_refs
-        )
-        assert x_ == known_refs
-        assert y_ == ref_map
+        doc_blob, backward, forward = await self._route_data(ref, version)
         assert version is not None
 
-        siblings = compute_siblings_II(ref, known_refs)  # type: ignore
+        siblings = await self.astore.run_sync(navigation, ref, self.store)
+        if siblings is None:
+            known_refs, _ = await self.astore.run_sync(find_all_refs, self.store)
+            siblings = compute_siblings_II(ref, known_refs)  # type: ignore
 
         # End computing siblings.
         if True:  # handle if thing don't exists.
@@ -685,18 +981,10 @@ class HtmlRenderer:
             # we will now just render it.
             assert root is not None
             # assert version is not None
-            data = self.compute_graph(
-                backward, forward, Key(root, version, "module", ref)
-            )
-            json_str = json.dumps(data)
-            parts_links = {}
-            acc = ""
-            for k in siblings.keys():
-                acc += k
-                parts_links[k] = acc
-                acc += "."
+            parts_links = compute_parts_links(siblings)
             backrefs = [RefInfo(*k) for k in backward]
-            return self.render_one(
+            return await self.astore.run_sync(
+                self.render_one,
                 current_type="api",
                 template=template,
                 doc=doc_blob,
@@ -704,7 +992,7 @@ class HtmlRenderer:
                 parts=siblings,
                 parts_links=parts_links,
                 backrefs=backrefs,
-                graph=json_str,
+                graph=self.graph_url(Key(root, version, "module", ref)),
                 meta=meta,
                 toctrees=[],
             )
@@ -722,49 +1010,86 @@ class HtmlRenderer:
         config,
         graph,
     ):
-        template = self.env.get_template("html.tpl.j2")
-        gfiles = list(self.store.glob((None, None, "module", None)))
-        random.shuffle(gfiles)
+        gfiles = sorted(self.store.glob((None, None, "module", None)))
         for _, key in progress(gfiles, description="Rendering API..."):
-            module, version = key.module, key.version
-            if config.ascii:
-                await _ascii_render(key, store=self.store)
-            if config.html:
-                doc_blob, qa, siblings, parts_links, backward, forward = await loc(
-                    key,
-                    store=self.store,
-                    tree=tree,
-                    known_refs=known_refs,
-                    ref_map=ref_map,
+            await self._write_api_page(key, tree, known_refs, ref_map, config, graph)
+
+    async def _write_api_page(self, key, tree, known_refs, ref_map, config, graph):
+        template = self.env.get_template("html.tpl.j2")
+        module, version = key.module, key.version
+        if config.ascii:
+            await _ascii_render(key, store=self.store)
+        if config.html:
+            qa = key.path
+            graph_url = self.graph_url(key) if graph else None
+            if graph and config.output_dir:
+                gfile = config.output_dir / module / version / "graph" / f"{qa}.json"
+                # the graph only depends on the neighborhood of the page.
+                degrees, neighbors = self.store.get_neighborhood(key)
+                if self.manifest is None or not self.manifest.up_to_date(
+                    gfile,
+                    self.manifest.digest(
+                        [(k, degrees[k], sorted(neighbors[k])) for k in sorted(degrees)]
+                    ),
+                ):
+                    gfile.parent.mkdir(parents=True, exist_ok=True)
+                    gfile.write_text(self.graph_json(key))
+            if config.output_dir:
+                tfile = config.output_dir / module / version / "api" / f"{qa}.html"
+            if self.manifest is not None and config.output_dir:
+                # the inputs of the page are cheap to read, only decode and
+                # render the pages whose inputs changed.
+                backward = self.store.get_backref(key)
+                forward = self.store.get_forwardrefs(key)
+                siblings = navigation(qa, self.store)
+                if siblings is None:
+                    siblings = cs2(qa, tree, ref_map)
+                if self.manifest.up_to_date(
+                    tfile,
+                    self.manifest.digest(
+                        self.store.get(key),
+                        self.store.get_meta(key),
+                        sorted(backward),
+                        # links are rendered depending on whether their
+                        # target exists.
+                        sorted(self.store.existing(forward)),
+                        [
+                            (p, [(tuple(r), n) for r, n in s])
+                            for p, s in siblings.items()
+                        ],
+                        graph_url,
+                    ),
+                ):
+                    return
+            doc_blob, qa, siblings, parts_links, backward, forward = await loc(
+                key,
+                store=self.store,
+                tree=tree,
+                known_refs=known_refs,
+                ref_map=ref_map,
+            )
+            backward_r = [RefInfo(*x) for x in backward]
+            meta = self.store.get_meta_decoded(key, encoder.decode)
+            data = self.render_one(
+                current_type="API",
+                template=template,
+                doc=doc_blob,
+                qa=qa,
+                parts=siblings,
+                parts_links=parts_links,
+                backrefs=backward_r,
+                graph=graph_url,
+                meta=meta,
+                toctrees=[],
+            )
+            if config.output_dir:
+                (config.output_dir / module / version / "api").mkdir(
+                    parents=True, exist_ok=True
                 )
-                backward_r = [RefInfo(*x) for x in backward]
-                if graph:
-                    data = self.compute_graph(set(backward), set(forward), key)
+                if config.minify:
+                    tfile.write_text(minify(data))
                 else:
-                    data = {}
-                json_str = json.dumps(data)
-                meta = encoder.decode(self.store.get_meta(key))
-                data = self.render_one(
-                    current_type="API",
-                    template=template,
-                    doc=doc_blob,
-                    qa=qa,
-                    parts=siblings,
-                    parts_links=parts_links,
-                    backrefs=backward_r,
-                    graph=json_str,
-                    meta=meta,
-                    toctrees=[],
-                )
-                if config.output_dir:
-                    (config.output_dir / module / version / "api").mkdir(
-                        parents=True, exist_ok=True
-                    )
-                    tfile = config.output_dir / module / version / "api" / f"{qa}.html"
-                    if config.minify:
-                        tfile.write_text(minify(data))
-                    else:
-                        tfile.write_text(data)
+                    tfile.write_text(data)
 
     async def _copy_dir(self, src_dir: Path, dest_dir: Path):
         assert dest_dir.exists()
@@ -772,7 +1097,9 @@ class HtmlRenderer:
             dest_item = dest_dir / item.name
             if item.is_file():
                 bts = item.read_bytes()
-                dest_item.write_bytes(bts)
+                # keep the mtime of unchanged files, for `compress_tree`.
+                if not dest_item.exists() or dest_item.read_bytes() != bts:
+                    dest_item.write_bytes(bts)
             else:
                 dest_item.mkdir(exist_ok=True)
                 await self._copy_dir(item, dest_item)
@@ -800,6 +1127,10 @@ class HtmlRenderer:
             b = config.output_dir / asset.module / asset.version / "img"
             b.mkdir(parents=True, exist_ok=True)
             data = self.store.get(asset)
+            if self.manifest is not None and self.manifest.up_to_date(
+                b / asset.path, self.manifest.digest(data)
+            ):
+                continue
             (b / asset.path).write_bytes(data)
 
     async def _write_example_files(self, config):
@@ -808,55 +1139,101 @@ class HtmlRenderer:
 
         examples = list(self.store.glob((None, None, "examples", None)))
         for _, example in progress(examples, description="Rendering Examples..."):
-            module, version, _, path = example
-            data = await self.render_single_examples(
-                module,
-                version,
-                data=self.store.get(example),
+            await self._write_example_file(example, config)
+
+    async def _write_example_file(self, example, config):
+        module, version, _, path = example
+        if config.output_dir:
+            tfile = config.output_dir / module / version / "examples" / f"{path}.html"
+            if self.manifest is not None and self.manifest.up_to_date(
+                tfile,
+                self.manifest.digest(
+                    self.store.get(example),
+                    self.store.get_meta(example),
+                    sorted(self.store.glob((None, None))),
+                ),
+            ):
+                return
+        data = await self.render_single_examples(
+            module,
+            version,
+            data=self.store.get(example),
+        )
+        if config.output_dir:
+            (config.output_dir / module / version / "examples").mkdir(
+                parents=True, exist_ok=True
             )
-            if config.output_dir:
-                (config.output_dir / module / version / "examples").mkdir(
-                    parents=True, exist_ok=True
-                )
-                (
-                    config.output_dir / module / version / "examples" / f"{path}.html"
-                ).write_text(data)
+            tfile.write_text(data)
 
     async def _write_narrative_files(self, config):
         narrative = list(self.store.glob((None, None, "docs", None)))
-        for _, (module, version, _, path) in progress(
-            narrative, description="Rendering Narrative..."
-        ):
-            data = await self._serve_narrative(module, version, path)
-            if config.output_dir:
-                (config.output_dir / module / version / "docs").mkdir(
-                    parents=True, exist_ok=True
-                )
-                (
-                    config.output_dir / module / version / "docs" / f"{path}.html"
-                ).write_text(data)
+        for _, key in progress(narrative, description="Rendering Narrative..."):
+            await self._write_narrative_file(key, config)
+        await self._write_tocs(config)
+
+    async def _write_narrative_file(self, key, config):
+        module, version, _, path = key
+        if config.output_dir:
+            tfile = config.output_dir / module / version / "docs" / f"{path}.html"
+            if self.manifest is not None and self.manifest.up_to_date(
+                tfile,
+                self.manifest.digest(
+                    self.store.get(key),
+                    self.store.get_meta(key),
+                    self.store.get(Key(module, version, "meta", "toc.cbor")),
+                    sorted(self.store.existing(self.store.get_forwardrefs(key))),
+                ),
+            ):
+                return
+        data = await self._serve_narrative(module, version, path)
+        if config.output_dir:
+            (config.output_dir / module / version / "docs").mkdir(
+                parents=True, exist_ok=True
+            )
+            tfile.write_text(data)
 
-        tocs = set([(m, v) for m, v, _, _ in narrative])
+    async def _write_tocs(self, config):
+        tocs = set(
+            [(m, v) for m, v, _, _ in self.store.iglob((None, None, "docs", None))]
+        )
         for module, version in tocs:
             print("toc for", module, version)
             toc = await self._list_narative(module, version, "")
             if config.output_dir:
-                (config.output_dir / module / version / "docs" / "toc.html").write_text(
-                    toc
+                (config.output_dir / module / version / "docs").mkdir(
+                    parents=True, exist_ok=True
                 )
+                tfile = config.output_dir / module / version / "docs" / "toc.html"
+                tfile.write_text(toc)
+                if self.manifest is not None:
+                    self.manifest.record(tfile)
+
+    async def _write_page(self, kind, key, *, tree, known_refs, ref_map, config, graph):
+        """
+        Render and write the page of ``key``, of the given kind of document.
+        """
+        if kind == "module":
+            await self._write_api_page(key, tree, known_refs, ref_map, config, graph)
+        elif kind == "examples":
+            await self._write_example_file(key, config)
+        else:
+            assert kind == "docs", kind
+            await self._write_narrative_file(key, config)
 
     async def examples_handler(self, package, version, subpath):
-        meta = encoder.decode(self.store.get_meta(Key(package, version, None, None)))
+        meta = await self.astore.get_meta_decoded(
+            Key(package, version, None, None), encoder.decode
+        )
 
-        pap_keys = self.store.glob((None, None, "meta", "aliases.cbor"))
+        pap_keys = await self.astore.glob((None, None, "meta", "aliases.cbor"))
         parts = {package: []}
         for pk in pap_keys:
             mod, ver, _, _ = pk
             parts[package].append((RefInfo(mod, ver, "api", mod), mod))
 
-        bytes_ = self.store.get(Key(package, version, "examples", subpath))
-
-        ex = encoder.decode(bytes_)
+        ex = await self.astore.get_decoded(
+            Key(package, version, "examples", subpath), encoder.decode
+        )
         assert isinstance(ex, Section)
 
         class Doc:
@@ -877,7 +1254,9 @@ class HtmlRenderer:
 
     async def render_single_examples(self, module, version, *, data):
         mod_vers = self.store.glob((None, None))
-        meta = encoder.decode(self.store.get_meta(Key(module, version, None, None)))
+        meta = self.store.get_meta_decoded(
+            Key(module, version, None, None), encoder.decode
+        )
         logo = meta["logo"]
         parts = {module: []}
         for mod, ver in mod_vers:
@@ -904,11 +1283,6 @@ class HtmlRenderer:
         )
 
 
-async def img(package, version, subpath=None) -> Response:
-    folder = ingest_dir / package / version / "assets"
-    return await send_from_directory(folder, subpath)
-
-
 def static(name) -> Callable[[], bytes]:
     here = Path(os.path.dirname(__file__))
     static = here / "static"
@@ -925,18 +1299,120 @@ def pygment_css() -> Response:
     return Response(CSS_DATA, mimetype="text/css")
 
 
-def serve(*, sidebar: bool, port=1234):
+class CachedResponse(NamedTuple):
+    body: bytes
+    mimetype: str
+    etag: str
+
+
+class ResponseCache:
+    """
+    LRU cache of the responses of `serve`, by request path, bounded by their
+    size.
+
+    All the responses are dropped when the store changes, and each response
+    has a strong ETag, the digest of its content, for clients to revalidate
+    their copy with ``If-None-Match``.
+
+    Parameters
+    ----------
+    store : GraphStore
+        the store the responses are computed from.
+    max_size : int
+        maximum number of bytes of responses to keep.
+
+    """
+
+    def __init__(self, store: GraphStore, max_size: int):
+        self.store = store
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._data_version = store.data_version()
+
+    def get(self, path: str) -> Optional[CachedResponse]:
+        version = self.store.data_version()
+        if version != self._data_version:
+            self.clear()
+            self._data_version = version
+        item = self._data.get(path)
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(path)
+        return item
+
+    def put(self, path: str, body: bytes, mimetype: str) -> CachedResponse:
+        item = CachedResponse(body, mimetype, hashlib.sha256(body).hexdigest()[:32])
+        if len(body) > self.max_size:
+            return item
+        old = self._data.pop(path, None)
+        if old is not None:
+            self.size -= len(old.body)
+        self._data[path] = item
+        self.size += len(body)
+        while self.size > self.max_size:
+            _, evicted = self._data.popitem(last=False)
+            self.size -= len(evicted.body)
+        return item
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.size = 0
+
+    def wrap(self, handler: Callable) -> Callable:
+        """
+        Wrap a Quart handler returning html (or a Response) to cache its
+        successful responses, and answer conditional requests.
+        """
+
+        @wraps(handler)
+        async def wrapper(*args, **kwargs):
+            path = request.full_path
+            item = self.get(path)
+            if item is None:
+                res = await handler(*args, **kwargs)
+                if isinstance(res, str):
+                    item = self.put(path, res.encode(), "text/html")
+                elif isinstance(res, Response) and res.status_code == 200:
+                    item = self.put(path, await res.get_data(), res.mimetype)
+                else:
+                    # redirects, errors...
+                    return res
+            if item.etag in request.if_none_match:
+                response = Response(b"", status=304)
+            else:
+                response = Response(item.body, mimetype=item.mimetype)
+            response.set_etag(item.etag)
+            # always revalidate, pages change when documentation is ingested.
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+
+
+def make_app(store: GraphStore, *, sidebar: bool, dev=False) -> QuartTrio:
+    """
+    Quart application serving the documentation in ``store``.
+    """
     app = QuartTrio(__name__, static_folder=None)
 
-    gstore = GraphStore(ingest_dir)
+    gstore = store
     prefix = "/p/"
     html_renderer = HtmlRenderer(
-        gstore, sidebar=sidebar, prefix=prefix, trailing_html=False
+        gstore, sidebar=sidebar, prefix=prefix, trailing_html=False, dev=dev
     )
 
+    # templates may change in dev mode, do not cache the responses.
+    cache = ResponseCache(gstore, 0 if dev else RESPONSE_CACHE_SIZE)
+    cached = cache.wrap
+
     async def full(package, version, ref):
         if version == "*":
-            res = list(html_renderer.store.glob([package, None]))
+            res = await html_renderer.astore.glob([package, None])
             assert len(res) == 1
             version = res[0][1]
             return redirect(f"{prefix}{package}/{version}/api/{ref}")
@@ -952,22 +1428,30 @@ def serve(*, sidebar: bool, port=1234):
     app.route("/logo.png")(static("papyri-logo.png"))
     app.route("/static/pygments.css")(pygment_css)
     # sub here is likely incorrect
-    app.route(f"{prefix}<package>/<version>/img/<path:subpath>")(img)
+    full = cached(full)
+    app.route(f"{prefix}<package>/<version>/img/<path:subpath>")(
+        cached(html_renderer.img)
+    )
     app.route(f"{prefix}<package>/<version>/examples/<path:subpath>")(
-        html_renderer.examples_handler
+        cached(html_renderer.examples_handler)
     )
-    app.route(f"{prefix}<package>/<version>/gallery")(html_renderer.gallery)
-    app.route(f"{prefix}<package>/<version>/toc/")(html_renderer._list_narative)
+    app.route(f"{prefix}<package>/<version>/gallery")(cached(html_renderer.gallery))
+    app.route(f"{prefix}<package>/<version>/toc/")(cached(html_renderer._list_narative))
     app.route(f"{prefix}<package>/<version>/docs/")(
         lambda package, version: redirect(f"{prefix}{package}/{version}/docs/index")
     )
-    app.route(f"{prefix}<package>/<version>/docs/<ref>")(html_renderer._serve_narrative)
+    app.route(f"{prefix}<package>/<version>/docs/<ref>")(
+        cached(html_renderer._serve_narrative)
+    )
     app.route(f"{prefix}<package>/<version>/api/<ref>")(full)
+    app.route(f"{prefix}<package>/<version>/graph/<ref>.json")(
+        cached(html_renderer.graph)
+    )
     app.route(f"{prefix}<package>/static/<path:subpath>")(full)
-    app.route(f"{prefix}/gallery/")(gr)
-    app.route(f"{prefix}/gallery/<module>")(g)
-    app.route(f"{prefix}/virtual/<module>/<node>")(html_renderer.virtual)
-    app.route("/")(html_renderer.index)
+    app.route(f"{prefix}/gallery/")(cached(gr))
+    app.route(f"{prefix}/gallery/<module>")(cached(g))
+    app.route(f"{prefix}/virtual/<module>/<node>")(cached(html_renderer.virtual))
+    app.route("/")(cached(html_renderer.index))
 
     async def serve_static(path):
         here = Path(os.path.dirname(__file__))
@@ -975,6 +1459,13 @@ def serve(*, sidebar: bool, port=1234):
         return await send_from_directory(static, path)
 
     app.route("/static/<path:path>")(serve_static)
+    app.extensions["response_cache"] = cache
+    return app
+
+
+def serve(*, sidebar: bool, port=1234, dev=False):
+    gstore = GraphStore(ingest_dir, cache_size=DECODED_CACHE_SIZE)
+    app = make_app(gstore, sidebar=sidebar, dev=dev)
 
     port = int(os.environ.get("PORT", port))
     print("Seen config port ", port)
@@ -1013,16 +1504,38 @@ class Resolver:
         self.extension = extension
 
         self.version: Dict[str, str] = {}
-
-        for p, v in {
-            (package, version)
-            for (package, version, _, _) in self.store.glob((None, "*", "meta", None))
-        }:
-            if p in self.version:
+        # all the stored keys, and the same without version, links are
+        # checked against those instead of querying the store each time.
+        self._keys: Set[Tuple[str, str, str, str]] = set()
+        self._unversioned: Set[Tuple[str, str, str]] = set()
+        self._data_version: Optional[Tuple[int, int]] = None
+        self.refresh()
+
+    def refresh(self) -> None:
+        """
+        Reload the existing keys if the store has changed since last time.
+        """
+        data_version = self.store.data_version()
+        if data_version == self._data_version:
+            return
+        keys = {
+            (k.module, k.version, k.kind, k.path)
+            for k in self.store.iglob((None, None, None, None))
+        }
+
+        version: Dict[str, str] = {}
+        for p, v in {(m, v) for (m, v, kind, _) in keys if kind == "meta"}:
+            if p in version:
                 # todo, likely parse version here if possible.
-                maxv = max(v, self.version[p])
+                maxv = max(v, version[p])
                 print("multiple version for package", p, "Trying most recent", maxv)
-            self.version[p] = v
+            version[p] = v
+
+        # rendering threads may be reading those, replace them at once.
+        self._keys = keys
+        self._unversioned = {(m, k, p) for m, _, k, p in keys}
+        self.version = version
+        self._data_version = data_version
 
     def exists_resolve(self, info) -> Tuple[bool, Optional[str]]:
         module, version_number, kind, path = info
@@ -1036,8 +1549,15 @@ class Resolver:
         # TODO: Fix
         if kind == "?":
             return False, None
-        sgi = self.store.glob(i2)
-        if sgi:
+        if None in (module, kind, path):
+            # wildcard, rare enough to ask the store.
+            exists = next(self.store.iglob(i2), None) is not None
+        elif version_number in ("*", None):
+            # a None version matches any version, as in `GraphStore.glob`.
+            exists = (module, kind, path) in self._unversioned
+        else:
+            exists = (module, version_number, kind, path) in self._keys
+        if exists:
             exists, url = self._resolve(i2)
             return exists, url
 
@@ -1199,8 +1719,9 @@ def old_render_one(
 
 @lru_cache
 def _ascii_env():
-    env = Environment(
-        loader=CleanLoader(os.path.dirname(__file__)),
+    env = template_env(
+        CleanLoader(TEMPLATES_DIR),
+        "ascii",
         lstrip_blocks=True,
         trim_blocks=True,
         undefined=StrictUndefined,
@@ -1258,7 +1779,7 @@ async def _ascii_render(key: Key, store: GraphStore, known_refs=None, template=N
 
 async def ascii_render(name, store=None):
     gstore = GraphStore(ingest_dir, {})
-    key = next(iter(gstore.glob((None, None, "module", "papyri.examples"))))
+    key = next(gstore.iglob((None, None, "module", "papyri.examples")))
 
     builtins.print(await _ascii_render(key, gstore))
 
@@ -1279,7 +1800,8 @@ async def loc(document: Key, *, store: GraphStore, tree, known_refs, ref_map):
     tree:
         tree of object we know about; this will be useful to compute siblings
         for the navigation menu at the top that allow to either drill down the
-        hierarchy.
+        hierarchy. Only used when the store does not have the navigation
+        materialized at ingest time.
     known_refs: List[RefInfo]
         list of all the reference info for targets, so that we can resolve links
         later on; this is here for now, but shoudl be moved to ingestion at some
@@ -1312,14 +1834,11 @@ async def loc(document: Key, *, store: GraphStore, tree, known_refs, ref_map):
     bytes_, backward, forward = store.get_all(document)
     doc_blob: IngestedBlobs = encoder.decode(bytes_)
 
-    siblings = cs2(qa, tree, ref_map)
+    siblings = navigation(qa, store)
+    if siblings is None:
+        siblings = cs2(qa, tree, ref_map)
 
-    parts_links = {}
-    acc = ""
-    for k in siblings.keys():
-        acc += k
-        parts_links[k] = acc
-        acc += "."
+    parts_links = compute_parts_links(siblings)
     try:
         return doc_blob, qa, siblings, parts_links, backward, forward
     except Exception as e:
@@ -1337,7 +1856,119 @@ class StaticRenderingConfig:
     minify: bool
 
 
-async def main(ascii: bool, html, dry_run, sidebar: bool, graph: bool, minify: bool):
+# number of pages sent at once to a worker process by `render --jobs`.
+RENDER_CHUNK = 16
+
+# per process state of the render workers, see `_init_render_worker`.
+_worker: Optional[Tuple[HtmlRenderer, Dict[str, Any]]] = None
+
+
+def _init_render_worker(config: StaticRenderingConfig, graph: bool, prefix: str):
+    """
+    Initialize a render worker process, with its own store connections and
+    Jinja environment.
+    """
+    global _worker
+    gstore = GraphStore(ingest_dir, {}, cache_size=DECODED_CACHE_SIZE)
+    known_refs, ref_map = find_all_refs(gstore)
+    tree = make_tree(frozenset(_.path for _ in known_refs))
+    html_renderer = HtmlRenderer(
+        gstore, sidebar=config.html_sidebar, prefix=prefix, trailing_html=True
+    )
+    if config.output_dir is not None:
+        html_renderer.manifest = BuildManifest(
+            config.output_dir.parent, _build_salt(config, graph, prefix)
+        )
+    _worker = html_renderer, dict(
+        tree=tree, known_refs=known_refs, ref_map=ref_map, config=config, graph=graph
+    )
+
+
+def _render_chunk(items: List[Tuple[str, Key]]) -> Tuple[List[Key], Dict[str, str]]:
+    """
+    Render a chunk of (kind, key) pages in a worker process.
+
+    Return the rendered keys, and the manifest entries of the written pages.
+    """
+    assert _worker is not None
+    html_renderer, kwargs = _worker
+    if html_renderer.manifest is not None:
+        html_renderer.manifest.new = {}
+
+    async def run():
+        for kind, key in items:
+            await html_renderer._write_page(kind, key, **kwargs)
+
+    trio.run(run)
+    files = html_renderer.manifest.new if html_renderer.manifest is not None else {}
+    return [key for _, key in items], files
+
+
+def _render_parallel(
+    store: GraphStore,
+    jobs: int,
+    config: StaticRenderingConfig,
+    graph: bool,
+    prefix,
+    manifest: Optional[BuildManifest] = None,
+):
+    """
+    Render the API, examples and narrative pages in ``jobs`` worker
+    processes.
+
+    Pages are sent to workers in small chunks, and the progress of all the
+    workers is reported in a single progress bar. Chunks take the sorted
+    pages round-robin, so that neighbouring pages, often of similar cost like
+    the large pages of a module, are spread over all the chunks, and the
+    split is the same on every build.
+    """
+    kinds = ["module", "docs"] + (["examples"] if config.html else [])
+    items = [
+        (kind, key)
+        for kind in kinds
+        for key in sorted(store.iglob((None, None, kind, None)))
+    ]
+    n_chunks = -(-len(items) // RENDER_CHUNK)
+    chunks = [items[i::n_chunks] for i in range(n_chunks)]
+    # sqlite connections can't be shared with forked processes.
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        jobs,
+        mp_context=ctx,
+        initializer=_init_render_worker,
+        initargs=(config, graph, prefix),
+    ) as pool:
+        futures = [pool.submit(_render_chunk, chunk) for chunk in chunks]
+
+        def done():
+            for f in as_completed(futures):
+                keys, files = f.result()
+                if manifest is not None:
+                    manifest.new.update(files)
+                yield from keys
+
+        for _ in progress(done(), description="Rendering...", total=len(items)):
+            pass
+
+
+def _finish_build(manifest: Optional[BuildManifest]) -> None:
+    if manifest is None:
+        return
+    stale = manifest.remove_stale()
+    manifest.save()
+    log.info("removed %d stale files", len(stale))
+
+
+async def main(
+    ascii: bool,
+    html,
+    dry_run,
+    sidebar: bool,
+    graph: bool,
+    minify: bool,
+    jobs: int = 1,
+    compress: bool = False,
+):
     """
     This does static rendering of all the given files.
 
@@ -1352,6 +1983,10 @@ async def main(ascii: bool, html, dry_run, sidebar: bool, graph: bool, minify: b
     Sidebar:bool
         render the sidebar in html
     graph: bool
+    jobs: int
+        number of worker processes rendering the pages.
+    compress: bool
+        also write brotli and gzip compressed copies of the output files.
 
     """
 
@@ -1366,7 +2001,7 @@ async def main(ascii: bool, html, dry_run, sidebar: bool, graph: bool, minify: b
     config = StaticRenderingConfig(html, sidebar, ascii, output_dir, minify)
     prefix = "/p/"
 
-    gstore = GraphStore(ingest_dir, {})
+    gstore = GraphStore(ingest_dir, {}, cache_size=DECODED_CACHE_SIZE)
 
     known_refs, ref_map = find_all_refs(gstore)
     # end
@@ -1374,30 +2009,47 @@ async def main(ascii: bool, html, dry_run, sidebar: bool, graph: bool, minify: b
     family = frozenset(_.path for _ in known_refs)
 
     tree = make_tree(family)
-    if html_dir_ is not None:
-        log.info("going to erase %s", html_dir_)
-        shutil.rmtree(html_dir_)
-    else:
-        log.info("no output dir, we'll try not to touch the filesystem")
-
-    # shuffle files to detect bugs, just in case.
-    # Gallery
-
     html_renderer = HtmlRenderer(
         gstore, sidebar=config.html_sidebar, prefix=prefix, trailing_html=True
     )
-    await html_renderer._write_gallery(config)
+    manifest = None
+    if html_dir_ is not None:
+        if not (html_dir_ / BuildManifest.FILENAME).exists():
+            # we can't tell which files of a build without manifest are stale.
+            log.info("going to erase %s", html_dir_)
+            shutil.rmtree(html_dir_)
+            (html_dir_ / "p").mkdir(parents=True)
+        # only rewrite the pages whose inputs changed since the last build.
+        manifest = BuildManifest(html_dir_, _build_salt(config, graph, prefix))
+        html_renderer.manifest = manifest
+    else:
+        log.info("no output dir, we'll try not to touch the filesystem")
 
-    await html_renderer._write_example_files(config)
-    await html_renderer._write_index(html_dir_)
-    await html_renderer.copy_assets(config)
-    await html_renderer.copy_static(config.output_dir)
-    await html_renderer._write_narrative_files(config)
+    if jobs > 1:
+        await html_renderer._write_gallery(config)
+        await html_renderer._write_index(html_dir_)
+        await html_renderer.copy_assets(config)
+        await html_renderer.copy_static(config.output_dir)
+        await html_renderer._write_tocs(config)
+        _render_parallel(gstore, jobs, config, graph, prefix, manifest)
+    else:
+        await html_renderer._write_gallery(config)
+
+        await html_renderer._write_example_files(config)
+        await html_renderer._write_index(html_dir_)
+        await html_renderer.copy_assets(config)
+        await html_renderer.copy_static(config.output_dir)
+        await html_renderer._write_narrative_files(config)
+
+        await html_renderer._write_api_file(
+            tree,
+            known_refs,
+            ref_map,
+            config,
+            graph,
+        )
 
-    await html_renderer._write_api_file(
-        tree,
-        known_refs,
-        ref_map,
-        config,
-        graph,
-    )
+    _finish_build(manifest)
+    if compress and html_dir_ is not None:
+        n = compress_tree(html_dir_, jobs if jobs > 1 else 0)
+        log.info("wrote %d compressed files", n)
@@ -58,8 +58,10 @@ Unless your use case is widely adopted it is likely not worse the complexity
 from __future__ import annotations
 
 import sys
+from collections.abc import Mapping
 from dataclasses import dataclass
-from typing import Any, List, Optional, Union
+from types import MemberDescriptorType
+from typing import Any, Callable, Dict, List, Optional, Union
 
 import cbor2
 from there import print
@@ -67,7 +69,7 @@ from there import print
 from .common_ast import Node, REV_TAG_MAP, register
 from .miniserde import get_type_hints
 
-from .utils import dedent_but_first
+from .utils import dedent_but_first, intern_str
 
 
 register(tuple)(4444)
@@ -137,12 +139,15 @@ class Link(Node):
     exists: bool
     anchor: Optional[str] = None
 
+    # links are hashed often (see also items, sets of links), but are
+    # updated in place when resolved.
+    __slots__ = ("_hash",)
+    __hash__ = Node._cached_hash
+    __setattr__ = Node._uncaching_setattr
+
     def __repr__(self):
         return f"<Link: {self.value=} {self.reference=} {self.kind=} {self.exists=}>"
 
-    def __hash__(self):
-        return hash((self.value, self.reference, self.kind, self.exists, self.anchor))
-
 
 class Leaf(Node):
     value: str
@@ -225,6 +230,9 @@ class RefInfo(Node):
     kind: str
     path: str
 
+    __slots__ = ("_hash",)
+    __hash__ = Node._cached_hash
+
     def __iter__(self):
         assert isinstance(self.path, str)
         return iter([self.module, self.version, self.kind, self.path])
@@ -234,6 +242,26 @@ class RefInfo(Node):
         assert ":" not in module
         return cls(module, version, kind, path)
 
+    @classmethod
+    def interned(
+        cls, module: Optional[str], version: Optional[str], kind: str, path: str
+    ) -> RefInfo:
+        """
+        The shared instance equal to ``RefInfo(module, version, kind, path)``.
+
+        References are immutable, and documents refer to the same objects over
+        and over, so equal references can be a single object (flyweight). The
+        module, version and kind strings are also interned with `sys.intern`.
+
+        The pool lives as long as the process, it is bounded by the number of
+        distinct references in the store.
+        """
+        ref = cls(intern_str(module), intern_str(version), sys.intern(kind), path)
+        return _interned_refs.setdefault(ref, ref)
+
+
+_interned_refs: Dict[RefInfo, RefInfo] = {}
+
 
 @register(4011)
 class Signature(Node):
@@ -367,6 +395,10 @@ class GenToken(Node):
     qa: Optional[str]
     pygmentclass: str
 
+    __slots__ = ("_hash",)
+    __hash__ = Node._cached_hash
+    __setattr__ = Node._uncaching_setattr
+
 
 class Code(Node):
     entries: List[GenToken]
@@ -573,26 +605,232 @@ def parse_rst_section(text):
     raise ValueError("Multiple sections present")
 
 
+def _constructor(type_) -> Callable[[List[Any]], Any]:
+    """
+    Function building an instance of ``type_`` from the list of its field
+    values, as they are encoded by `Node.cbor`.
+
+    This is equivalent to ``type_(**dict(zip(fields, values)))``, except
+    that types with an ``interned`` constructor return shared instances, and
+    that for plain nodes the generic `Node.__init__` is bypassed and the values are
+    set directly through the slot descriptors of the fields.
+    """
+    fields = tuple(get_type_hints(type_))
+    n = len(fields)
+
+    interned = getattr(type_, "interned", None)
+    if interned is not None:
+        # flyweight types, see RefInfo.interned.
+        def construct_interned(values):
+            if len(values) == n:
+                return interned(*values)
+            return interned(**dict(zip(fields, values)))
+
+        return construct_interned
+
+    plain = (
+        type_.__init__ is Node.__init__
+        # a new instance has no cached hash to drop.
+        and type_.__setattr__ in (object.__setattr__, Node._uncaching_setattr)
+        # all the fields are stored in slots (no properties).
+        and all(
+            isinstance(getattr(type_, f, None), MemberDescriptorType) for f in fields
+        )
+    )
+    if not plain:
+
+        def construct(values):
+            if len(values) == n:
+                return type_(*values)
+            return type_(**dict(zip(fields, values)))
+
+        return construct
+
+    new = object.__new__
+    setters = tuple(getattr(type_, f).__set__ for f in fields)
+    defaults = type_._defaults
+    post = getattr(type_, "_post_deserialise", None)
+
+    def construct_plain(values):
+        obj = new(type_)
+        for set_, value in zip(setters, values):
+            set_(obj, value)
+        if len(values) < n:
+            for k, v in defaults.items():
+                if not hasattr(obj, k):
+                    setattr(obj, k, v)
+        if post is not None:
+            obj._post_deserialise()
+        return obj
+
+    return construct_plain
+
+
+# RFC 8949 "encoded CBOR data item", a bytestring holding an encoded item.
+EMBEDDED_TAG = 24
+
+# smaller items are not embedded, they are cheaper to decode than to skip.
+EMBED_MIN_SIZE = 32
+
+
+class Embedded:
+    """
+    Encoded item of a document not decoded yet, see `Encoder.decode_lazy`.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+class LazyMapping(Mapping):
+    """
+    Read only mapping decoding its embedded values on first access.
+    """
+
+    def __init__(self, data: Dict[Any, Any], decode: Callable[[bytes], Any]):
+        self._data = data
+        self._decode = decode
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if type(value) is Embedded:
+            value = self._data[key] = self._decode(value.data)
+        return value
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LazyNode:
+    """
+    Read only view of a node, decoding its embedded fields on first access.
+
+    Pages that need only some fields of a document (the figures of the
+    example section for the gallery, the summary for a hover...) do not pay
+    for decoding the rest of it. Use `materialize` to get the actual node.
+    """
+
+    __slots__ = ("_type", "_values", "_decode")
+
+    def __init__(self, type_, values: Dict[str, Any], decode: Callable):
+        self._type = type_
+        self._values = values
+        self._decode = decode
+
+    def __getattr__(self, name):
+        try:
+            value = self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        if type(value) is Embedded:
+            value = self._values[name] = self._decode(value.data)
+        elif type(value) is dict:
+            value = self._values[name] = LazyMapping(value, self._decode)
+        return value
+
+    def materialize(self):
+        """
+        The node, with all its fields decoded.
+        """
+        values = []
+        for name in self._values:
+            value = getattr(self, name)
+            if isinstance(value, LazyMapping):
+                value = {k: value[k] for k in value}
+            values.append(value)
+        return _constructor(self._type)(values)
+
+    def __repr__(self):
+        return f"<Lazy{self._type.__name__} {list(self._values)}>"
+
+
 class Encoder:
     def __init__(self, rev_map):
         self._rev_map = rev_map
+        # constructors by tag, computed on first use, as types are registered
+        # as modules are imported.
+        self._constructors: Dict[int, Callable[[List[Any]], Any]] = {
+            EMBEDDED_TAG: self.decode
+        }
+        self._lazy_constructors: Dict[int, Callable[[Any], Any]] = {}
 
     def encode(self, obj):
         return cbor2.dumps(obj, default=lambda encoder, obj: obj.cbor(encoder))
 
+    def embed(self, obj) -> Any:
+        """
+        ``obj`` as an embedded item, which `decode_lazy` can skip.
+
+        `decode` decodes embedded items as if ``obj`` was encoded in place.
+        Small items are not worth skipping, they are returned as is.
+        """
+        data = self.encode(obj)
+        if len(data) < EMBED_MIN_SIZE:
+            return obj
+        return cbor2.CBORTag(EMBEDDED_TAG, data)
+
     def _type_from_tag(self, tag):
         return self._rev_map[tag.tag]
 
     def _tag_hook(self, decoder, tag, shareable_index=None):
-        type_ = self._type_from_tag(tag)
-
-        tt = get_type_hints(type_)
-        kwds = {k: t for k, t in zip(tt, tag.value)}
-        return type_(**kwds)
+        try:
+            construct = self._constructors[tag.tag]
+        except KeyError:
+            construct = _constructor(self._type_from_tag(tag))
+            self._constructors[tag.tag] = construct
+        return construct(tag.value)
+
+    def _lazy_constructor(self, tag: int) -> Callable[[Any], Any]:
+        """
+        Function building the item of the given tag from the value of the tag,
+        the field values of a node, or the encoded bytes of an embedded item.
+        """
+        if tag == EMBEDDED_TAG:
+            return Embedded
+        type_ = self._rev_map[tag]
+        construct = _constructor(type_)
+        if type_.cbor is Node.cbor:
+            # only types with their own encoding embed some of their fields.
+            return construct
+        fields = tuple(get_type_hints(type_))
+        decode = self.decode
+
+        def construct_lazy(values):
+            for v in values:
+                if type(v) is Embedded or (
+                    type(v) is dict and any(type(x) is Embedded for x in v.values())
+                ):
+                    return LazyNode(type_, dict(zip(fields, values)), decode)
+            return construct(values)
+
+        return construct_lazy
+
+    def _lazy_tag_hook(self, decoder, tag, shareable_index=None):
+        try:
+            construct = self._lazy_constructors[tag.tag]
+        except KeyError:
+            construct = self._lazy_constructors[tag.tag] = self._lazy_constructor(
+                tag.tag
+            )
+        return construct(tag.value)
 
     def decode(self, bytes):
         return cbor2.loads(bytes, tag_hook=self._tag_hook)
 
+    def decode_lazy(self, bytes):
+        """
+        Decode ``bytes``, leaving the embedded items (see `embed`) encoded.
+
+        Nodes with embedded fields are returned as `LazyNode`, which decode
+        them on first access.
+        """
+        return cbor2.loads(bytes, tag_hook=self._lazy_tag_hook)
+
     def _available_tags(self):
         k = self._rev_map.keys()
         mi, ma = min(k), max(k)
@@ -0,0 +1,79 @@
+import functools
+import gzip
+import http.server
+import os
+import threading
+import urllib.request
+
+from papyri.compress import (
+    CompressedFileHandler,
+    accepted_encodings,
+    compress_tree,
+    encoders,
+)
+
+
+def test_compress_tree(tmp_path):
+    page = tmp_path / "p" / "page.html"
+    page.parent.mkdir()
+    page.write_text("<p>papyri</p>" * 100)
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG" * 100)
+    (tmp_path / "small.html").write_text("<p></p>")
+    (tmp_path / "gone.html.gz").write_bytes(b"")
+
+    assert compress_tree(tmp_path, 2) == len(encoders())
+    assert gzip.decompress((tmp_path / "p" / "page.html.gz").read_bytes()) == (
+        page.read_bytes()
+    )
+    assert not (tmp_path / "logo.png.gz").exists()
+    assert not (tmp_path / "small.html.gz").exists()
+    assert not (tmp_path / "gone.html.gz").exists()
+
+    # up to date copies are not written again.
+    assert compress_tree(tmp_path) == 0
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("") == set()
+    assert accepted_encodings("gzip, deflate, br") == {"gzip", "deflate", "br"}
+    assert accepted_encodings("br;q=0, gzip;q=0.5") == {"gzip"}
+
+
+def test_compressed_file_handler(tmp_path):
+    html = "<p>papyri</p>" * 100
+    (tmp_path / "index.html").write_text(html)
+    compress_tree(tmp_path)
+
+    handler = functools.partial(CompressedFileHandler, directory=str(tmp_path))
+    server = http.server.HTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+
+    def get(encoding):
+        req = urllib.request.Request(url, headers={"Accept-Encoding": encoding})
+        with urllib.request.urlopen(req) as resp:
+            return resp.headers, resp.read()
+
+    try:
+        headers, body = get("gzip")
+        assert headers["Content-Encoding"] == "gzip"
+        assert headers["Content-Type"] == "text/html"
+        assert gzip.decompress(body).decode() == html
+
+        headers, body = get("identity")
+        assert headers["Content-Encoding"] is None
+        assert body.decode() == html
+
+        # copies older than the file are not sent.
+        html = "<p>rewritten</p>" * 100
+        (tmp_path / "index.html").write_text(html)
+        stat = (tmp_path / "index.html").stat()
+        for copy in tmp_path.glob("index.html.*"):
+            os.utime(copy, (stat.st_atime, stat.st_mtime - 10))
+        headers, body = get("gzip, br")
+        assert headers["Content-Encoding"] is None
+        assert body.decode() == html
+    finally:
+        server.shutdown()
+        server.server_close()
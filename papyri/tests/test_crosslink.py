@@ -0,0 +1,197 @@
+import pytest
+
+from papyri.crosslink import (
+    IngestedBlobs,
+    build_navigation,
+    find_all_refs,
+    resolve_links,
+)
+from papyri.graphstore import pending_tail
+from papyri.myst_ast import MParagraph, MText
+from papyri.take2 import (
+    Embedded,
+    Link,
+    LazyNode,
+    RefInfo,
+    Section,
+    SeeAlsoItem,
+    encoder,
+)
+
+
+def _blob_with_see_also(*names):
+    blob = IngestedBlobs.new()
+    blob.qa = "scipy.linalg.solve"
+    blob.example_section_data = Section([], None)
+    blob.arbitrary = []
+    blob.see_also = [
+        SeeAlsoItem(
+            Link(
+                n,
+                RefInfo("current-module", "current-version", "to-resolve", n),
+                "module",
+                True,
+            ),
+            [],
+            None,
+        )
+        for n in names
+    ]
+    return blob
+
+
+def test_pending_tail():
+    assert pending_tail("~numpy.linalg.inv") == "inv"
+    assert pending_tail("numpy.linalg:inv") == "inv"
+    assert pending_tail("inv()") == "inv"
+
+
+def test_resolve_links_partial():
+    blob = _blob_with_see_also("numpy.linalg.inv", "dask.array.solve")
+    assert {l.value for l in blob.unresolved_links()} == {
+        "numpy.linalg.inv",
+        "dask.array.solve",
+    }
+
+    known_refs = frozenset([RefInfo("numpy", "1.26", "module", "numpy.linalg.inv")])
+    changed, remaining = resolve_links(blob, blob.qa, known_refs, {})
+
+    assert changed
+    assert remaining == {"dask.array.solve"}
+    [inv, _] = blob.see_also
+    assert inv.name.reference == RefInfo("numpy", "1.26", "module", "numpy.linalg.inv")
+    assert [l.value for l in blob.unresolved_links()] == ["dask.array.solve"]
+
+
+def test_resolve_links_restricted_targets():
+    blob = _blob_with_see_also("numpy.linalg.inv")
+    known_refs = frozenset([RefInfo("numpy", "1.26", "module", "numpy.linalg.inv")])
+    changed, remaining = resolve_links(
+        blob, blob.qa, known_refs, {}, targets={"numpy.linalg.det"}
+    )
+    assert not changed
+    assert remaining == {"numpy.linalg.inv"}
+
+
+def _write_bundle(root, module, version, qa, see_also=()):
+    import json
+
+    from papyri.gen import DocBlob
+
+    path = root / f"{module}_{version}"
+    (path / "module").mkdir(parents=True)
+    (path / "papyri.json").write_text(
+        json.dumps({"module": module, "version": version})
+    )
+    blob = DocBlob.new()
+    blob.example_section_data = Section([], None)
+    blob.ordered_sections = []
+    blob.see_also = _blob_with_see_also(*see_also).see_also
+    (path / "module" / f"{qa}.json").write_text(json.dumps(blob.to_dict()))
+    return path
+
+
+def test_ingest_resolves_pending(tmp_path, monkeypatch):
+    from papyri.crosslink import Ingester
+    from papyri.graphstore import Key
+
+    monkeypatch.setattr("papyri.crosslink.ingest_dir", tmp_path / "ingest")
+    ingester = Ingester(dp=True)
+    store = ingester.gstore
+    solve = Key("scipy", "1.11", "module", "scipy.linalg.solve")
+    inv = Key("numpy", "1.26", "module", "numpy.linalg.inv")
+
+    # the target is not ingested yet, the link is queued.
+    ingester.ingest(
+        _write_bundle(tmp_path, "scipy", "1.11", solve.path, ["numpy.linalg.inv"]),
+        check=False,
+    )
+    assert store.get_pending({"inv"}) == {solve: {"numpy.linalg.inv"}}
+
+    ingester.ingest(_write_bundle(tmp_path, "numpy", "1.26", inv.path), check=False)
+    [see_also] = encoder.decode(store.get(solve)).see_also
+    assert see_also.name.reference == RefInfo(*inv)
+    assert see_also.name.exists
+    assert solve in store.get_backref(inv)
+    assert store.get_pending({"inv"}) == {}
+    store.close()
+
+
+def test_relink_resolves(tmp_path, monkeypatch):
+    from papyri.crosslink import Ingester
+    from papyri.graphstore import Key
+
+    monkeypatch.setattr("papyri.crosslink.ingest_dir", tmp_path / "ingest")
+    ingester = Ingester(dp=True)
+    store = ingester.gstore
+    solve = Key("scipy", "1.11", "module", "scipy.linalg.solve")
+    inv = Key("numpy", "1.26", "module", "numpy.linalg.inv")
+    ingester.ingest(
+        _write_bundle(tmp_path, "scipy", "1.11", solve.path, ["numpy.linalg.inv"]),
+        check=False,
+    )
+    # the target is stored without resolving the pending links.
+    target = _blob_with_see_also()
+    target.qa = inv.path
+    store.put(inv, encoder.encode(target), [])
+
+    ingester.relink()
+    [see_also] = encoder.decode(store.get(solve)).see_also
+    assert see_also.name.reference == RefInfo(*inv)
+    assert solve in store.get_backref(inv)
+    assert store.get_pending({"inv"}) == {}
+    store.close()
+
+
+def test_build_navigation(tmp_path):
+    from papyri.graphstore import GraphStore, Key
+    from papyri.render import cs2, make_tree, navigation
+
+    store = GraphStore(tmp_path)
+    for name in [
+        "numpy",
+        "numpy.linalg.inv",
+        "numpy.linalg.det",
+        "numpy.linspace",
+        "scipy",
+    ]:
+        store.put(Key(name.split(".")[0], "1.0", "module", name), b"", [])
+    assert navigation("numpy.linalg.inv", store) is None
+
+    build_navigation(store)
+    known_refs, ref_map = find_all_refs(store)
+    for ref in ["numpy", "numpy.linalg", "numpy.linalg.inv", "scipy"]:
+        tree = make_tree(frozenset(r.path for r in known_refs))
+        assert navigation(ref, store) == cs2(ref, tree, ref_map)
+    siblings = navigation("numpy.linalg.inv", store)
+    assert list(siblings) == ["numpy", "linalg", "inv"]
+    assert [name for _, name in siblings["inv"]] == ["det", "inv"]
+    # numpy.linalg is not documented itself.
+    assert siblings["linalg"][0][0] == RefInfo("?", "?", "?", "numpy.linalg")
+    store.close()
+
+
+def test_ingested_blobs_frozen():
+    blob = _blob_with_see_also("solve")
+    blob._freeze()
+    blob.qa = "scipy.linalg.lstsq"
+    with pytest.raises(TypeError):
+        blob.unknown = 1
+
+
+def test_lazy_decode():
+    blob = _blob_with_see_also("solve", "lstsq")
+    blob.content = {
+        "Summary": Section([MParagraph([MText("Solve a linear system.")])], None),
+        "Notes": Section([MParagraph([MText("Some notes. " * 10)])], None),
+    }
+    data = encoder.encode(blob)
+    assert encoder.decode(data) == blob
+
+    lazy = encoder.decode_lazy(data)
+    assert isinstance(lazy, LazyNode)
+    assert lazy.qa == "scipy.linalg.solve"
+    assert lazy.content["Summary"] == blob.content["Summary"]
+    # only the accessed section was decoded.
+    assert isinstance(lazy.content._data["Notes"], Embedded)
+    assert lazy.materialize() == blob
@@ -0,0 +1,60 @@
+import io
+import json
+
+import pytest
+
+from papyri.export import export
+from papyri.graphstore import GraphStore, Key
+from papyri.take2 import RefInfo, Section, encoder
+from papyri.myst_ast import MParagraph, MText
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_export(tmp_path, monkeypatch, jobs):
+    monkeypatch.setattr("papyri.export.EXPORT_CHUNK", 2)
+    store = GraphStore(tmp_path)
+    store.put_meta("numpy", "1.26", encoder.encode({"module": "numpy"}))
+    keys = [Key("numpy", "1.26", "docs", f"page{i}") for i in range(5)]
+    for i, key in enumerate(keys):
+        section = Section([MParagraph([MText(f"text {i}")])], f"title {i}", 1, None)
+        store.put(key, encoder.encode(section), [])
+    ref = RefInfo("numpy", "1.26", "module", "numpy.linspace")
+    store.put(Key("numpy", "1.26", "meta", "refs.cbor"), encoder.encode([ref]), [])
+    store.put(Key("numpy", "1.26", "assets", "fig.png"), b"\x89PNG", [])
+    store.close()
+
+    out = io.BytesIO()
+    assert export(out, tmp_path, jobs=jobs) == 7
+    meta, *docs, refs = [json.loads(line) for line in out.getvalue().splitlines()]
+
+    assert meta == {
+        "module": "numpy",
+        "version": "1.26",
+        "kind": None,
+        "path": None,
+        "data": {"module": "numpy"},
+    }
+    assert [d["path"] for d in docs] == [k.path for k in keys]
+    assert docs[3]["data"] == Section.from_dict(docs[3]["data"]).to_dict()
+    assert docs[3]["data"]["title"] == "title 3"
+    assert refs["data"] == [ref.to_dict()]
+
+
+def test_export_kinds(tmp_path, caplog):
+    store = GraphStore(tmp_path)
+    store.put_meta("numpy", "1.26", encoder.encode({"module": "numpy"}))
+    # a bundle without metadata.
+    store.put(Key("scipy", "1.11", "module", "scipy"), encoder.encode([]), [])
+    store.put(Key("numpy", "1.26", "module", "numpy"), encoder.encode([]), [])
+    store.close()
+
+    out = io.BytesIO()
+    assert export(out, tmp_path, ["module"]) == 2
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert {r["kind"] for r in records} == {"module"}
+
+    out = io.BytesIO()
+    assert export(out, tmp_path, ["meta"]) == 1
+    [meta] = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert meta["module"] == "numpy"
+    assert "scipy" in caplog.text
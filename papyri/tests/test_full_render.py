@@ -26,3 +26,168 @@ log = logging.getLogger("papyri")
 #        trio.run(m2, False, True, False, True, True, False)
 #    text = html_path.read_text()
 #    assert expected in text, reason
+
+
+def test_build_manifest(tmp_path):
+    from papyri.render import BuildManifest
+
+    page, other = tmp_path / "page.html", tmp_path / "other.html"
+    manifest = BuildManifest(tmp_path, "salt")
+    digest = manifest.digest(b"doc", [("a", "b")])
+    assert not manifest.up_to_date(page, digest)
+    page.write_text("page")
+    manifest.record(other)
+    other.write_text("other")
+    manifest.save()
+
+    manifest = BuildManifest(tmp_path, "salt")
+    assert manifest.up_to_date(page, manifest.digest(b"doc", [("a", "b")]))
+    assert not manifest.up_to_date(page, manifest.digest(b"doc2", [("a", "b")]))
+    assert manifest.remove_stale() == ["other.html"]
+    assert not other.exists()
+    manifest.save()
+
+    # a different salt invalidates all the pages
+    manifest = BuildManifest(tmp_path, "salt2")
+    assert not manifest.up_to_date(page, manifest.digest(b"doc2", [("a", "b")]))
+    manifest.save()
+
+    # pages of removed documents are deleted even when the salt changes.
+    manifest = BuildManifest(tmp_path, "salt3")
+    assert manifest.remove_stale() == ["page.html"]
+    assert not page.exists()
+
+
+def test_resolver_refresh(tmp_path):
+    from papyri.graphstore import GraphStore, Key
+    from papyri.render import Resolver
+    from papyri.tree import RefInfo
+
+    store = GraphStore(tmp_path)
+    store.put(Key("numpy", "1.26", "module", "numpy.linspace"), b"", [])
+    resolver = Resolver(store, "/p/", "")
+    assert resolver.exists_resolve(RefInfo("numpy", "*", "api", "numpy.linspace")) == (
+        True,
+        "/p/numpy/*/api/numpy.linspace",
+    )
+    assert resolver.exists_resolve(RefInfo("numpy", "1.26", "api", "numpy.arange")) == (
+        False,
+        None,
+    )
+    # a None version matches any version.
+    assert resolver.exists_resolve(RefInfo("numpy", None, "api", "numpy.linspace"))[0]
+
+    store.put(Key("numpy", "1.26", "module", "numpy.arange"), b"", [])
+    resolver.refresh()
+    assert resolver.exists_resolve(RefInfo("numpy", "1.26", "api", "numpy.arange")) == (
+        True,
+        "/p/numpy/1.26/api/numpy.arange",
+    )
+
+    # documents written by another process.
+    other = GraphStore(tmp_path)
+    other.put(Key("numpy", "1.26", "module", "numpy.zeros"), b"", [])
+    other.close()
+    resolver.refresh()
+    assert resolver.exists_resolve(RefInfo("numpy", "1.26", "api", "numpy.zeros"))[0]
+    store.close()
+
+
+def test_compile_templates(tmp_path):
+    from papyri.render import _html_env, compile_templates
+
+    assert compile_templates(tmp_path) > 0
+    template = _html_env(compiled=tmp_path).get_template("404.tpl.j2")
+    assert template.filename.startswith(str(tmp_path))
+
+    # outdated compiled templates are ignored.
+    (tmp_path / "digest").write_text("old")
+    template = _html_env(compiled=tmp_path).get_template("404.tpl.j2")
+    assert template.filename.endswith("404.tpl.j2")
+
+
+def test_compile_templates_options(tmp_path, monkeypatch):
+    from papyri.render import HTML_ENV_OPTIONS, _html_env, compile_templates
+
+    compile_templates(tmp_path)
+    # templates compiled with other environment options are ignored.
+    monkeypatch.setitem(HTML_ENV_OPTIONS, "trim_blocks", False)
+    template = _html_env(compiled=tmp_path).get_template("404.tpl.j2")
+    assert template.filename.endswith("404.tpl.j2")
+
+
+def test_response_cache(tmp_path):
+    import trio
+
+    from papyri.graphstore import GraphStore, Key
+    from papyri.render import make_app
+
+    store = GraphStore(tmp_path)
+    app = make_app(store, sidebar=True)
+    cache = app.extensions["response_cache"]
+
+    async def main():
+        client = app.test_client()
+        r1 = await client.get("/")
+        assert r1.status_code == 200
+        etag = r1.headers["ETag"]
+        r2 = await client.get("/")
+        assert await r2.get_data() == await r1.get_data()
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        r3 = await client.get("/", headers={"If-None-Match": etag})
+        assert r3.status_code == 304
+        assert await r3.get_data() == b""
+
+        # changes to the store drop the cached responses.
+        store.put(Key("numpy", "1.26", "module", "numpy.linspace"), b"", [])
+        await client.get("/")
+        assert cache.misses == 2
+
+        # and so do the rewrites of documents by another process, even with
+        # the same links.
+        other = GraphStore(tmp_path)
+        other.put(Key("numpy", "1.26", "module", "numpy.linspace"), b"new", [])
+        other.close()
+        await client.get("/")
+        assert cache.misses == 3
+
+    trio.run(main)
+    store.close()
+
+
+def test_up_to_date_page_not_decoded(tmp_path, monkeypatch):
+    import pytest
+    import trio
+
+    from papyri.graphstore import GraphStore, Key
+    from papyri.render import BuildManifest, HtmlRenderer, StaticRenderingConfig
+
+    store = GraphStore(tmp_path / "ingest")
+    key = Key("numpy", "1.26", "module", "numpy.linspace")
+    store.put(key, b"linspace", [])
+    store.put_meta("numpy", "1.26", b"meta")
+    output_dir = tmp_path / "html" / "p"
+    config = StaticRenderingConfig(True, False, False, output_dir, False)
+    renderer = HtmlRenderer(store, sidebar=False, prefix="/p/", trailing_html=True)
+    renderer.manifest = BuildManifest(output_dir.parent, "salt")
+
+    def loc(*args, **kwargs):
+        raise RuntimeError
+
+    monkeypatch.setattr("papyri.render.loc", loc)
+
+    async def write():
+        await renderer._write_api_page(key, {}, frozenset(), {}, config, False)
+
+    # the page is not up to date, it is decoded.
+    with pytest.raises(RuntimeError):
+        trio.run(write)
+    page = output_dir / "numpy" / "1.26" / "api" / "numpy.linspace.html"
+    page.parent.mkdir(parents=True)
+    page.write_text("page")
+    renderer.manifest.old = renderer.manifest.new
+
+    # up to date, it is neither decoded nor rendered.
+    trio.run(write)
+    store.close()
@@ -0,0 +1,336 @@
+import sys
+import threading
+
+import pytest
+
+from papyri.graphstore import GraphStore, Key
+
+
+@pytest.fixture(params=["files", "pack"])
+def store(tmp_path, request):
+    gs = GraphStore(tmp_path, storage=request.param)
+    yield gs
+    gs.close()
+
+
+def test_put_get(store, tmp_path):
+    a = Key("numpy", "1.26", "module", "numpy.linspace")
+    b = Key("numpy", "1.26", "module", "numpy.arange")
+    store.put(a, b"linspace", [b])
+    store.put(b, b"arange", [])
+
+    assert store.get(a) == b"linspace"
+    assert store.get_backref(b) == {a}
+    assert store.get_forwardrefs(a) == {b}
+    assert set(store.glob((None, None, "module", None))) == {a, b}
+    assert (tmp_path / "papyri.db").exists()
+
+
+def test_several_stores(tmp_path):
+    s1 = GraphStore(tmp_path / "one")
+    s2 = GraphStore(tmp_path / "two")
+    key = Key("numpy", "1.26", "module", "numpy.linspace")
+    s1.put(key, b"linspace", [])
+    assert s1.glob((None, None, "module", None)) == [key]
+    assert s2.glob((None, None, "module", None)) == []
+    s1.close()
+    s2.close()
+
+
+def test_pending(store):
+    a = Key("scipy", "1.11", "module", "scipy.linalg.solve")
+    store.put(a, b"solve", [])
+    store.put_pending(a, {"numpy.linalg.inv", "~dask.array.solve"})
+
+    assert store.get_pending({"inv"}) == {a: {"numpy.linalg.inv"}}
+    assert store.get_pending({"det"}) == {}
+
+    store.put_pending(a, set())
+    assert store.get_pending({"inv", "solve"}) == {}
+
+
+def test_concurrent_readers(store):
+    keys = [Key("numpy", "1.26", "module", f"numpy.f{i}") for i in range(50)]
+    for k in keys:
+        store.put(k, k.path.encode(), keys[:3])
+
+    errors = []
+    done = threading.Event()
+
+    def read():
+        try:
+            while not done.is_set():
+                for k in keys:
+                    assert store.get(k) == k.path.encode()
+                    store.get_backref(k)
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for t in readers:
+        t.start()
+    for i, k in enumerate(keys):
+        store.put(k, k.path.encode(), keys[i % 7 : i % 7 + 3])
+    done.set()
+    for t in readers:
+        t.join()
+    assert errors == []
+
+
+def test_refs_many_full_key(store):
+    a = Key("numpy", "1.26", "module", "numpy.linspace")
+    b = Key("numpy", "1.26", "module", "numpy.arange")
+    c = Key("numpy", "1.26", "docs", "numpy.arange")
+    store.put(a, b"linspace", [b])
+    store.put(c, b"narrative", [a])
+    store.put(b, b"arange", [a, c])
+
+    assert store.get_backrefs_many([a, b, c]) == {a: {b, c}, b: {a}, c: {b}}
+    assert store.get_forwardrefs_many([a, b]) == {a: {b}, b: {a, c}}
+    # only the identifier is shared, nothing is linked.
+    assert store.get_backref(Key("scipy", "1.11", "module", "numpy.arange")) == set()
+
+
+def test_degrees(store):
+    a = Key("numpy", "1.26", "module", "numpy.linspace")
+    b = Key("numpy", "1.26", "module", "numpy.arange")
+    c = Key("numpy", "1.26", "module", "numpy.zeros")
+    store.put(a, b"linspace", [b, c])
+    store.put(b, b"arange", [c])
+    assert store.get_degrees([a, b, c]) == {a: (0, 2), b: (1, 1), c: (2, 0)}
+
+    store.put(a, b"linspace", [b])
+    assert store.get_degrees([a, c]) == {a: (0, 1), c: (1, 0)}
+
+    store.remove(b)
+    assert store.get_degrees([a, b, c]) == {a: (0, 1), b: (1, 0), c: (0, 0)}
+
+
+def test_neighborhood(store):
+    a = Key("numpy", "1.26", "module", "numpy.linspace")
+    b = Key("numpy", "1.26", "module", "numpy.arange")
+    c = Key("numpy", "1.26", "module", "numpy.zeros")
+    d = Key("numpy", "1.26", "module", "numpy.ones")
+    store.put(a, b"linspace", [b])
+    store.put(b, b"arange", [c])
+    store.put(c, b"zeros", [a])
+    store.put(d, b"ones", [b])
+
+    degrees, backrefs = store.get_neighborhood(a)
+    assert degrees == {b: 2, c: 1}
+    assert backrefs == {b: {a, d}, c: {b}}
+    assert store.get_neighborhood(Key("numpy", "1.26", "module", "x")) == ({}, {})
+
+
+def test_glob(store):
+    keys = [
+        Key("numpy", "1.26", "module", "numpy.linspace"),
+        Key("numpy", "1.26", "assets", "fig-numpy.linspace-0.png"),
+        Key("numpy", "1.26", "meta", "aliases.cbor"),
+        Key("numpy", "1.26", "docs", "user_guide:basics"),
+        Key("scipy", "1.11", "examples", "plot_solve.py"),
+    ]
+    for k in keys:
+        store.put(k, b"data", [])
+    store.put_meta("numpy", "1.26", b"meta")
+
+    assert set(store.glob((None, None))) == {("numpy", "1.26"), ("scipy", "1.11")}
+    assert store.glob((None, None, "meta", None)) == [keys[2]]
+    assert store.glob(("numpy", "*", "assets", "*.png")) == [keys[1]]
+    assert store.glob((None, None, "examples", None)) == [keys[4]]
+    assert set(store.glob(("numpy", None, None, None))) == set(keys[:4])
+    assert next(store.iglob((None, None, "docs", "user_guide:basics"))) == keys[3]
+
+    # keys read from the database are shared, with interned strings.
+    [key] = store.glob(("numpy", None, "docs", None))
+    assert key is next(store.iglob((None, None, "docs", "user_guide:basics")))
+    assert key.module is sys.intern("numpy")
+    with pytest.raises(AttributeError):
+        key.module = "scipy"
+
+    store.remove(keys[0])
+    assert store.glob((None, None, "module", None)) == []
+
+
+def test_data_version(store, tmp_path):
+    a = Key("numpy", "1.26", "module", "numpy.linspace")
+    v0 = store.data_version()
+    store.put(a, b"linspace", [])
+    v1 = store.data_version()
+    assert v1 != v0
+    assert store.data_version() == v1
+
+    # changes made by another process, including rewrites that leave the
+    # links unchanged.
+    other = GraphStore(tmp_path)
+    other.put(a, b"new linspace", [])
+    v2 = store.data_version()
+    assert v2 != v1
+    other.put_meta("numpy", "1.26", b"meta")
+    assert store.data_version() != v2
+    other.remove(a)
+    other.close()
+    assert store.data_version() not in (v1, v2)
+
+
+def test_put_single_transaction(store, monkeypatch):
+    a = Key("numpy", "1.26", "module", "numpy.linspace")
+    b = Key("numpy", "1.26", "module", "numpy.arange")
+    writes = store._pool._writes
+    store.put(a, b"linspace", [b])
+    assert store._pool._writes == writes + 1
+
+    # a failing put leaves no rows behind.
+    def fail(conn, ref):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(GraphStore, "_maybe_insert_dest", staticmethod(fail))
+    with pytest.raises(KeyboardInterrupt):
+        store.put(b, b"arange", [a])
+    assert store.glob((None, None, None, "numpy.arange")) == []
+    assert store.get_forwardrefs(a) == {b}
+
+    # nested writes commit with the outermost one.
+    with pytest.raises(KeyboardInterrupt):
+        with store._pool.write():
+            store.put_pending(a, {"numpy.ones"})
+            raise KeyboardInterrupt
+    assert store.get_pending({"ones"}) == {}
+
+
+def test_decoded_cache(tmp_path):
+    store = GraphStore(tmp_path, cache_size=16)
+    decoded = []
+
+    def decode(data):
+        decoded.append(data)
+        return [data]
+
+    a = Key("numpy", "1.26", "module", "numpy.linspace")
+    b = Key("numpy", "1.26", "module", "numpy.arange")
+    store.put(a, b"linspace", [])
+    store.put(b, b"arange", [])
+    store.put_meta("numpy", "1.26", b"meta")
+
+    assert store.get_decoded(a, decode) is store.get_decoded(a, decode)
+    assert store.get_meta_decoded(a, decode) == [b"meta"]
+    assert decoded == [b"linspace", b"meta"]
+    assert store.cache.stats()["hits"] == 1
+
+    store.put(a, b"linspace2", [])
+    assert store.get_decoded(a, decode) == [b"linspace2"]
+    store.put_meta("numpy", "1.26", b"meta2")
+    assert store.get_meta_decoded(b, decode) == [b"meta2"]
+
+    # 9 + 5 + 6 bytes do not fit, the least recently used entry is evicted.
+    store.get_decoded(b, decode)
+    stats = store.cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["size"] <= 16
+    assert stats["misses"] == 5
+    store.close()
+
+
+@pytest.mark.parametrize("storage", ["files", "pack"])
+def test_decoded_cache_other_store(tmp_path, storage):
+    store = GraphStore(tmp_path, storage=storage, cache_size=64)
+    a = Key("numpy", "1.26", "module", "numpy.linspace")
+    store.put(a, b"linspace", [])
+    store.put_meta("numpy", "1.26", b"meta")
+    assert store.get_decoded(a, bytes.decode) == "linspace"
+    assert store.get_meta_decoded(a, bytes.decode) == "meta"
+
+    # rewrites by another process, with the same links, are seen.
+    other = GraphStore(tmp_path, storage=storage)
+    other.put(a, b"arange", [])
+    assert store.get_decoded(a, bytes.decode) == "arange"
+    other.put_meta("numpy", "1.26", b"meta2")
+    assert store.get_meta_decoded(a, bytes.decode) == "meta2"
+    other.close()
+    store.close()
+
+
+def test_decoded_cache_decoders(tmp_path):
+    store = GraphStore(tmp_path, cache_size=64)
+    a = Key("numpy", "1.26", "module", "numpy.linspace")
+    store.put(a, b"linspace", [])
+
+    # documents decoded differently are cached separately...
+    assert store.get_decoded(a, bytes.decode) == "linspace"
+    assert store.get_decoded(a, bytes.upper) == b"LINSPACE"
+    assert store.get_decoded(a, bytes.decode) == "linspace"
+    assert store.cache.stats()["hits"] == 1
+    assert store.cache.stats()["size"] == 16
+
+    # ...and invalidated together.
+    store.put(a, b"arange", [])
+    assert store.get_decoded(a, bytes.upper) == b"ARANGE"
+    assert store.get_decoded(a, bytes.decode) == "arange"
+    store.close()
+
+
+def test_repack(tmp_path, monkeypatch):
+    from papyri.packstore import PackStore
+
+    store = GraphStore(tmp_path, storage="files")
+    a = Key("numpy", "1.26", "module", "numpy.linspace")
+    b = Key("numpy", "1.26", "docs", "user_guide:basics")
+    store.put(a, b"linspace", [b])
+    store.put(b, b"basics", [])
+    store.put_meta("numpy", "1.26", b"meta")
+    (tmp_path / "notes").mkdir()
+    (tmp_path / "notes" / "todo.txt").write_text("todo")
+
+    # an interrupted migration leaves the files store as it was.
+    def fail(*args):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(PackStore, "write_meta", fail)
+    with pytest.raises(KeyboardInterrupt):
+        store.repack()
+    monkeypatch.undo()
+    store.close()
+    store = GraphStore(tmp_path)
+    assert store._packs is None
+    assert store.get(a) == b"linspace"
+
+    store.repack()
+    assert store._packs is not None
+    assert not (tmp_path / "numpy").exists()
+    assert (tmp_path / "notes" / "todo.txt").exists()
+    store.close()
+    store = GraphStore(tmp_path)
+    assert store._packs is not None
+    assert store.get(a) == b"linspace"
+    assert store.get(b) == b"basics"
+    assert store.get_meta(a) == b"meta"
+    assert store.get_backref(b) == {a}
+
+    # compacting the packs keeps the documents.
+    store.put(a, b"arange", [b])
+    store.repack()
+    assert store.get(a) == b"arange"
+    store.close()
+
+
+def test_async_store(store):
+    import trio
+
+    from papyri.graphstore import AsyncGraphStore
+
+    keys = [Key("numpy", "1.26", "module", f"numpy.f{i}") for i in range(20)]
+    for k in keys:
+        store.put(k, k.path.encode(), keys[:2])
+    astore = AsyncGraphStore(store, max_threads=4)
+
+    async def main():
+        assert await astore.get_many(keys) == [k.path.encode() for k in keys]
+        assert await astore.get_decoded_many(keys[:3], bytes.decode) == [
+            "numpy.f0",
+            "numpy.f1",
+            "numpy.f2",
+        ]
+        assert await astore.get_backref(keys[0]) == set(keys)
+        assert set(await astore.glob((None, None, "module", None))) == set(keys)
+
+    trio.run(main)
@@ -0,0 +1,61 @@
+import pytest
+
+from papyri import packstore
+from papyri.graphstore import ConnectionPool
+from papyri.packstore import PackStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    pool = ConnectionPool(tmp_path / "papyri.db")
+    yield PackStore(tmp_path / "packs", pool)
+    pool.close()
+
+
+def test_roundtrip(store):
+    key = ("numpy", "1.26", "module", "numpy.linspace")
+    data = b"linspace " * 100
+    store.write(key, data)
+    assert store.exists(key)
+    assert store.read(key) == data
+
+    store.write(key, b"new")
+    assert store.read(key) == b"new"
+
+    store.delete(key)
+    assert not store.exists(key)
+    with pytest.raises(FileNotFoundError):
+        store.read(key)
+
+
+def test_meta(store):
+    store.write_meta("dask", "2023", b"meta")
+    assert store.read_meta("dask", "2023") == b"meta"
+    store.write_meta("dask", "2023", b"new meta")
+    assert store.read_meta("dask", "2023") == b"new meta"
+    with pytest.raises(FileNotFoundError):
+        store.read_meta("numpy", "1.26")
+
+
+def test_compact(store):
+    key = ("numpy", "1.26", "module", "numpy.linspace")
+    for i in range(10):
+        store.write(key, f"version {i} ".encode() * 50)
+    store.write_meta("numpy", "1.26", b"meta")
+    [old] = store._packs()
+
+    store.compact()
+
+    assert store._packs() == [old + 1]
+    assert store.read(key) == b"version 9 " * 50
+    assert store.read_meta("numpy", "1.26") == b"meta"
+
+
+def test_zlib_fallback(store, monkeypatch):
+    monkeypatch.setattr(packstore, "zstandard", None)
+    key = ("numpy", "1.26", "module", "numpy.linspace")
+    data = b"linspace " * 100
+    store.write(key, data)
+    [(codec,)] = store._pool.read().execute("select codec from blobs").fetchall()
+    assert codec == packstore.ZLIB
+    assert store.read(key) == data
@@ -39,3 +39,38 @@ def test_parse_reference():
     [text, reference] = paragraph.children
     assert reference.value == "reference <to this>"
     assert text.value == "This is a "
+
+
+def test_parse_whitespace_between_inlines():
+    # tree-sitter does not have nodes for the spaces between inline markup.
+    [section] = parse(b"Some *emphasis*  and ``code`` here.\n")
+    [paragraph] = section.children
+    assert [getattr(c, "value", None) for c in paragraph.children] == [
+        "Some ",
+        None,
+        "  and ",
+        "code",
+        " here.",
+    ]
+
+
+def test_parser_per_thread():
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from papyri.ts import get_parser, parse_tree
+
+    barrier = threading.Barrier(2)
+
+    def thread_parser(_):
+        barrier.wait()
+        return get_parser()
+
+    with ThreadPoolExecutor(2) as pool:
+        a, b = pool.map(thread_parser, range(2))
+    assert a is not b
+    assert get_parser() is get_parser()
+    assert get_parser() not in (a, b)
+
+    tree = parse_tree(b"A paragraph with a `reference`_.\n")
+    assert tree.root_node.type == "document"
@@ -1,10 +1,17 @@
+import sys
+
 import pytest
 
 from papyri.ts import parse
 
-from ..myst_ast import MMystDirective
+from ..common_ast import set_validation, validate
+from ..myst_ast import MLink, MMystDirective, MParagraph, MText
 from ..take2 import (
+    Link,
+    RefInfo,
+    Section,
     dedent_but_first,
+    encoder,
     get_object,
 )
 
@@ -20,3 +27,113 @@ def test_parse_blocks(target, type_, number):
     sections = parse(dedent_but_first(get_object(target).__doc__).encode())
     filtered = [b for section in sections for b in section.children if type(b) == type_]
     assert len(filtered) == number
+
+
+def state(obj):
+    return {
+        k: getattr(obj, k)
+        for klass in type(obj).__mro__
+        for k in vars(klass).get("__slots__", ())
+        if hasattr(obj, k)
+    }
+
+
+def test_slots():
+    text = MText("value")
+    assert not hasattr(text, "__dict__")
+    with pytest.raises(AttributeError):
+        text.other = 1
+
+    # class level defaults are kept.
+    assert Section([], None).level == 0
+    assert MMystDirective("note", None, {}, None).children == []
+    assert encoder.decode(encoder.encode(Section([], None))).target is None
+
+
+def test_encode_decode():
+    ref = RefInfo("numpy", "1.26", "module", "numpy.linspace")
+    para = MParagraph([MText("see "), MLink([MText("linspace")], "url", "")])
+    section = Section([para, MMystDirective("note", None, {}, "value", [])], "Notes")
+
+    for obj in [ref, para, section]:
+        decoded = encoder.decode(encoder.encode(obj))
+        assert type(decoded) is type(obj)
+        assert decoded == obj
+        assert encoder.encode(decoded) == encoder.encode(obj)
+        assert state(encoder.decode(encoder.encode(decoded))) == state(decoded)
+
+
+def test_validate():
+    para = MParagraph([MText("see "), MLink([MText("linspace")], "url", "")])
+    section = Section([para], "Notes")
+    validate(section)
+
+    para.children[1].children[0].value = 1
+    with pytest.raises(ValueError, match=r"Section\.children\[0\]\.children\[1\]"):
+        validate(section)
+
+    previous = set_validation("off")
+    try:
+        validate(section)
+        set_validation("sampled")
+        # only the first of each sample is checked.
+        with pytest.raises(ValueError):
+            validate(section)
+        validate(section)
+    finally:
+        set_validation(previous)
+
+
+def test_myst_serialise():
+    para = MParagraph([MText("see "), MLink([MText("linspace")], "url", "")])
+    section = Section([para], "Notes")
+    data = section.to_dict()
+    assert data["type"] == "Section"
+    assert data["children"][0]["type"] == "paragraph"
+    assert data["children"][0]["children"][1] == {
+        "type": "link",
+        "children": [{"type": "text", "value": "linspace"}],
+        "url": "url",
+        "title": "",
+    }
+    assert Section.from_dict(data) == section
+    assert Section.from_json(section.to_json()) == section
+
+
+def test_node_hash():
+    ref = RefInfo("numpy", "1.26", "module", "numpy.linspace")
+    assert hash(ref) == hash(RefInfo("numpy", "1.26", "module", "numpy.linspace"))
+
+    link = MLink([MText("linspace")], "url", "")
+    assert hash(link) == hash(MLink([MText("linspace")], "url", ""))
+
+    # cached hashes are updated when resolving links in place.
+    unresolved = Link(
+        "linspace", RefInfo(None, None, "to-resolve", "linspace"), "", False
+    )
+    assert len({unresolved, encoder.decode(encoder.encode(unresolved))}) == 1
+    before = hash(unresolved)
+    unresolved.reference = ref
+    unresolved.exists = True
+    assert hash(unresolved) != before
+    assert hash(unresolved) == hash(Link("linspace", ref, "", True))
+    assert unresolved == Link("linspace", ref, "", True)
+
+
+def test_interned_refs():
+    # strings built at runtime, as read from the database.
+    module, version = "".join(["num", "py"]), "".join(["1.", "26"])
+    ref = RefInfo.interned(module, version, "module", "numpy.linspace")
+    assert ref == RefInfo("numpy", "1.26", "module", "numpy.linspace")
+    assert ref.module is sys.intern("numpy")
+    assert ref.version is sys.intern("1.26")
+    assert RefInfo.interned("numpy", "1.26", "module", "numpy.linspace") is ref
+    assert RefInfo.interned(None, None, "to-resolve", "linspace").module is None
+    with pytest.raises(AttributeError):
+        ref.module = "scipy"
+
+    # the decoded references are shared
+    link = Link("linspace", ref, "module", True)
+    a, b = encoder.decode(encoder.encode([link, link]))
+    assert a is not b
+    assert a.reference is b.reference is ref
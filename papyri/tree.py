@@ -4,6 +4,7 @@ usually trees, and update nodes.
 
 """
 
+import copy
 import logging
 
 from collections import Counter, defaultdict
@@ -121,7 +122,9 @@ class DelayedResolver:
         if (target in self._targets) and (target in self._references):
             for link in self._references[target]:
                 link.reference = self._targets[target]
-                print("Updating link to point to", self._targets[target], link)
+                log.debug(
+                    "Updating link to point to %s %s", self._targets[target], link
+                )
             self._references[target] = []
 
 
@@ -373,10 +376,15 @@ class TreeReplacer:
                     assert isinstance(replacement, list)
 
                     new_children.extend(replacement)
-                if node.children != new_children:  # type: ignore
+                if len(new_children) != len(node.children) or any(  # type: ignore
+                    a is not b for a, b in zip(new_children, node.children)  # type: ignore
+                ):
                     self._cr += 1
                     # print("Replaced !", node.children, new_children)
-                node.children = new_children  # type: ignore
+                    # copy on write, the tree we visit may be shared, for
+                    # example by the decoded documents cache of the GraphStore.
+                    node = copy.copy(node)
+                    node.children = new_children  # type: ignore
                 new_nodes = [node]
             assert isinstance(new_nodes, list)
             return new_nodes
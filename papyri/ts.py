@@ -1,9 +1,10 @@
 import logging
+import threading
 from pathlib import Path
-from textwrap import dedent, indent
-from typing import List
+from textwrap import dedent
+from typing import Any, Callable, Dict, List
 
-from tree_sitter import Language, Parser
+from tree_sitter import Language, Parser, Tree
 
 from .myst_ast import (
     MText,
@@ -33,6 +34,7 @@ from .take2 import (
     SubstitutionRef,
     Transition,
     Unimplemented,
+    _constructor,
     compress_word,
     inline_nodes,
 )
@@ -47,134 +49,83 @@ pth = str(Path(__file__).parent / "rst.so")
 
 # replace by tree-sitter-languages once it works See https://github.com/grantjenks/py-tree-sitter-languages/issues/15
 RST = Language(pth, "rst")
-parser = Parser()
-parser.set_language(RST)
 log = logging.getLogger("papyri")
 
+# MText(value) without the generic Node.__init__, texts and whitespace are
+# most of the nodes.
+_new_text = _constructor(MText)
 
-class Node:
-    """
-    A wrapper around tree sitter Nodes to slightly modify behavior.
+# tree-sitter parsers must not be used from several threads at once, each
+# thread has its own, see `get_parser`.
+_local = threading.local()
 
-    In particular we want to be able to extract whitespace information,
-    which is made hard by tree sitter.
 
-    So we intercept iterating through childrens, and if the bytes start/stop
-    don't match, we insert a fake Whitespace node that has similar api to tree
-    sitter official nodes.
+def get_parser() -> Parser:
     """
+    Tree-sitter RST parser of the current thread.
+    """
+    try:
+        return _local.parser
+    except AttributeError:
+        parser = _local.parser = Parser()
+        parser.set_language(RST)
+        return parser
 
-    def tree(self, bytes):
-        return (
-            self._repr(bytes)
-            + indent("\n" + "\n".join([x.tree(bytes) for x in self.children]), "   ")
-        ).rstrip()
-
-    @property
-    def children(self):
-        if not self._with_whitespace:
-            return [Node(n, _with_whitespace=False) for n in self.node.children]
-
-        self.node.children
-        current_byte = self.start_byte
-        current_point = self.start_point
-        new_nodes = []
-        if self.node.children:
-            for n in self.node.children:
-                if n.start_byte != current_byte:
-                    # value = self.bytes[current_byte:n.start_byte]
-                    # assert value == b' ', (value, b' ', n)
-                    new_nodes.append(
-                        Whitespace(
-                            current_byte, n.start_byte, current_point, n.start_point
-                        )
-                    )
-                current_byte = n.end_byte
-                current_point = n.end_point
-                new_nodes.append(Node(n))
-
-            if current_byte != self.end_byte:
-                new_nodes.append(
-                    Whitespace(
-                        current_byte, self.end_byte, self.start_point, self.end_point
-                    )
-                )
-        return new_nodes
-
-    def _repr(self, bytes):
-        return repr(self.node) + bytes[self.start_byte : self.end_byte].decode()
-
-    def __repr__(self):
-        return f"<ts.Node {self.node.type}>"
-
-    def with_whitespace(self):
-        return Node(self.node, _with_whitespace=True)
-
-    def without_whitespace(self):
-        return Node(self.node, _with_whitespace=False)
-
-    @property
-    def start_point(self):
-        return self.node.start_point
-
-    @property
-    def end_point(self):
-        return self.node.end_point
-
-    @property
-    def start_byte(self):
-        return self.node.start_byte
-
-    @property
-    def end_byte(self):
-        return self.node.end_byte
 
-    @property
-    def type(self):
-        return self.node.type
+def parse_tree(text: bytes) -> Tree:
+    """
+    Parse ``text`` with the parser of the current thread.
+
+    Notes
+    -----
+    Documents are always parsed from scratch, modified documents are not
+    reparsed incrementally through ``Tree.edit``: the external scanner of
+    tree-sitter-rst does not restore its state properly, and incremental
+    parses of edited documents regularly give trees that differ from a full
+    parse, even without syntax errors.
+    """
+    return get_parser().parse(text)
 
-    @property
-    def bytes(self):
-        return self.node.bytes
 
-    def __init__(self, node, *, _with_whitespace=True):
-        self.node = node
-        self._with_whitespace = _with_whitespace
+class Whitespace:
+    """
+    Gap between two children of a tree-sitter node, see `TSVisitor.children`.
 
+    Tree sitter does not represent the whitespace between nodes, this has the
+    same position attributes as tree-sitter nodes, so that it can be visited
+    like them.
+    """
 
-class Whitespace(Node):
-    def __init__(self, byte_start, byte_end, start_point, end_point):
-        self._start_byte = byte_start
-        self._end_byte = byte_end
-        self._end_point = end_point
-        self._start_point = start_point
+    __slots__ = ("start_byte", "end_byte", "start_point", "end_point")
 
-    @property
-    def start_point(self):
-        return self._start_point
+    type = "whitespace"
 
-    @property
-    def end_point(self):
-        return self._end_point
+    def __init__(self, start_byte, end_byte, start_point, end_point):
+        self.start_byte = start_byte
+        self.end_byte = end_byte
+        self.start_point = start_point
+        self.end_point = end_point
 
-    @property
-    def children(self):
-        return []
+    def __repr__(self):
+        return f'<Node kind="whitespace", start_point={self.start_point}, end_point={self.end_point}>'
 
-    @property
-    def start_byte(self):
-        return self._start_byte
 
-    @property
-    def end_byte(self):
-        return self._end_byte
+_dispatch: Dict[type, Dict[str, Callable]] = {}
 
-    def __repr__(self):
-        return f'<Node kind="whitespace", start_point={self.start_point}, end_point={self.end_point}>'
 
-    @property
-    def type(self):
-        return "whitespace"
+def _visitors(cls) -> Dict[str, Callable]:
+    """
+    ``visit_<type>`` methods of a visitor class, by tree-sitter node type.
+    """
+    try:
+        return _dispatch[cls]
+    except KeyError:
+        res = _dispatch[cls] = {
+            name[len("visit_") :]: getattr(cls, name)
+            for name in dir(cls)
+            if name.startswith("visit_")
+        }
+        return res
 
 
 class TSVisitor:
@@ -183,6 +134,8 @@ class TSVisitor:
 
     Walk the tree sitter tree and convert each node into our kind of internal node.
 
+    The children of the nodes are listed with a single TreeCursor, see
+    `children`, and ``visit_<type>`` methods are looked up once per class.
     """
 
     def __init__(self, bytes, root, qa):
@@ -192,13 +145,53 @@ class TSVisitor:
         self.depth = 0
         self._section_levels = {}
         self._targets = []
+        self._cursor = root.walk()
+        # whether `children` includes the whitespace between children, only
+        # in paragraphs, see `visit_paragraph`.
+        self._whitespace = False
+        self._visitors = _visitors(type(self))
+
+    def children(self, node) -> List[Any]:
+        """
+        Children of a tree-sitter node.
+
+        When visiting a paragraph, the gaps between the children are
+        included as `Whitespace` nodes.
+        """
+        cursor = self._cursor
+        cursor.reset(node)
+        if not cursor.goto_first_child():
+            return []
+        acc = [cursor.node]
+        while cursor.goto_next_sibling():
+            acc.append(cursor.node)
+        if not self._whitespace:
+            return acc
+
+        current_byte = node.start_byte
+        current_point = node.start_point
+        new_nodes = []
+        for n in acc:
+            if n.start_byte != current_byte:
+                new_nodes.append(
+                    Whitespace(current_byte, n.start_byte, current_point, n.start_point)
+                )
+            current_byte = n.end_byte
+            current_point = n.end_point
+            new_nodes.append(n)
+        if current_byte != node.end_byte:
+            new_nodes.append(
+                Whitespace(
+                    current_byte, node.end_byte, node.start_point, node.end_point
+                )
+            )
+        return new_nodes
 
     def as_text(self, node):
         return self.bytes[node.start_byte : node.end_byte].decode()
 
     def visit_document(self, node):
-        new_node = node.without_whitespace()
-        items = self.visit(new_node)
+        items = self.visit(node)
         res = [x for x in items if not isinstance(x, Whitespace)]
         return res
 
@@ -259,7 +252,8 @@ class TSVisitor:
         if node.type == "ERROR":
             # print(f'ERROR node: {self.as_text(c)!r}, skipping')
             return []
-        for c in node.children:
+        visitors = self._visitors
+        for c in self.children(node):
             kind = c.type
             if kind == "::":
                 if acc and isinstance(acc[-1], inline_nodes):
@@ -267,12 +261,12 @@ class TSVisitor:
                 # else:
                 #    assert False
                 continue
-            if not hasattr(self, "visit_" + kind):
+            meth = visitors.get(kind)
+            if meth is None:
                 raise ValueError(
                     f"visit_{kind} not found while visiting {node}::\n{self.as_text(c)!r}"
                 )
-            meth = getattr(self, "visit_" + kind)
-            new_children = meth(c, prev_end=prev_end)
+            new_children = meth(self, c, prev_end=prev_end)
             acc.extend(new_children)
             prev_end = c.end_point
         self.depth -= 1
@@ -315,8 +309,9 @@ class TSVisitor:
         return [Directive(_text, None, None)]
 
     def visit_interpreted_text(self, node, prev_end=None):
-        if len(node.children) == 2:
-            role, text = node.children
+        children = self.children(node)
+        if len(children) == 2:
+            role, text = children
             assert role.type == "role"
             assert text.type == "interpreted_text"
             role_value = self.as_text(role)
@@ -329,8 +324,8 @@ class TSVisitor:
                 assert ":" not in role_value
                 assert ":" not in domain
 
-        elif len(node.children) == 1:
-            [text] = node.children
+        elif len(children) == 1:
+            [text] = children
             assert text.type == "interpreted_text"
             domain = None
             role = None
@@ -360,17 +355,13 @@ class TSVisitor:
         return self.visit_text(node)
 
     def visit_text(self, node, prev_end=None):
-        t = MText(self.bytes[node.start_byte : node.end_byte].decode())
-        t.start_byte = node.start_byte
-        t.end_byte = node.end_byte
+        t = _new_text([self.bytes[node.start_byte : node.end_byte].decode()])
         return [t]
 
     def visit_whitespace(self, node, prev_end=None):
         content = self.bytes[node.start_byte : node.end_byte].decode()
         # assert set(content) == {' '}, repr(content)
-        t = MText(" " * len(content))
-        t.start_byte = node.start_byte
-        t.end_byte = node.end_byte
+        t = _new_text([" " * len(content)])
         # print(' '*self.depth*4, t, node.start_byte, node.end_byte)
         return [t]
 
@@ -389,10 +380,11 @@ class TSVisitor:
 
     def visit_bullet_list(self, node, prev_end=None):
         myst_acc = []
-        for list_item in node.children:
+        for list_item in self.children(node):
             assert list_item.type == "list_item"
-            assert len(list_item.children) == 2, list_item.children
-            _bullet, body = list_item.children
+            item_children = self.children(list_item)
+            assert len(item_children) == 2, item_children
+            _bullet, body = item_children
             # assert len(body.children) == 1
             # parg = body.children[0]
             # assert parg.type == "paragraph", parg.type
@@ -402,16 +394,17 @@ class TSVisitor:
     def visit_section(self, node, prev_end=None):
         # print(' '*self.depth*4, '->', node)
         # print(' '*self.depth*4, '::',self.bytes[node.start_byte: node.end_byte].decode())
-        if node.children[0].type == "adornment":
-            assert node.children[1].type == "title"
-            tc = node.children[1]
-            assert node.children[2].type == "adornment"
-            assert len(node.children) == 3
-
-            pre_text = self.as_text(node.children[0])
+        children = self.children(node)
+        if children[0].type == "adornment":
+            assert children[1].type == "title"
+            tc = children[1]
+            assert children[2].type == "adornment"
+            assert len(children) == 3
+
+            pre_text = self.as_text(children[0])
             set_pre_a = set(pre_text)
 
-            post_text = self.as_text(node.children[2])
+            post_text = self.as_text(children[2])
             set_post_a = set(post_text)
 
             assert len(set_pre_a) == 1
@@ -426,12 +419,12 @@ class TSVisitor:
 
             assert len(pre_text) >= len(self.as_text(tc))
         else:
-            assert node.children[0].type == "title"
-            tc = node.children[0]
-            assert node.children[1].type == "adornment"
-            assert len(node.children) == 2
+            assert children[0].type == "title"
+            tc = children[0]
+            assert children[1].type == "adornment"
+            assert len(children) == 2
             pre_a = ""
-            post_text = self.as_text(node.children[1])
+            post_text = self.as_text(children[1])
             set_post_a = set(post_text)
             # this triggers sometime because tree sitter missparse a few things like.
             #
@@ -461,7 +454,11 @@ class TSVisitor:
         return [MBlockquote(self.visit(node))]
 
     def visit_paragraph(self, node, prev_end=None):
-        sub = self.visit(node.with_whitespace())
+        whitespace, self._whitespace = self._whitespace, True
+        try:
+            sub = self.visit(node)
+        finally:
+            self._whitespace = whitespace
         acc = []
         acc2 = []
 
@@ -495,21 +492,22 @@ class TSVisitor:
     def visit_field_list(self, node, prev_end=None) -> List[FieldList]:
         acc = []
 
-        lens = {len(f.children) for f in node.children}
+        fields = [(f, self.children(f)) for f in self.children(node)]
+        lens = {len(children) for _, children in fields}
         if lens == {3}:  # need test here don't know why it was here.
             # we likely have an option list
-            for list_item in node.children:
+            for list_item, children in fields:
                 assert list_item.type == "field"
-                _, name, _ = list_item.children
+                _, name, _ = children
                 # TODO, assert _ and _ are `:`
                 acc.append(self.as_text(name))
             return []
             return [Options(acc)]
 
         elif lens == {4}:
-            for list_item in node.children:
+            for list_item, children in fields:
                 assert list_item.type == "field"
-                _, name, _, body = list_item.children
+                _, name, _, body = children
                 a, b = compress_word(self.visit(name)), compress_word(self.visit(body))
                 # [_.to_json()for _ in a]
                 # [_.to_json() for _ in b]
@@ -521,9 +519,9 @@ class TSVisitor:
 
     def visit_enumerated_list(self, node, prev_end=None):
         myst_acc = []
-        for list_item in node.children:
+        for list_item in self.children(node):
             assert list_item.type == "list_item"
-            _bullet, body = list_item.children
+            _bullet, body = self.children(list_item)
             myst_acc.append(MListItem(False, self.visit(body)))
         return [MList(ordered=True, start=1, spread=False, children=myst_acc)]
 
@@ -531,12 +529,13 @@ class TSVisitor:
         # TODO:
         # raise VisitTargetNotImplementedError()
         # self.as_text(node)
-        if len(node.children) == 2:
-            pp, name = node.children
+        children = self.children(node)
+        if len(children) == 2:
+            pp, name = children
             # breakpoint()
             if pp.type == ".." and name.type == "name":
                 return [Unimplemented("untarget", self.as_text(name))]
-        # print(node.children)
+        # print(children)
         return [Unimplemented("target", self.as_text(node))]
 
     # def visit_arguments(self, node, prev_end=None):
@@ -561,20 +560,21 @@ class TSVisitor:
 
         is_substitution_definition = False
 
-        if len(node.children) == 4:
-            kinds = [n.type for n in node.children]
+        children = self.children(node)
+        if len(children) == 4:
+            kinds = [n.type for n in children]
             if tuple(kinds) == ("type", "::", " ", "body"):
                 is_substitution_definition = True
-                _role, _1, _2, body = node.children
+                _role, _1, _2, body = children
             elif tuple(kinds) == ("..", "type", "::", "body"):
-                _1, _role, _2, body = node.children
+                _1, _role, _2, body = children
             else:
                 assert False
             assert body.type == "body"
             assert _role.type == "type"
-            body_children = body.children
-        elif len(node.children) == 3:
-            _1, _role, _2 = node.children
+            body_children = self.children(body)
+        elif len(children) == 3:
+            _1, _role, _2 = children
             body_children = []
         else:
             raise ValueError
@@ -605,13 +605,14 @@ class TSVisitor:
             options = []
             assert len(p0[1]) == 1
             opt_node = p0[1][0]
-            for field in opt_node.children:
+            for field in self.children(opt_node):
                 assert field.type == "field"
-                if len(field.children) == 4:
-                    c1, name, c2, body = field.children
+                field_children = self.children(field)
+                if len(field_children) == 4:
+                    c1, name, c2, body = field_children
                     options.append((self.as_text(name), self.as_text(body)))
-                elif len(field.children) == 3:
-                    c1, name, c2 = field.children
+                elif len(field_children) == 3:
+                    c1, name, c2 = field_children
                     options.append((self.as_text(name), ""))
                 else:
                     assert False
@@ -648,8 +649,9 @@ class TSVisitor:
         ]
 
     def visit_substitution_definition(self, node, prev_end=None):
-        assert len(node.children) == 3
-        _dotdot, sub, directive = node.children
+        children = self.children(node)
+        assert len(children) == 3
+        _dotdot, sub, directive = children
         assert self.bytes[_dotdot.start_byte : _dotdot.end_byte].decode() == ".."
         assert sub.type == "substitution"
         assert directive.type == "directive"
@@ -688,10 +690,11 @@ class TSVisitor:
 
     def visit_definition_list(self, node, prev_end=None):
         acc = []
-        for list_item in node.children:
+        for list_item in self.children(node):
             assert list_item.type == "list_item"
-            if len(list_item.children) == 2:
-                term, definition = list_item.children
+            item_children = self.children(list_item)
+            if len(item_children) == 2:
+                term, definition = item_children
                 assert term.type == "term"
                 assert definition.type == "definition"
                 _dd = self.visit(definition)
@@ -701,8 +704,8 @@ class TSVisitor:
                         dd=_dd,
                     )
                 )
-            elif len(list_item.children) == 4:
-                term, _, classsifier, definition = list_item.children
+            elif len(item_children) == 4:
+                term, _, classsifier, definition = item_children
                 assert term.type == "term"
                 assert definition.type == "definition"
                 assert classsifier.type == "classifier"
@@ -718,7 +721,7 @@ class TSVisitor:
             else:
                 # TODO
                 return []
-                assert False, list_item.children
+                assert False, item_children
 
         return [DefList(acc)]
 
@@ -742,8 +745,8 @@ def parse(text: bytes, qa=None) -> List[Section]:
     Parse text using Tree sitter RST, and return a list of serialised section I guess ?
     """
 
-    tree = parser.parse(text)
-    root = Node(tree.root_node)
+    tree = parse_tree(text)
+    root = tree.root_node
     tsv = TSVisitor(text, root, qa)
     res = tsv.visit_document(root)
     ns = nest_sections(res)
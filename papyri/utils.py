@@ -1,10 +1,11 @@
 from __future__ import annotations
 
+import sys
 import time
 import typing
 from datetime import timedelta
 from textwrap import dedent
-from typing import Tuple, NewType
+from typing import Optional, Tuple, NewType
 
 from rich.progress import BarColumn, Progress, ProgressColumn, Task, TextColumn
 from rich.text import Text
@@ -87,9 +88,9 @@ def dummy_progress(
     *,
     description="Progress",
     transient=True,
+    total=None,
 ):
-    items = list(iterable)
-    it = iter(items)
+    it = iter(iterable if total is not None else list(iterable))
     now = time.monotonic()
 
     def gen():
@@ -112,8 +113,19 @@ def dummy_progress(
     return gen()
 
 
-def progress(iterable, *, description="Progress", transient=True):
-    items = list(iterable)
+def progress(iterable, *, description="Progress", transient=True, total=None):
+    """
+    Iterate over ``iterable`` with a progress bar.
+
+    The iterable is consumed upfront to know the number of items, unless
+    ``total`` is given; this lets us show the progress of items that are
+    produced over time (e.g. by worker processes).
+    """
+    if total is None:
+        items = list(iterable)
+        total = len(items)
+    else:
+        items = iterable
     p = Progress(
         TextColumn("[progress.description]{task.description:15}", justify="left"),
         BarColumn(bar_width=None),
@@ -122,7 +134,7 @@ def progress(iterable, *, description="Progress", transient=True):
         transient=transient,
     )
     p.start()
-    task = p.add_task(description, total=len(items), ee=0)
+    task = p.add_task(description, total=total, ee=0)
     it = iter(items)
     now = time.monotonic()
 
@@ -159,6 +171,16 @@ def dedent_but_first(text):
     return dedent(a) + "\n" + dedent("\n".join(b))
 
 
+def intern_str(s: Optional[str]) -> Optional[str]:
+    """
+    `sys.intern` that lets None through, for the optional fields of keys and
+    references.
+    """
+    if s is None:
+        return None
+    return sys.intern(s)
+
+
 def pos_to_nl(script: str, pos: int) -> Tuple[int, int]:
     """
     Convert pigments position to Jedi col/line